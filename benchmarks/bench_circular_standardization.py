@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Micro-benchmark of the circular path standardization:
+sorting all rotations (previous implementation) vs. Booth's least rotation (Assembly.get_least_circular_path).
+
+Usage:
+    python benchmarks/bench_circular_standardization.py [num_repeats]
+"""
+
+import os
+import sys
+import random
+import tempfile
+from timeit import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from traversome.Assembly import Assembly
+from traversome.utils import setup_logger
+
+
+def standardize_by_sorting(graph, raw_path):
+    """the previous O(n^2 log n) implementation of Assembly.get_standardized_path_with_strand"""
+    forward_path = list(graph.correct_path_with_palindromic_repeats(raw_path))
+    reverse_path = list(graph.reverse_path(forward_path))
+    bi_paths = [forward_path, reverse_path]
+    for change_start in range(1, len(forward_path)):
+        bi_paths.append(forward_path[change_start:] + forward_path[:change_start])
+        bi_paths.append(reverse_path[change_start:] + reverse_path[:change_start])
+    standard_id = sorted(range(len(bi_paths)), key=lambda x: bi_paths[x])[0]
+    return tuple(bi_paths[standard_id]), standard_id % 2 == 0
+
+
+def make_ring_graph(num_vertices, num_names, gfa_file):
+    """
+    a circular path visiting num_names vertices repeatedly, with random strands, making a ring of num_vertices
+    """
+    random.seed(num_vertices)
+    names = [str(go_n + 1) for go_n in range(num_names)]
+    ring = [(random.choice(names), random.random() < 0.5) for foo in range(num_vertices)]
+    links = {(ring[go_v], ring[(go_v + 1) % num_vertices]) for go_v in range(num_vertices)}
+    with open(gfa_file, "w") as output_h:
+        output_h.write("H\tVN:Z:1.0\n")
+        for v_name in names:
+            output_h.write("S\t{}\t{}\n".format(v_name, "".join(random.choice("ACGT") for foo in range(50))))
+        for (n1, e1), (n2, e2) in links:
+            output_h.write("L\t{}\t{}\t{}\t{}\t0M\n".format(n1, "+-"[not e1], n2, "+-"[not e2]))
+    return ring
+
+
+def main():
+    num_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    setup_logger(loglevel="WARNING")
+    print("{:>8}{:>16}{:>16}{:>10}".format("#vertex", "sorting(s)", "booth(s)", "speedup"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_vertices in (10, 50, 100, 500, 1000, 5000):
+            gfa_file = os.path.join(tmp_dir, "ring.{}.gfa".format(num_vertices))
+            ring = make_ring_graph(num_vertices, num_names=max(num_vertices // 4, 2), gfa_file=gfa_file)
+            graph = Assembly(gfa_file)
+            assert graph.contain_path(ring) and graph.is_circular_path(ring)
+            start = random.randint(0, num_vertices - 1)
+            test_path = ring[start:] + ring[:start]
+            assert standardize_by_sorting(graph, test_path) == \
+                graph.get_standardized_path_with_strand(test_path, detect_circular=True)
+            time_sort = timeit(lambda: standardize_by_sorting(graph, test_path), number=num_repeats) / num_repeats
+            time_booth = timeit(
+                lambda: graph.get_standardized_path_with_strand(test_path, detect_circular=True),
+                number=num_repeats) / num_repeats
+            print("{:>8}{:>16.6f}{:>16.6f}{:>10.1f}".format(num_vertices, time_sort, time_booth, time_sort / time_booth))
+
+
+if __name__ == "__main__":
+    main()
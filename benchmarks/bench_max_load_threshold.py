@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the max load threshold of GraphAlignConflicts:
+Monte Carlo simulation (previous implementation) vs. the exact computation (get_max_load_threshold).
+
+Usage:
+    python benchmarks/bench_max_load_threshold.py [num_simulations]
+"""
+
+import os
+import sys
+from time import time
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from traversome.GraphAlignConflicts import get_max_load_threshold
+from traversome.utils import setup_logger
+
+
+def find_max_load_by_simulation(n_bins, n_balls, alpha, n_simulations):
+    """the previous implementation of GraphAlignConflicts._find_possible_max_load"""
+    max_load_counts = {}
+    for foo in range(n_simulations):
+        bin_counts = np.bincount(np.random.randint(0, n_bins, size=n_balls), minlength=n_bins)
+        max_load = np.max(bin_counts)
+        max_load_counts[max_load] = max_load_counts.get(max_load, 0) + 1
+    most_n_cases = n_simulations * (1 - alpha)
+    accumulated = 0
+    for max_load, counts in sorted(max_load_counts.items()):
+        if accumulated >= most_n_cases:
+            return max_load
+        else:
+            accumulated += counts
+    return max(max_load_counts)
+
+
+def main():
+    n_simulations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    alpha = 0.001
+    setup_logger(loglevel="WARNING")
+    np.random.seed(12345)
+    print("{:>8}{:>9}{:>14}{:>14}{:>14}{:>14}{:>10}".format(
+        "#bins", "#balls", "simulated", "exact", "simulate(s)", "exact(s)", "speedup"))
+    for n_bins, n_balls in ((100, 50), (1000, 500), (1000, 3000), (10000, 2000), (10000, 20000)):
+        time_start = time()
+        simulated = find_max_load_by_simulation(n_bins, n_balls, alpha, n_simulations)
+        time_simulate = time() - time_start
+        time_start = time()
+        exact = get_max_load_threshold(n_bins, n_balls, alpha, table_file=None)
+        time_exact = time() - time_start
+        print("{:>8}{:>9}{:>14}{:>14}{:>14.4f}{:>14.4f}{:>10.1f}".format(
+            n_bins, n_balls, simulated, exact, time_simulate, time_exact, time_simulate / time_exact))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""
+Tests of traversome.Assembly
+"""
+
+import os
+import tempfile
+import unittest
+from traversome.Assembly import Assembly
+from traversome.utils import setup_logger
+
+
+# a circular graph of three contigs with the universal overlap of 4 bp
+UNI_OVERLAP_GFA = "\n".join([
+    "H\tVN:Z:1.0",
+    "S\t1\t" + "AACCGGTA" * 4 + "\tDP:f:20",
+    "S\t2\t" + "TTGACCAG" * 4 + "\tDP:f:20",
+    "S\t3\t" + "GCATTGCA" * 4 + "\tDP:f:20",
+    "L\t1\t+\t2\t+\t4M",
+    "L\t2\t+\t3\t+\t4M",
+    "L\t3\t+\t1\t+\t4M",
+    ""])
+
+
+class TestAssemblyPathCaches(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logger(loglevel="ERROR")
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.graph_file = os.path.join(cls.tmp_dir.name, "uni_overlap.gfa")
+        with open(cls.graph_file, "w") as output_h:
+            output_h.write(UNI_OVERLAP_GFA)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_trim_overlaps_resets_path_caches(self):
+        graph = Assembly(self.graph_file)
+        graph_core = graph.get_graph_core()
+        path_dict = graph.get_path_dictionary()
+        self.assertEqual(graph_core.lengths.tolist(), [32, 32, 32])
+        self.assertEqual(graph_core.overlaps.tolist(), [4] * 6)
+        self.assertTrue(graph.trim_overlaps())
+        new_core = graph.get_graph_core()
+        self.assertIsNot(new_core, graph_core)
+        self.assertIsNot(graph.get_path_dictionary(), path_dict)
+        self.assertEqual(new_core.lengths.tolist(), [28, 28, 28])
+        self.assertEqual(new_core.overlaps.tolist(), [0] * 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
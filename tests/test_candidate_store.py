@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Tests of traversome.CandidateStore, including the replay after a crash in the middle of a write
+"""
+
+import os
+import tempfile
+import unittest
+from traversome.CandidateStore import CandidateStore
+from traversome.utils import setup_logger
+
+
+VARIANT_1 = (("1", True), ("2", False), ("3", True))
+VARIANT_2 = (("1", True), ("3", False))
+VARIANT_3 = (("edge_4", False),)
+
+
+class TestCandidateStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logger(loglevel="ERROR")
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store_file = os.path.join(self.tmp_dir.name, "candidates.bin")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_two_variants(self):
+        """
+        :return: size of the log after the records of the first variant
+        """
+        store = CandidateStore(self.store_file)
+        store.append_variant(1, VARIANT_1, 1)
+        store.append_count(1, 3)
+        store.close()
+        valid_size = os.path.getsize(self.store_file)
+        store.append_variant(2, VARIANT_2, 1)
+        store.close()
+        return valid_size
+
+    def test_replay(self):
+        self.write_two_variants()
+        store = CandidateStore(self.store_file)
+        store.append_count(2, 5)
+        store.close()
+        variants, variants_counts = CandidateStore(self.store_file).load()
+        self.assertEqual(variants, [VARIANT_1, VARIANT_2])
+        self.assertEqual(variants_counts, {VARIANT_1: 3, VARIANT_2: 5})
+
+    def test_missing_log(self):
+        self.assertEqual(CandidateStore(self.store_file).load(), ([], {}))
+
+    def check_damaged_tail(self, valid_size):
+        store = CandidateStore(self.store_file)
+        variants, variants_counts = store.load()
+        self.assertEqual(variants, [VARIANT_1])
+        self.assertEqual(variants_counts, {VARIANT_1: 3})
+        # the damaged tail is truncated, and new records follow the valid ones
+        self.assertEqual(os.path.getsize(self.store_file), valid_size)
+        store.append_variant(2, VARIANT_3, 2)
+        store.close()
+        variants, variants_counts = CandidateStore(self.store_file).load()
+        self.assertEqual(variants, [VARIANT_1, VARIANT_3])
+        self.assertEqual(variants_counts, {VARIANT_1: 3, VARIANT_3: 2})
+
+    def test_truncated_last_record(self):
+        valid_size = self.write_two_variants()
+        for cut_size in (os.path.getsize(self.store_file) - 1, valid_size + 2):
+            with open(self.store_file, "r+b") as output_h:
+                output_h.truncate(cut_size)
+        self.check_damaged_tail(valid_size)
+
+    def test_corrupted_last_record(self):
+        valid_size = self.write_two_variants()
+        with open(self.store_file, "r+b") as output_h:
+            output_h.seek(-2, os.SEEK_END)
+            last_byte = output_h.read(1)
+            output_h.seek(-2, os.SEEK_END)
+            output_h.write(bytes([last_byte[0] ^ 0xFF]))
+        self.check_damaged_tail(valid_size)
+
+    def test_convert_legacy(self):
+        for var_id, (variant, count) in enumerate(((VARIANT_1, 3), (VARIANT_2, 1)), 1):
+            with open(os.path.join(self.tmp_dir.name, f"sid.{var_id}.tuple"), "w") as output_t:
+                output_t.write(str(variant))
+            with open(os.path.join(self.tmp_dir.name, f"sid.{var_id}.count"), "w") as output_i:
+                output_i.write(str(count))
+        store = CandidateStore(self.store_file)
+        self.assertEqual(store.convert_legacy(self.tmp_dir.name), 2)
+        store.close()
+        self.assertEqual(CandidateStore(self.store_file).load(), ([VARIANT_1, VARIANT_2], {VARIANT_1: 3, VARIANT_2: 1}))
+        # converted only once
+        self.assertEqual(CandidateStore(self.store_file).convert_legacy(self.tmp_dir.name), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Tests of the exact max load threshold of traversome.GraphAlignConflicts against brute-force enumeration
+"""
+
+import os
+import math
+import tempfile
+import unittest
+from itertools import product
+from unittest import mock
+import numpy as np
+from traversome import GraphAlignConflicts as gac
+
+
+def brute_force_max_load_dist(n_bins, n_balls):
+    """
+    :return: list of the probabilities of the max load being 0, 1, .., n_balls
+    """
+    max_load_counts = [0] * (n_balls + 1)
+    for assignment in product(range(n_bins), repeat=n_balls):
+        bin_counts = np.bincount(np.array(assignment, dtype=np.int64), minlength=n_bins)
+        max_load_counts[int(bin_counts.max()) if n_balls else 0] += 1
+    return [count / n_bins ** n_balls for count in max_load_counts]
+
+
+def brute_force_threshold(n_bins, n_balls, alpha):
+    """smallest load m >= 1 that the max load reaches with probability <= alpha"""
+    max_load_dist = brute_force_max_load_dist(n_bins, n_balls)
+    for max_load in range(1, n_balls + 2):
+        if sum(max_load_dist[max_load:]) <= alpha + 1e-12:
+            return max_load
+
+
+class TestMaxLoadThreshold(unittest.TestCase):
+
+    def setUp(self):
+        # isolate the in-memory memo of each test
+        self.memo_patch = mock.patch.multiple(gac, _max_load_thresholds={}, _max_load_table_loaded=set())
+        self.memo_patch.start()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.memo_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_log_prob_max_load_within(self):
+        for n_bins in range(1, 5):
+            for n_balls in range(0, 7):
+                max_load_dist = brute_force_max_load_dist(n_bins, n_balls)
+                for max_load in range(0, n_balls + 2):
+                    expected = sum(max_load_dist[:max_load + 1])
+                    observed = math.exp(gac.log_prob_max_load_within(n_bins, n_balls, max_load))
+                    self.assertAlmostEqual(observed, expected, places=9, msg=(n_bins, n_balls, max_load))
+
+    def test_log_prob_edge_cases(self):
+        # a single bin holds all balls
+        self.assertAlmostEqual(gac.log_prob_max_load_within(1, 5, 5), 0., places=12)
+        self.assertEqual(gac.log_prob_max_load_within(1, 5, 4), -np.inf)
+        # zero load is only possible without balls
+        self.assertAlmostEqual(gac.log_prob_max_load_within(3, 0, 0), 0., places=12)
+        self.assertEqual(gac.log_prob_max_load_within(3, 2, 0), -np.inf)
+
+    def test_threshold(self):
+        for alpha in (0.001, 0.05, 0.3):
+            for n_bins in range(1, 5):
+                for n_balls in range(0, 7):
+                    self.assertEqual(
+                        gac.get_max_load_threshold(n_bins, n_balls, alpha, table_file=None),
+                        brute_force_threshold(n_bins, n_balls, alpha),
+                        msg=(n_bins, n_balls, alpha))
+
+    def test_threshold_edge_cases(self):
+        self.assertEqual(gac.get_max_load_threshold(1, 5, 0.001, table_file=None), 6)
+        self.assertEqual(gac.get_max_load_threshold(10, 0, 0.001, table_file=None), 1)
+        self.assertEqual(gac.get_max_load_threshold(1, 0, 0.001, table_file=None), 1)
+
+    def test_persistent_table(self):
+        table_file = os.path.join(self.tmp_dir.name, "sub_dir", "max_load_thresholds.tab")
+        threshold = gac.get_max_load_threshold(4, 6, 0.05, table_file=table_file)
+        with open(table_file) as input_h:
+            self.assertEqual(input_h.read(), f"4\t6\t0.05\t{threshold}\n")
+        # a new process loads the thresholds from the table instead of computing them
+        with mock.patch.multiple(gac, _max_load_thresholds={}, _max_load_table_loaded=set()):
+            with open(table_file, "w") as output_h:
+                output_h.write("4\t6\t0.05\t100\n")
+            self.assertEqual(gac.get_max_load_threshold(4, 6, 0.05, table_file=table_file), 100)
+
+    def test_table_file_from_environment(self):
+        table_file = os.path.join(self.tmp_dir.name, "env.tab")
+        with mock.patch.dict(os.environ, {gac.MAX_LOAD_TABLE_ENV: table_file}):
+            self.assertEqual(gac.get_max_load_table_file(), table_file)
+            gac.get_max_load_threshold(3, 4, 0.05)
+        self.assertTrue(os.path.isfile(table_file))
+        with mock.patch.dict(os.environ, {gac.MAX_LOAD_TABLE_ENV: ""}):
+            self.assertIsNone(gac.get_max_load_table_file())
+
+
+if __name__ == "__main__":
+    unittest.main()
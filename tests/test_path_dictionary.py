@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""
+Tests of traversome.PathDictionary against the path standardization of Assembly
+"""
+
+import os
+import itertools
+import tempfile
+import unittest
+from traversome.Assembly import Assembly
+from traversome.utils import setup_logger
+
+
+# vertex 10 is a reverse-complement palindrome connected to itself (10+ -> 10-),
+# whose strand is always corrected into True,
+# so that the standardized form of a standardized path is not necessarily itself
+PALINDROMIC_GFA = "\n".join([
+    "H\tVN:Z:1.0",
+    "S\t1\t" + "AACCGGTA" * 8 + "\tDP:f:20",
+    "S\t2\t" + "TTGACCAG" * 8 + "\tDP:f:20",
+    "S\t4\t" + "GCATTGCA" * 8 + "\tDP:f:20",
+    "S\t10\t" + "ACGT" * 16 + "\tDP:f:40",
+    "L\t10\t+\t4\t+\t5M",
+    "L\t10\t-\t4\t-\t5M",
+    "L\t1\t-\t10\t+\t5M",
+    "L\t2\t-\t10\t+\t0M",
+    "L\t10\t+\t10\t-\t20M",
+    ""])
+
+
+class TestPathDictionaryPalindromic(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logger(loglevel="ERROR")
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.graph_file = os.path.join(cls.tmp_dir.name, "palindromic.gfa")
+        with open(cls.graph_file, "w") as output_h:
+            output_h.write(PALINDROMIC_GFA)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def get_paths(self, graph, max_len=3):
+        oriented = [(v_name, v_end) for v_name in sorted(graph.vertex_info) for v_end in (True, False)]
+        for path_len in range(1, max_len + 1):
+            for input_path in itertools.product(oriented, repeat=path_len):
+                yield tuple(input_path)
+
+    def test_palindromic_repeat_detected(self):
+        graph = Assembly(self.graph_file)
+        graph.get_path_dictionary()
+        self.assertEqual(graph.palindromic_repeats, {"10"})
+
+    def test_standardized_ids_in_any_query_order(self):
+        for reverse_order in (False, True):
+            graph = Assembly(self.graph_file)
+            path_dict = graph.get_path_dictionary()
+            all_paths = list(self.get_paths(graph))
+            if reverse_order:
+                all_paths.reverse()
+            # query the standardized forms before the raw paths, which used to poison the cache
+            for input_path in all_paths:
+                path_dict.standardized_circ_id(path_dict.get_id(graph.get_standardized_path_circ(input_path)))
+                path_dict.standardized_id(path_dict.get_id(graph.get_standardized_path(input_path)))
+            for input_path in all_paths:
+                path_id = path_dict.get_id(input_path)
+                self.assertEqual(
+                    path_dict.get_path(path_dict.standardized_circ_id(path_id)),
+                    graph.get_standardized_path_circ(input_path), input_path)
+                self.assertEqual(
+                    path_dict.get_path(path_dict.standardized_id(path_id)),
+                    graph.get_standardized_path(input_path), input_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
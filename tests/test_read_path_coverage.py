@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+"""
+Tests of traversome.utils.ReadPathCoverageTracker
+"""
+
+import unittest
+from traversome.utils import ReadPathCoverageTracker
+
+
+class SelfSubPathsGenerator(object):
+    """each variant only contains itself as a sub-path, so that variant x covers read path x"""
+    @staticmethod
+    def gen_subpaths(variant_path):
+        yield variant_path
+
+
+class TestReadPathCoverageTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = ReadPathCoverageTracker(
+            read_paths=["a", "b", "c"],
+            read_paths_counter={"a": 1, "b": 2, "c": 3},
+            subpath_generator=SelfSubPathsGenerator())
+
+    def test_add_variants_incrementally(self):
+        variants = ["a"]
+        self.tracker.add_variants(variants)
+        self.assertEqual(self.tracker.get_uncovered_read_paths(), ["b", "c"])
+        self.assertAlmostEqual(self.tracker.get_uncovered_ratio(), 5 / 6)
+        variants.append("b")
+        self.tracker.add_variants(variants)
+        self.tracker.add_variants(variants)
+        self.assertEqual(self.tracker.get_uncovered_read_paths(), ["c"])
+        self.assertEqual(self.tracker.num_uncovered, 1)
+        self.assertEqual(self.tracker.uncovered_weight, 3)
+
+    def test_resumed_variants_added_after_new_ones(self):
+        # variants a and b were loaded from a previous run, and c was found by the resumed search
+        variants = ["a", "b"]
+        variants.append("c")
+        self.tracker.add_variant("c")
+        self.tracker.add_variants(variants)
+        self.assertEqual(self.tracker.get_uncovered_read_paths(), [])
+        self.assertEqual(self.tracker.num_uncovered, 0)
+        self.assertEqual(self.tracker.get_uncovered_ratio(), 0.)
+
+
+if __name__ == "__main__":
+    unittest.main()
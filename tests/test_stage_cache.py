@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Tests of the stage cache of traversome.Traversome
+"""
+
+import os
+import tempfile
+import unittest
+from traversome.traversome import Traversome
+from traversome.StageCache import StageCache
+
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.graph_file = os.path.join(self.tmp_dir.name, "graph.gfa")
+        self.alignment_file = os.path.join(self.tmp_dir.name, "alignment.gaf")
+        with open(self.graph_file, "w") as output_h:
+            output_h.write("H\tVN:Z:1.0\nS\t1\tACGTACGT\n")
+        with open(self.alignment_file, "w") as output_h:
+            output_h.write("read_1\t8\t0\t8\t+\t>1\t8\t0\t8\t8\t8\t60\n")
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        self.stages_run = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_stages(self, **kwargs):
+        """
+        run the digest and variants stages with placeholder stage functions through the stage cache
+        :return: names of the stages actually run
+        """
+        traverser = Traversome(
+            graph=self.graph_file,
+            alignment=self.alignment_file,
+            reads_file=None,
+            outdir=self.tmp_dir.name,
+            stage_cache_dir=self.cache_dir,
+            loglevel="ERROR",
+            **kwargs)
+        self.stages_run = []
+
+        def stage_func(stage, attributes):
+            def run_stage():
+                self.stages_run.append(stage)
+                for attr in attributes:
+                    setattr(traverser, attr, (stage, attr))
+            return run_stage
+
+        run_stage = traverser._Traversome__run_stage
+        digest_key = run_stage(
+            stage="digest",
+            upstream_key=None,
+            stage_func=stage_func("digest", Traversome.DIGEST_ATTRIBUTES),
+            attributes=Traversome.DIGEST_ATTRIBUTES)
+        run_stage(
+            stage="variants",
+            upstream_key=digest_key,
+            stage_func=stage_func("variants", Traversome.VARIANTS_ATTRIBUTES),
+            attributes=Traversome.VARIANTS_ATTRIBUTES,
+            keep_random_state=True)
+        for attr in Traversome.DIGEST_ATTRIBUTES:
+            self.assertEqual(getattr(traverser, attr), ("digest", attr))
+        for attr in Traversome.VARIANTS_ATTRIBUTES:
+            self.assertEqual(getattr(traverser, attr), ("variants", attr))
+        return self.stages_run
+
+    def test_rerun_loads_all_stages(self):
+        self.assertEqual(self.run_stages(), ["digest", "variants"])
+        self.assertEqual(self.run_stages(), [])
+
+    def test_downstream_option_keeps_upstream_stage(self):
+        self.run_stages(max_valid_search=1000)
+        self.assertEqual(self.run_stages(max_valid_search=2000), ["variants"])
+        self.assertEqual(self.run_stages(max_valid_search=1000), [])
+
+    def test_upstream_option_invalidates_downstream_stages(self):
+        self.run_stages(quality_control_alignment_cov=250.)
+        self.assertEqual(self.run_stages(quality_control_alignment_cov=100.), ["digest", "variants"])
+        self.assertEqual(self.run_stages(min_alignment_len_cutoff=1000), ["digest", "variants"])
+
+    def test_input_file_content_invalidates_stages(self):
+        self.run_stages()
+        with open(self.alignment_file, "a") as output_h:
+            output_h.write("read_2\t8\t0\t8\t+\t>1\t8\t0\t8\t8\t8\t60\n")
+        self.assertEqual(self.run_stages(), ["digest", "variants"])
+
+    def test_damaged_cache_is_ignored(self):
+        cache = StageCache(self.cache_dir)
+        key = cache.get_key("digest", None, {"option": 1})
+        cache.dump("digest", key, {"graph": 1})
+        self.assertEqual(cache.load("digest", key), {"graph": 1})
+        with open(os.path.join(self.cache_dir, f"digest.{key}.pkl"), "wb") as output_h:
+            output_h.write(b"damaged")
+        self.assertIsNone(cache.load("digest", key))
+
+
+if __name__ == "__main__":
+    unittest.main()
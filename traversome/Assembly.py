@@ -11,6 +11,9 @@ from collections import OrderedDict
 from loguru import logger
 from typing import Union
 from traversome.AssemblySimple import AssemblySimple, Vertex  #, VertexMergingHistory, VertexEditHistory
+from traversome.PathDictionary import PathDictionary
+from traversome.PathLengths import PathLengths
+from traversome.GraphCore import GraphCore
 # from traversome.PathGeneratorGraphOnly import PathGeneratorGraphOnly
 # from traversome.VariantGenerator import VariantGenerator
 # from traversome.EstMultiplicityFromCov import EstMultiplicityFromCov
@@ -21,6 +24,7 @@ from traversome.utils import (
     INF, 
     get_orf_lengths, 
     generate_clusters_from_connections,
+    find_least_rotation,
     # smart_trans_for_sort,
 )
 
@@ -63,6 +67,9 @@ class Assembly(AssemblySimple):
         self.__palindromic_repeat_detected = False
         self.__record_reversed_paths_to_mem = record_reversed_paths
         self.__reverse_paths = {}
+        self.__path_dictionary = None
+        self.__path_lengths = None
+        self.__graph_core = None
 
         # summarize init
         # logger.debug("init graph: self.vertex_clusters={}".format(self.vertex_clusters))
@@ -292,6 +299,7 @@ class Assembly(AssemblySimple):
         
         # reset irv to empty dict
         self.__inverted_repeat_vertex = {}
+        self.__reset_path_caches()
 
     def detect_parallel_vertices(self, limited_vertices=None):
         """
@@ -392,6 +400,7 @@ class Assembly(AssemblySimple):
             self.vertex_info[v_name].cov *= depth_factors[0]
             raw_translator[v_name] = v_name
         duplicated_vertices_groups.insert(0, raw_translator)
+        self.__reset_path_caches()
         return duplicated_vertices_groups
 
     def is_no_leaking_path(self, path, terminal_pairs):
@@ -606,6 +615,7 @@ class Assembly(AssemblySimple):
         if merged:
             # update the clusters
             self.update_vertex_clusters()
+            self.__reset_path_caches()
 
         # return boolean of whether anything was merged.
         return merged
@@ -615,6 +625,7 @@ class Assembly(AssemblySimple):
             self.__palindromic_repeat_detected = True
             return True
         else:
+            self.__reset_path_caches()
             self.palindromic_repeats = set()
             find_palindromic_repeats = False
             for vertex_n in self.vertex_info:
@@ -999,27 +1010,20 @@ class Assembly(AssemblySimple):
             len(graph_set), len(path_set), sorted(set(self.vertex_info) - set([_n_ for _n_, _e_ in input_path]))))
         return graph_set == path_set
 
-    # TODO can be cached
     def get_path_length(self, input_path, check_valid=True, adjust_for_cyclic=False):
         # uni_overlap = self.__uni_overlap if self.__uni_overlap else 0
         # circular_len = sum([self.vertex_info[name].len - uni_overlap for name, strand in input_path])
         # return circular_len + uni_overlap * int(self.is_circular_path(input_path))
         if check_valid:
             assert self.contain_path(input_path), str(input_path) + " not found in the graph!"
-        accumulated_lens = []
-        for (_n1, _e1), (_n2, _e2) in zip(input_path[:-1], input_path[1:]):
-            v1_info = self.vertex_info[_n1]
-            accumulated_lens.append(v1_info.len - v1_info.connections[_e1][(_n2, not _e2)])
-        last_n, last_e = input_path[-1]
-        last_v_info = self.vertex_info[last_n]
-        if adjust_for_cyclic and self.is_circular_path(input_path):
-            # remove the uni_overlap between the last and the first
-            first_n, first_e = input_path[0]
-            return sum(accumulated_lens) + last_v_info.len - last_v_info.connections[last_e][(first_n, not first_e)]
-        else:
-            return sum(accumulated_lens) + last_v_info.len
+        return self.get_path_lengths().get_path_length(input_path, adjust_for_cyclic=adjust_for_cyclic)
+
+    def get_sub_path_length(self, input_path, from_id, to_id):
+        """
+        :return: the length of input_path[from_id: to_id], in O(1) after the first query of input_path
+        """
+        return self.get_path_lengths().get_sub_path_length(input_path, from_id, to_id)
 
-    # TODO can be cached
     def get_path_internal_length(self, input_path, keep_terminal_overlaps=True) -> int:
         """
 
@@ -1032,18 +1036,8 @@ class Assembly(AssemblySimple):
         It        --------------------
         I            --------------
         """
-        if len(input_path) < 3:
-            return 0
-        else:
-            if keep_terminal_overlaps:
-                ovl_list = [self.vertex_info[_n1].connections[_e1][(_n2, not _e2)]
-                            for (_n1, _e1), (_n2, _e2) in zip(input_path[1:-2], input_path[2:-1])]
-            else:
-                ovl_list = [self.vertex_info[_n1].connections[_e1][(_n2, not _e2)]
-                            for (_n1, _e1), (_n2, _e2) in zip(input_path[:-1], input_path[1:])]
-            inter_ls = [self.vertex_info[_n1].len
-                        for (_n1, _e1) in input_path[1:-1]]
-            return max(sum(inter_ls) - sum(ovl_list), 0)
+        return self.get_path_lengths().get_path_internal_length(
+            input_path, keep_terminal_overlaps=keep_terminal_overlaps)
         # uni_overlap = self.__uni_overlap if self.__uni_overlap else 0
         # internal_len = -uni_overlap
         # for seg_name, seg_strand in input_path[1:-1]:
@@ -1105,6 +1099,40 @@ class Assembly(AssemblySimple):
     def export_path(self, in_path, check_valid=True):
         return Sequence(self.repr_path(in_path), self.export_path_seq_str(in_path, check_valid=check_valid))
 
+    def get_path_dictionary(self):
+        """
+        :return: the PathDictionary shared by all stages using this graph, rebuilt after the graph is modified
+        """
+        if self.__path_dictionary is None:
+            # palindromic repeats affect the reverse and standardized paths
+            if not self.__palindromic_repeat_detected:
+                self.detect_palindromic_repeats()
+            self.__path_dictionary = PathDictionary(graph=self)
+        return self.__path_dictionary
+
+    def get_path_lengths(self):
+        """
+        :return: the PathLengths cache shared by all stages using this graph, rebuilt after the graph is modified
+        """
+        if self.__path_lengths is None:
+            self.__path_lengths = PathLengths(graph=self)
+        return self.__path_lengths
+
+    def get_graph_core(self):
+        """
+        :return: the GraphCore snapshot of the current topology, rebuilt after the graph is modified.
+            Call it after the graph preprocessing, as the snapshot does not follow in-place edits of vertex_info.
+        """
+        if self.__graph_core is None:
+            self.__graph_core = GraphCore(graph=self)
+        return self.__graph_core
+
+    def __reset_path_caches(self):
+        self.__reverse_paths = {}
+        self.__path_dictionary = None
+        self.__path_lengths = None
+        self.__graph_core = None
+
     def reverse_path(self, raw_path):
         tuple_path = tuple(raw_path)
         if tuple_path in self.__reverse_paths:
@@ -1183,7 +1211,6 @@ class Assembly(AssemblySimple):
 
     def get_standardized_path_circ(self, raw_path):
         """
-        #TODO speed up
         standardized for comparing and identify unique path, accounting for circular cases
         :param raw_path: path=[(name1:str, direction1:bool), (name2:str, direction2:bool), ..]
         :return: standardized_path
@@ -1192,12 +1219,8 @@ class Assembly(AssemblySimple):
         reverse_path = list(self.reverse_path(forward_path))
 
         if self.is_circular_path(forward_path):
-            # if path is circular, try all start points
-            bi_paths = [forward_path, reverse_path]
-            for change_start in range(1, len(forward_path)):
-                bi_paths.append(forward_path[change_start:] + forward_path[:change_start])
-                bi_paths.append(reverse_path[change_start:] + reverse_path[:change_start])
-            return tuple(sorted(bi_paths)[0])
+            # if path is circular, the least among all start points
+            return self.get_least_circular_path(forward_path, reverse_path)[0]
         else:
             return tuple(sorted([forward_path, reverse_path])[0])
 
@@ -1212,17 +1235,33 @@ class Assembly(AssemblySimple):
         reverse_path = list(self.reverse_path(forward_path))
 
         if detect_circular and self.is_circular_path(forward_path):
-            # if path is circular, try all start points
-            bi_paths = [forward_path, reverse_path]
-            for change_start in range(1, len(forward_path)):
-                bi_paths.append(forward_path[change_start:] + forward_path[:change_start])
-                bi_paths.append(reverse_path[change_start:] + reverse_path[:change_start])
-            standard_id = sorted(range(len(bi_paths)), key=lambda x: bi_paths[x])[0]
-            return tuple(bi_paths[standard_id]), standard_id % 2 == 0
+            # if path is circular, the least among all start points
+            return self.get_least_circular_path(forward_path, reverse_path)
         else:
             standard_id = sorted([0, 1], key=lambda x: [forward_path, reverse_path][x])[0]
             return tuple([forward_path, reverse_path][standard_id]), standard_id == 0
 
+    @staticmethod
+    def get_least_circular_path(forward_path, reverse_path):
+        """
+        Find the least path among all start points of both strands of a circular path in linear time,
+        equivalent to sorting all rotations of forward_path and reverse_path.
+        :param forward_path: path=[(name1:str, direction1:bool), (name2:str, direction2:bool), ..]
+        :param reverse_path: reverse of forward_path
+        :return: standardized_path, strand_of_the_new_path
+        """
+        forward_start = find_least_rotation(forward_path)
+        reverse_start = find_least_rotation(reverse_path)
+        forward_least = tuple(forward_path[forward_start:]) + tuple(forward_path[:forward_start])
+        reverse_least = tuple(reverse_path[reverse_start:]) + tuple(reverse_path[:reverse_start])
+        if forward_least < reverse_least:
+            return forward_least, True
+        elif reverse_least < forward_least:
+            return reverse_least, False
+        else:
+            # the forward strand goes first when the start points tie, as in the sorted rotations
+            return forward_least, forward_start <= reverse_start
+
     def get_standardized_variant(self, v_raw_paths):
         """
         standardized for comparing and identify unique variant, similar to self.get_standardized_path()
@@ -1253,11 +1292,7 @@ class Assembly(AssemblySimple):
             # ...
             if self.is_circular_path(part_path):
                 # circular
-                this_part_derived = [part_path, rev_part]
-                for change_start in range(1, len(part_path)):
-                    this_part_derived.append(part_path[change_start:] + part_path[:change_start])
-                    this_part_derived.append(rev_part[change_start:] + rev_part[:change_start])
-                standard_part = tuple(sorted(this_part_derived)[0])
+                standard_part = self.get_least_circular_path(part_path, rev_part)[0]
             else:
                 standard_part = tuple(sorted([part_path, rev_part])[0])
 
@@ -1465,6 +1500,8 @@ class Assembly(AssemblySimple):
                     for next_v, next_e in v_info.connections[this_end]:
                         self.vertex_info[v_name].connections[this_end][(next_v, next_e)] = 0
             self.__uni_overlap = 0
+            # the lengths and the overlaps were changed
+            self.__reset_path_caches()
             return True
         else:
             # TODO
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""
+Append-only binary checkpoint of the candidate variants generated by heuristic search
+"""
+
+import os
+import ast
+import struct
+import zlib
+from loguru import logger
+
+
+class CandidateStore(object):
+    """
+    A single append-only log of the generated variants and their counts, for resuming a heuristic search.
+
+    Each record is the crc32 of the rest of the record, a fixed header (payload_len, var_id, count) and the payload.
+    A record with a payload adds the variant var_id (1-based, in the order of generation) with its path and count;
+    a record without payload updates the count of an existing variant.
+    The path payload is the vertex names with strand signs (+/-) joined by tabs, which cannot appear in GFA names.
+    Each record is written with a single os.write to a file opened in append mode,
+    so that records of concurrent writers are never interleaved.
+    On loading, the log is replayed sequentially until the first incomplete or corrupted record,
+    e.g. written when the program crashed, and that tail is truncated so that new records follow valid ones.
+    """
+    CRC = struct.Struct("<I")
+    HEADER = struct.Struct("<Iiq")
+
+    def __init__(self, store_file):
+        """
+        :param store_file: path of the log file
+        """
+        self.store_file = str(store_file)
+        self.__fd = None
+
+    @staticmethod
+    def encode_path(input_path):
+        return "\t".join([v_name + ("-", "+")[v_end] for v_name, v_end in input_path]).encode("utf-8")
+
+    @staticmethod
+    def decode_path(payload):
+        return tuple([(v_str[:-1], v_str[-1] == "+") for v_str in payload.decode("utf-8").split("\t")])
+
+    def __append(self, var_id, count, payload=b""):
+        if self.__fd is None:
+            self.__fd = os.open(self.store_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        body = self.HEADER.pack(len(payload), var_id, count) + payload
+        os.write(self.__fd, self.CRC.pack(zlib.crc32(body)) + body)
+
+    def append_variant(self, var_id, variant_path, count):
+        self.__append(var_id, count, self.encode_path(variant_path))
+
+    def append_count(self, var_id, count):
+        self.__append(var_id, count)
+
+    def load(self):
+        """
+        :return: variants (list of paths), variants_counts (dict of path -> count)
+        """
+        variants = []
+        variants_counts = {}
+        if not os.path.isfile(self.store_file):
+            return variants, variants_counts
+        with open(self.store_file, "rb") as input_h:
+            data = input_h.read()
+        header_size = self.CRC.size + self.HEADER.size
+        go_b = 0
+        while go_b + header_size <= len(data):
+            crc, = self.CRC.unpack_from(data, go_b)
+            payload_len, var_id, count = self.HEADER.unpack_from(data, go_b + self.CRC.size)
+            record_end = go_b + header_size + payload_len
+            if record_end > len(data) or zlib.crc32(data[go_b + self.CRC.size: record_end]) != crc:
+                break
+            if payload_len:
+                if var_id != len(variants) + 1:
+                    break
+                this_variant = self.decode_path(data[go_b + header_size: record_end])
+                variants.append(this_variant)
+                variants_counts[this_variant] = count
+            elif 1 <= var_id <= len(variants):
+                variants_counts[variants[var_id - 1]] = count
+            else:
+                break
+            go_b = record_end
+        if go_b < len(data):
+            logger.warning("Discarding {} bytes of incomplete records from {}".format(len(data) - go_b, self.store_file))
+            with open(self.store_file, "r+b") as output_h:
+                output_h.truncate(go_b)
+        return variants, variants_counts
+
+    def convert_legacy(self, legacy_dir):
+        """
+        Convert the checkpoint of previous versions, a pair of text files sid.{var_id}.tuple and sid.{var_id}.count
+        per variant in legacy_dir, into a new log. Nothing is done if the log already exists.
+        :param legacy_dir: directory of the checkpoint of previous versions
+        :return: number of variants converted
+        """
+        if os.path.exists(self.store_file):
+            return 0
+        num_legacy = len([f_ for f_ in os.listdir(legacy_dir) if f_.startswith("sid.") and f_.endswith(".tuple")])
+        var_id = 1
+        while var_id <= num_legacy:
+            tuple_f = os.path.join(legacy_dir, f"sid.{var_id}.tuple")
+            count_f = os.path.join(legacy_dir, f"sid.{var_id}.count")
+            try:
+                with open(tuple_f) as input_r, open(count_f) as input_i:
+                    this_variant = tuple([tuple(v_e) for v_e in ast.literal_eval(input_r.read())])
+                    this_count = int(input_i.read())
+            except (OSError, ValueError, SyntaxError) as e:
+                logger.warning(f"Ignoring the legacy checkpoint from variant {var_id} on: {e}")
+                break
+            self.append_variant(var_id, this_variant, this_count)
+            var_id += 1
+        return var_id - 1
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
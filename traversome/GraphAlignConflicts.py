@@ -2,14 +2,114 @@
 """
 Class objects for detecting conflicts between assembly graph and graph alignment
 """
+import os
 import math
 import numpy as np
 from loguru import logger
 from collections import OrderedDict
 import numpy as np
+from scipy.signal import fftconvolve
+from scipy.stats import binom, poisson
 from traversome.utils import GaussianMixtureModel
 
 
+# environment variable of the path of the persistent max load table, an empty value disables the persistence
+MAX_LOAD_TABLE_ENV = "TRAVERSOME_MAX_LOAD_TABLE"
+# (n_bins, n_balls, alpha) -> max load threshold, loaded from the persistent table on the first call
+_max_load_thresholds = {}
+_max_load_table_loaded = set()
+
+
+def get_max_load_table_file():
+    """
+    :return: path of the persistent table of the max load thresholds computed by previous runs,
+        given by the environment variable TRAVERSOME_MAX_LOAD_TABLE (None if it is empty),
+        or under the user cache directory by default
+    """
+    if MAX_LOAD_TABLE_ENV in os.environ:
+        return os.environ[MAX_LOAD_TABLE_ENV] or None
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+        "traversome", "max_load_thresholds.tab")
+
+
+def log_prob_max_load_within(n_bins, n_balls, max_load):
+    """
+    Exact log probability that no bin holds more than max_load balls after throwing n_balls into n_bins uniformly.
+
+    By Poissonization, the bin counts are independent Poisson(n_balls/n_bins) conditioned on summing to n_balls, so
+    P(max <= q) = P(Poisson <= q)^n_bins * P(S = n_balls) / P(Poisson(n_balls) = n_balls),
+    where S is the sum of n_bins independent Poisson(n_balls/n_bins) variables truncated to [0, q],
+    whose distribution is the n_bins-th convolution power of the truncated pmf, computed by squaring with FFT.
+    The convolutions are truncated at n_balls, which makes the cost O(n_balls log(n_balls) log(n_bins)).
+    """
+    if n_bins * max_load < n_balls:
+        return -np.inf
+    lam = n_balls / n_bins
+    trunc_pmf = poisson.pmf(np.arange(max_load + 1), lam)
+    trunc_cdf = trunc_pmf.sum()
+    trunc_pmf /= trunc_cdf
+    sum_pmf = np.ones(1)
+    base_pmf = trunc_pmf[:n_balls + 1]
+    power = n_bins
+    while power:
+        if power & 1:
+            sum_pmf = np.clip(fftconvolve(sum_pmf, base_pmf)[:n_balls + 1], 0., None)
+        power >>= 1
+        if power:
+            base_pmf = np.clip(fftconvolve(base_pmf, base_pmf)[:n_balls + 1], 0., None)
+    if len(sum_pmf) <= n_balls or sum_pmf[n_balls] <= 0.:
+        return -np.inf
+    return min(n_bins * np.log(trunc_cdf) + np.log(sum_pmf[n_balls]) - poisson.logpmf(n_balls, n_balls), 0.)
+
+
+def get_max_load_threshold(n_bins, n_balls, alpha, table_file="auto"):
+    """
+    The smallest load that the max load of throwing n_balls into n_bins uniformly reaches with probability <= alpha.
+    Results are memoized in memory and appended to a persistent tab-delimited table (n_bins, n_balls, alpha, threshold)
+    shared across runs. Failures of accessing the table only disable the persistence.
+
+    :param n_bins: number of bins
+    :param n_balls: number of balls
+    :param alpha: significance level
+    :param table_file: path of the persistent table, None to disable the persistence,
+        or "auto" to use get_max_load_table_file()
+    :return: int
+    """
+    if table_file == "auto":
+        table_file = get_max_load_table_file()
+    if table_file and table_file not in _max_load_table_loaded:
+        _max_load_table_loaded.add(table_file)
+        try:
+            if os.path.isfile(table_file):
+                with open(table_file) as input_h:
+                    for line in input_h:
+                        line_split = line.strip().split("\t")
+                        if len(line_split) == 4:
+                            _max_load_thresholds[(int(line_split[0]), int(line_split[1]), float(line_split[2]))] = \
+                                int(line_split[3])
+        except (OSError, ValueError) as e:
+            logger.debug(f"Failed to load the max load table {table_file}: {e}")
+    table_key = (int(n_bins), int(n_balls), float(alpha))
+    if table_key not in _max_load_thresholds:
+        # start from the union bound P(max >= m) <= n_bins * P(Binomial(n_balls, 1/n_bins) >= m),
+        # which is an upper bound of the threshold and usually tight, then walk down with the exact probability
+        threshold = max(int(binom.isf(alpha / n_bins, n_balls, 1. / n_bins)) + 1, 1)
+        while threshold > 1 and \
+                log_prob_max_load_within(n_bins, n_balls, threshold - 2) >= math.log1p(-alpha):
+            threshold -= 1
+        _max_load_thresholds[table_key] = threshold
+        if table_file:
+            try:
+                os.makedirs(os.path.dirname(table_file), exist_ok=True)
+                with open(table_file, "a") as output_h:
+                    output_h.write("\t".join([str(table_key[0]), str(table_key[1]), repr(table_key[2]),
+                                              str(threshold)]) + "\n")
+            except OSError as e:
+                logger.debug(f"Failed to update the max load table {table_file}: {e}")
+    return _max_load_thresholds[table_key]
+
+
 # TODO: need to weight the probability of the bin if the bin has size smaller than the window size
 class GraphAlignConflicts(object):
     def __init__(
@@ -18,17 +118,25 @@ class GraphAlignConflicts(object):
             graph_alignment, 
             output_dir,
             window_size=50, 
-            window_step=40) -> None:
+            window_step=40,
+            max_load_table="auto") -> None:
+        """
+        :param max_load_table: persistent table of the max load thresholds, see get_max_load_threshold
+        """
         self.graph = graph
         self.alignment = graph_alignment
         self.output_dir = output_dir
         self.window_size = window_size
         self.window_step = window_step
-        self.n_simulations = 100000
         self.alpha = 0.001
+        self.max_load_table = max_load_table
         # to be generated
+        # v_name -> conflict records sorted by the conflict sites
         self.v_window_conflicts_info = {}
+        # v_name -> dense array of the number of conflicts in each window
         self.v_window_conflicts_counts = {}
+        # v_name -> (start ids, end ids) of the conflict records in each window, slicing v_window_conflicts_info
+        self.v_window_conflicts_ranges = {}
         self.n_bins = None
         self.n_balls = None
         self.max_load = None
@@ -44,11 +152,8 @@ class GraphAlignConflicts(object):
             max_loads (list): A list of maximum loads for each vertex with conflicts.
         """
         self._find_vertex_window_wise_conflicts()
-        all_conflicts = []
-        for conflicts in self.v_window_conflicts_counts.values():
-            all_conflicts.extend(conflicts)
-        self.n_bins = len(all_conflicts)
-        self.n_balls = sum(all_conflicts)
+        self.n_bins = sum([len(conflicts) for conflicts in self.v_window_conflicts_counts.values()])
+        self.n_balls = int(sum([conflicts.sum() for conflicts in self.v_window_conflicts_counts.values()]))
         logger.debug(f"Total number of bins: {self.n_bins}")
         logger.debug(f"Total number of balls: {self.n_balls}")
         self.conflict_n = []
@@ -61,7 +166,7 @@ class GraphAlignConflicts(object):
             self.conflict_n = []
             self.max_loads = []
             for v_n, conflicts in self.v_window_conflicts_counts.items():
-                here_max_load = max(conflicts)
+                here_max_load = int(conflicts.max())
                 if here_max_load >= self.max_load:
                     self.conflict_n.append(v_n)
                     self.max_loads.append(here_max_load)
@@ -87,14 +192,19 @@ class GraphAlignConflicts(object):
         min_n_reads = max(min_n_reads, self.max_load)
         read_seg_clusters = {}
         for conflict_n in self.conflict_n:
-            for bin_n, conflict_bin_info in self.v_window_conflicts_info[conflict_n].items():
-                if self.v_window_conflicts_counts[conflict_n][bin_n] >= min_n_reads:
-                    # TODO no need to record self.v_window_conflicts_info in the way of binning, directly record the conflict info
-                    for is_to_conflict, read_n, go_r, go_r_next, conflict_e, conflict_site in conflict_bin_info:
-                        read_seg = (read_n, go_r, go_r_next)
-                        if read_seg not in read_seg_clusters:
-                            read_seg_clusters[read_seg] = [None, None]
-                        read_seg_clusters[read_seg][int(is_to_conflict)] = (conflict_n, conflict_e, conflict_site)
+            conflicts_info = self.v_window_conflicts_info[conflict_n]
+            start_ids, end_ids = self.v_window_conflicts_ranges[conflict_n]
+            # the conflict records inside any window with sufficient conflicts, marked by a difference array
+            passed = self.v_window_conflicts_counts[conflict_n] >= min_n_reads
+            in_passed = np.zeros(len(conflicts_info) + 1, dtype=np.int64)
+            np.add.at(in_passed, start_ids[passed], 1)
+            np.add.at(in_passed, end_ids[passed], -1)
+            for go_c in np.flatnonzero(np.cumsum(in_passed[:-1]) > 0):
+                is_to_conflict, read_n, go_r, go_r_next, conflict_e, conflict_site = conflicts_info[go_c]
+                read_seg = (read_n, go_r, go_r_next)
+                if read_seg not in read_seg_clusters:
+                    read_seg_clusters[read_seg] = [None, None]
+                read_seg_clusters[read_seg][int(is_to_conflict)] = (conflict_n, conflict_e, conflict_site)
         ########
         # record post-filtered bk points for gmm clustering
         post_filtered_bk_points = {}  # {v_name: [pos1, pos2, ...]} # 0-based, directly used to slice the contig
@@ -310,15 +420,14 @@ class GraphAlignConflicts(object):
         #     return None
 
     def _find_vertex_window_wise_conflicts(self):
+        """
+        Collect the conflict sites of each vertex, sort them once,
+        and count the conflicts in all sliding windows by searching the window boundaries in the sorted sites.
+        """
         # can be improved by optionally store self.v_window_conflicts_info only when needed
-        self.v_window_conflicts_info = {}
-        self.v_window_conflicts_counts = {}
-        v_lengths = {}
-        for v_n, v_info in self.graph.vertex_info.items():
-            v_lengths[v_n] = v_info.len
-            n_bins = self.count_bins(v_info.len)
-            self.v_window_conflicts_counts[v_n] = [0 for foo in range(n_bins)]
-            self.v_window_conflicts_info[v_n] = {}
+        v_lengths = {v_n: v_info.len for v_n, v_info in self.graph.vertex_info.items()}
+        v_sites = {v_n: [] for v_n in v_lengths}
+        v_conflicts_info = {v_n: [] for v_n in v_lengths}
 
         total_reads = len(self.alignment.read_records)
         total_records = sum([len(r_records) for r_records in self.alignment.read_records.values()])
@@ -329,8 +438,6 @@ class GraphAlignConflicts(object):
                 if len(r_records) > 1:
                     r_records.sort_by()
                     for go_r, rec in enumerate(r_records):
-                        # if read_n == 'SRR11434954.25514 25514 length=13075':
-                        #     logger.warning(f"SRR11434954.25514 25514 length=13075 -- Record {go_r}: {rec.path}, {rec.p_start}, {rec.p_end}, {rec.p_len}")
                         if go_r != 0:  # if is not start part of the query, then the start of the path means a conflict
                             conflict_n, conflict_e = rec.path[0]
                             conflict_site = rec.p_start  # zero based
@@ -339,18 +446,12 @@ class GraphAlignConflicts(object):
                                 conflict_site += 1
                             else:
                                 conflict_site = max_len - conflict_site
-                            bins = self.find_bin_numbers(base=conflict_site, max_base=max_len)
-                            for b_n in bins:
-                                self.v_window_conflicts_counts[conflict_n][b_n] += 1
-                                # is_to_conflict, read_name, from_record, to_record, conflict_e, conflict_site
-                                if b_n not in self.v_window_conflicts_info[conflict_n]:
-                                    self.v_window_conflicts_info[conflict_n][b_n] = []
-                                self.v_window_conflicts_info[conflict_n][b_n].append(
-                                    (True, read_n, go_r-1, go_r, conflict_e, conflict_site))
-                                # self.v_window_conflicts_info[conflict_n].setdefault(b_n, []).append(
-                                #     (True, read_n, go_r-1, go_r, conflict_e, conflict_site))
-                                # if read_n == 'SRR11434954.25514 25514 length=13075':
-                                #     logger.warning(f"SRR11434954.25514 25514 length=13075 -- to conflict added")
+                            assert max_len >= conflict_site >= 1, \
+                                "base should be in the range [1, {max_base}]".format(max_base=max_len)
+                            v_sites[conflict_n].append(conflict_site)
+                            # is_to_conflict, read_name, from_record, to_record, conflict_e, conflict_site
+                            v_conflicts_info[conflict_n].append(
+                                (True, read_n, go_r-1, go_r, conflict_e, conflict_site))
                         if go_r != len(r_records) - 1:  # is not end part of the query, the end of the record means a conflict
                             conflict_n, conflict_e = rec.path[-1]
                             conflict_site = rec.p_len - rec.p_end  # zero based in the reverse direction
@@ -359,54 +460,54 @@ class GraphAlignConflicts(object):
                                 conflict_site = max_len - conflict_site
                             else:
                                 conflict_site += 1
-                            try:
-                                bins = self.find_bin_numbers(base=conflict_site, max_base=max_len)
-                            except AssertionError as e:
-                                logger.error(f"Error in find_bin_numbers: {e}")
+                            if not max_len >= conflict_site >= 1:
+                                logger.error(f"Error in finding windows: "
+                                             f"base should be in the range [1, {max_len}]")
                                 logger.error(f"conflict_site: {conflict_site}, max_len: {max_len}")
                                 logger.error(f"conflict_n: {conflict_n}, conflict_e: {conflict_e}")
                                 logger.error(f"rec: {rec.query_name}, {rec.query_len}, {rec.path}, {rec.p_start}, {rec.p_end}, {rec.p_len}")
-                                raise e
-                            for b_n in bins:
-                                self.v_window_conflicts_counts[conflict_n][b_n] += 1
-                                # is_to_conflict (False means from), read_name, from_record, to_record, conflict_e, conflict_site
-                                if b_n not in self.v_window_conflicts_info[conflict_n]:
-                                    self.v_window_conflicts_info[conflict_n][b_n] = []
-                                self.v_window_conflicts_info[conflict_n][b_n].append(
-                                    (False, read_n, go_r, go_r+1, conflict_e, conflict_site))
-                                # if read_n == 'SRR11434954.25514 25514 length=13075':
-                                #     logger.warning(f"SRR11434954.25514 25514 length=13075 -- from conflict added")
-                                # self.v_window_conflicts_info[conflict_n].setdefault(b_n, []).append(
-                                #     (False, read_n, go_r, go_r+1, conflict_e, conflict_site))
-    
+                                raise AssertionError(f"base should be in the range [1, {max_len}]")
+                            v_sites[conflict_n].append(conflict_site)
+                            # is_to_conflict (False means from), read_name, from_record, to_record, conflict_e, conflict_site
+                            v_conflicts_info[conflict_n].append(
+                                (False, read_n, go_r, go_r+1, conflict_e, conflict_site))
+
+        self.v_window_conflicts_info = {}
+        self.v_window_conflicts_counts = {}
+        self.v_window_conflicts_ranges = {}
+        for v_n, max_len in v_lengths.items():
+            sites = np.array(v_sites[v_n], dtype=np.int64)
+            site_order = np.argsort(sites, kind="stable")
+            sites = sites[site_order]
+            window_starts, window_ends = self.get_window_ranges(max_len)
+            start_ids = np.searchsorted(sites, window_starts, side="left")
+            end_ids = np.searchsorted(sites, window_ends, side="right")
+            self.v_window_conflicts_info[v_n] = [v_conflicts_info[v_n][go_c] for go_c in site_order]
+            self.v_window_conflicts_counts[v_n] = end_ids - start_ids
+            self.v_window_conflicts_ranges[v_n] = (start_ids, end_ids)
+
     def _find_possible_max_load(self, N, k):
         # TODO: need to weight the probability of the bin if the bin (contig) has size smaller than the window size
-        assert self.n_simulations * self.alpha >= 10
-        max_load_counts = {}
-        for _ in range(self.n_simulations):
-            # simulate placing each ball into a bin
-            bins = np.random.randint(0, N, size=k)
-            # Count the number of balls in each bin
-            bin_counts = np.bincount(bins, minlength=N)
-            # Check if the maximum load is exactly r
-            max_load = np.max(bin_counts)
-            if max_load not in max_load_counts:
-                max_load_counts[max_load] = 1
-            else:
-                max_load_counts[max_load] += 1
-        # Estimate the probability
-        most_n_cases = self.n_simulations * (1 - self.alpha)
-        accumulated = 0
-        logger.debug(f"Max load counts: {max_load_counts}")
-        for max_load, counts in sorted(max_load_counts.items()):
-            if accumulated >= most_n_cases:
-                return max_load
-            else:
-                accumulated += counts
-        return max(max_load_counts)
+        return get_max_load_threshold(n_bins=N, n_balls=k, alpha=self.alpha, table_file=self.max_load_table)
     
     def count_bins(self, max_base):
         return max(math.ceil((max_base - self.window_size) / self.window_step), 0) + 1
+
+    def get_window_ranges(self, max_base):
+        """
+        The ranges of the bases counted in each window, consistent with find_bin_numbers:
+        the first window is [1, window_size], the last window is [max_base - window_size + 1, max_base],
+        and the others start from the multiples of window_step, all excluding the bases of the first window.
+        :return: arrays of the 1-based start and end (inclusive) bases of the windows
+        """
+        n_bins = self.count_bins(max_base)
+        window_starts = np.arange(n_bins, dtype=np.int64) * self.window_step
+        window_ends = window_starts + self.window_size - 1
+        if n_bins > 1:
+            window_starts[-1] = max_base - self.window_size
+            window_ends[-1] = max_base - 1
+            window_starts[1:] = np.maximum(window_starts[1:], self.window_size)
+        return window_starts + 1, window_ends + 1
     
     def find_bin_numbers(self, base, max_base):
         assert max_base >= base >= 1, "base should be in the range [1, {max_base}]".format(max_base=max_base)
@@ -15,7 +15,10 @@ from traversome.utils import REV_DEGENERATE, gaf_str_to_path  # ,TO_DEGENERATE,
 import sympy
 from itertools import product
 from multiprocessing import Manager, Pool
+import numpy as np
 import gzip
+import zlib
+import struct
 import gc
 # import dill
 
@@ -148,6 +151,214 @@ class SPATSVRecord(object):
         pass
 
 
+def _gaf_column_property(col_name, val_type):
+    """
+    generate the property that maps a GAFRecordView attribute to the corresponding column
+    """
+    def _get_val(self):
+        return val_type(getattr(self.columns, col_name)[self.row])
+
+    def _set_val(self, new_val):
+        getattr(self.columns, col_name)[self.row] = new_val
+
+    return property(_get_val, _set_val)
+
+
+class GAFRecordView(object):
+    """
+    Light-weight view of one row in a GAFRecordColumns object.
+    It provides the same attributes that downstream analysis reads from a GAFRecord,
+    and modifications (e.g. trimming in GraphAlignRecords.filter_read_records) are written back to the columns.
+    """
+    __slots__ = ("columns", "row")
+
+    def __init__(self, columns, row):
+        self.columns = columns
+        self.row = row
+
+    query_len = _gaf_column_property("query_len", int)
+    q_start = _gaf_column_property("q_start", int)
+    q_end = _gaf_column_property("q_end", int)
+    q_strand = _gaf_column_property("q_strand", bool)
+    p_len = _gaf_column_property("p_len", int)
+    p_start = _gaf_column_property("p_start", int)
+    p_end = _gaf_column_property("p_end", int)
+    p_align_len = _gaf_column_property("p_align_len", int)
+    identity = _gaf_column_property("identity", float)
+    # CIGARs are of variable length and not stored in columns, use GAFRecord with parse_cigar=True instead
+    cigar = None
+
+    @property
+    def query_name(self):
+        return self.columns.query_names[self.columns.query_id[self.row]]
+
+    @query_name.setter
+    def query_name(self, new_name):
+        self.columns.query_id[self.row] = self.columns.intern_query_name(new_name)
+
+    @property
+    def path_id(self):
+        return int(self.columns.path_id[self.row])
+
+    @property
+    def path_str(self):
+        return self.columns.path_strs[self.columns.path_id[self.row]]
+
+    @property
+    def path(self):
+        return self.columns.paths[self.columns.path_id[self.row]]
+
+
+class GAFRecordColumns(object):
+    """
+    Column-wise (numpy) storage of GAF records.
+    Only the fields used by the downstream analysis are kept.
+    Query names and paths are interned, so that each unique query name/path is stored only once.
+    The object behaves like the list of GAFRecord objects it replaces, yielding GAFRecordView objects.
+    """
+    int_columns = ("query_len", "q_start", "q_end", "p_len", "p_start", "p_end", "p_align_len")
+
+    def __init__(self, chunk_size=100000):
+        """
+        :param chunk_size: number of records to cache as python objects before converting them into numpy arrays
+        """
+        self.chunk_size = chunk_size
+        self.query_names = []
+        self.paths = []
+        self.path_strs = []
+        self.__query_name_to_id = {}
+        self.__path_str_to_id = {}
+        # columns
+        self.query_id = np.zeros(0, dtype=np.int64)
+        self.path_id = np.zeros(0, dtype=np.int64)
+        self.q_strand = np.zeros(0, dtype=bool)
+        self.identity = np.zeros(0, dtype=np.float64)
+        for col_name in self.int_columns:
+            setattr(self, col_name, np.zeros(0, dtype=np.int64))
+        # parsed but not yet converted into columns
+        self.__cached_rows = []
+        self.__blocks = []
+
+    def intern_query_name(self, query_name):
+        if query_name not in self.__query_name_to_id:
+            self.__query_name_to_id[query_name] = len(self.query_names)
+            self.query_names.append(query_name)
+        return self.__query_name_to_id[query_name]
+
+    def intern_path_str(self, path_str):
+        if path_str not in self.__path_str_to_id:
+            self.__path_str_to_id[path_str] = len(self.paths)
+            self.path_strs.append(path_str)
+            self.paths.append(gaf_str_to_path(path_str))
+        return self.__path_str_to_id[path_str]
+
+    def add_line_split(self, record_line_split, min_record_identity=0.):
+        """
+        parse a split GAF line, only keeping the fields used downstream
+        :return: True if added, False if filtered out by min_record_identity
+        """
+        identity = None
+        # only the "id" tag is used, skip parsing other optional fields
+        for flag_type_val in record_line_split[12:]:
+            if flag_type_val.startswith("id:"):
+                identity = float(flag_type_val.split(":", maxsplit=2)[2])
+                break
+        if identity is None:
+            identity = int(record_line_split[9]) / float(record_line_split[10])
+        if identity < min_record_identity:
+            return False
+        p_start = int(record_line_split[7])
+        p_end = int(record_line_split[8])
+        self.__cached_rows.append(
+            (self.intern_query_name(record_line_split[0]),
+             self.intern_path_str(record_line_split[5]),
+             CONVERT_STRAND[record_line_split[4]],
+             identity,
+             int(record_line_split[1]),
+             int(record_line_split[2]),
+             int(record_line_split[3]),
+             int(record_line_split[6]),
+             p_start,
+             p_end,
+             p_end - p_start))
+        if len(self.__cached_rows) >= self.chunk_size:
+            self.__flush_cached_rows()
+        return True
+
+    def __flush_cached_rows(self):
+        if self.__cached_rows:
+            row_cols = list(zip(*self.__cached_rows))
+            block = {"query_id": np.array(row_cols[0], dtype=np.int64),
+                     "path_id": np.array(row_cols[1], dtype=np.int64),
+                     "q_strand": np.array(row_cols[2], dtype=bool),
+                     "identity": np.array(row_cols[3], dtype=np.float64)}
+            for go_c, col_name in enumerate(self.int_columns):
+                block[col_name] = np.array(row_cols[4 + go_c], dtype=np.int64)
+            self.__blocks.append(block)
+            self.__cached_rows = []
+
+    def finalize(self):
+        """
+        convert all cached rows and pending blocks into columns, must be called after the last add_line_split or extend
+        """
+        self.__flush_cached_rows()
+        if self.__blocks:
+            for col_name in self.column_names():
+                setattr(self, col_name,
+                        np.concatenate([getattr(self, col_name)] + [block[col_name] for block in self.__blocks]))
+            self.__blocks = []
+        return self
+
+    @classmethod
+    def column_names(cls):
+        return ("query_id", "path_id", "q_strand", "identity") + cls.int_columns
+
+    def extend(self, other):
+        """
+        append the records of another GAFRecordColumns object, with query names and paths re-interned.
+        The records are kept as a pending block and only concatenated into the columns by finalize,
+        so that merging many objects is linear rather than quadratic.
+        """
+        other.finalize()
+        if not len(other):
+            return
+        # keep the file order of the cached rows of self before the new block
+        self.__flush_cached_rows()
+        name_map = np.array([self.intern_query_name(q_name) for q_name in other.query_names], dtype=np.int64)
+        path_map = np.array([self.intern_path_str(p_str) for p_str in other.path_strs], dtype=np.int64)
+        block = {"query_id": name_map[other.query_id], "path_id": path_map[other.path_id]}
+        for col_name in self.column_names()[2:]:
+            block[col_name] = getattr(other, col_name)
+        self.__blocks.append(block)
+
+    def remove(self, del_ids):
+        """
+        remove multiple records at once, which is much faster than deleting them one by one
+        """
+        if len(del_ids):
+            keep_mask = np.ones(len(self), dtype=bool)
+            keep_mask[np.asarray(del_ids, dtype=np.int64)] = False
+            for col_name in self.column_names():
+                setattr(self, col_name, getattr(self, col_name)[keep_mask])
+
+    def __delitem__(self, key: int):
+        self.remove([key])
+
+    def __getitem__(self, item: int):
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("record index out of range")
+        return GAFRecordView(self, item)
+
+    def __iter__(self):
+        for go_r in range(len(self)):
+            yield GAFRecordView(self, go_r)
+
+    def __len__(self):
+        return len(self.query_id)
+
+
 def _gaf_parse_worker(
         csv_lines_gen, 
         # _min_align_len, 
@@ -171,6 +382,21 @@ def _gaf_parse_worker(
     return _gaf_list, count_r
 
 
+def _gaf_columns_parse_worker(
+        csv_lines_gen,
+        _min_record_identity,
+        _chunk_size=100000):
+    """
+    plain function for easier multiprocessing, streaming version of _gaf_parse_worker storing records in columns
+    """
+    _gaf_columns = GAFRecordColumns(chunk_size=_chunk_size)
+    count_r = 0
+    for _line_split in csv_lines_gen:
+        count_r += 1
+        _gaf_columns.add_line_split(_line_split.strip().split("\t"), min_record_identity=_min_record_identity)
+    return _gaf_columns.finalize(), count_r
+
+
 # def _gfa_ali_parse_worker(csv_lines_gen, _min_align_len):
 #     # it seems that gfa does not contain complete alignment information for hifiasm 0.19.8
 #
@@ -197,6 +423,109 @@ def _tsv_parse_worker(
     return _tsv_list, count_r
 
 
+def _is_bgzf(file_name):
+    """
+    check whether a gzip file is blocked gzip (BGZF, e.g. compressed by bgzip), which allows random access
+    """
+    with open(file_name, "rb") as input_f:
+        header = input_f.read(18)
+    # gzip magic, deflate, FEXTRA flag, XLEN=6, subfield "BC" of length 2
+    return len(header) == 18 and header[:4] == b"\x1f\x8b\x08\x04" and header[10:16] == b"\x06\x00BC\x02\x00"
+
+
+def _scan_bgzf_block_offsets(file_name):
+    """
+    :return: the compressed offsets of all BGZF blocks, with the file size appended as the end
+    """
+    offsets = []
+    file_size = os.path.getsize(file_name)
+    with open(file_name, "rb") as input_f:
+        go_offset = 0
+        while go_offset < file_size:
+            offsets.append(go_offset)
+            input_f.seek(go_offset)
+            header = input_f.read(18)
+            if len(header) < 18 or header[12:14] != b"BC":
+                raise ValueError("Invalid BGZF block at offset {} in {}".format(go_offset, file_name))
+            # BSIZE: total block size minus 1
+            go_offset += struct.unpack("<H", header[16:18])[0] + 1
+    offsets.append(file_size)
+    return offsets
+
+
+def _iter_plain_range_lines(file_name, start, end):
+    """
+    yield the lines starting within the byte range [start, end) of a plain text file
+    """
+    with open(file_name, "rb") as input_f:
+        if start > 0:
+            # the line crossing the start belongs to the previous range
+            input_f.seek(start - 1)
+            input_f.readline()
+        while input_f.tell() < end:
+            line_bytes = input_f.readline()
+            if not line_bytes:
+                break
+            yield line_bytes.decode()
+
+
+def _iter_bgzf_range_lines(file_name, block_offsets, go_start, go_end):
+    """
+    yield the lines starting within the BGZF blocks [go_start, go_end)
+    """
+    with open(file_name, "rb") as input_f:
+        def _decompress_block(_go_b):
+            input_f.seek(block_offsets[_go_b])
+            return zlib.decompress(input_f.read(block_offsets[_go_b + 1] - block_offsets[_go_b]), 31)
+
+        data = b"".join([_decompress_block(go_b) for go_b in range(go_start, go_end)])
+        if go_start > 0:
+            # the line crossing the start belongs to the previous range
+            go_prev = go_start - 1
+            prev_data = _decompress_block(go_prev)
+            while not prev_data and go_prev > 0:
+                go_prev -= 1
+                prev_data = _decompress_block(go_prev)
+            if prev_data and not prev_data.endswith(b"\n"):
+                data = data[data.find(b"\n") + 1:] if b"\n" in data else b""
+        if data and not data.endswith(b"\n"):
+            # complete the last line using the following blocks
+            go_next = go_end
+            while go_next < len(block_offsets) - 1:
+                next_data = _decompress_block(go_next)
+                if b"\n" in next_data:
+                    data += next_data[:next_data.find(b"\n") + 1]
+                    break
+                data += next_data
+                go_next += 1
+    for line_str in data.decode().splitlines(True):
+        yield line_str
+
+
+def _alignment_block_parse_worker(block_source, alignment_format, min_record_identity, parse_cigar):
+    """
+    plain function for easier multiprocessing, parse one block of the alignment file
+
+    :param block_source: one of the following
+        ("plain", file_name, start, end): byte range of a plain text file
+        ("bgzf", file_name, block_offsets, go_start, go_end): block range of a BGZF file
+        ("bytes", data): decompressed data of complete lines
+    """
+    if block_source[0] == "plain":
+        lines_gen = _iter_plain_range_lines(*block_source[1:])
+    elif block_source[0] == "bgzf":
+        lines_gen = _iter_bgzf_range_lines(*block_source[1:])
+    else:
+        lines_gen = block_source[1].decode().splitlines(True)
+    if alignment_format == "GAF":
+        if parse_cigar:
+            return _gaf_parse_worker(lines_gen, min_record_identity, parse_cigar)
+        else:
+            return _gaf_columns_parse_worker(lines_gen, min_record_identity)
+    else:
+        return _tsv_parse_worker(lines_gen)
+
+
 class ReadRecord(object):
     """
     Read Record class to store consolidated multiple hits of the same read (query).
@@ -371,7 +700,6 @@ def _add_alignment_to_transition_counts_mp(
 #                 _transition_counts[ref_kmer][(query_base, _this_prob_tag)] += new_weight
 
 
-# TODO parallelize parsing
 class GraphAlignRecords(object):
     """
     Stores GraphAlign records...
@@ -392,6 +720,8 @@ class GraphAlignRecords(object):
         ...
     parse_cigar (bool):
         parsing CIGARs allows for ... default=False.
+    num_proc (int):
+        number of processes for parsing plain, gzip or BGZF (random access, fastest) compressed alignment files.
     """
 
     def __init__(
@@ -435,10 +765,7 @@ class GraphAlignRecords(object):
         self.read_records = OrderedDict()
 
         # run the parsing function
-        if self.alignment_file.endswith("gz"):  # TODO multiprocess with gzip not implemented yet
-            self.parse_alignment_file(num_proc=1)
-        else:
-            self.parse_alignment_file(num_proc=num_proc, _num_block_lines=kwargs.get("_num_block_lines", 10000))
+        self.parse_alignment_file(num_proc=num_proc, _block_size=kwargs.get("_block_size", 2 ** 24))
         self.build_read_records()
         self.filter_read_records()
 
@@ -927,8 +1254,7 @@ class GraphAlignRecords(object):
                     del self.read_records[query_name]
                     count_d_r += 1
             del_raw_ids.sort(reverse=True)
-            for del_id in del_raw_ids:
-                del self.raw_records[del_id]
+            self.__remove_raw_records(del_raw_ids)
             if len(del_raw_ids):
                 logger.warning(
                     "{} read records ({} alignments) not found and dropped!".format(count_d_r, len(del_raw_ids)))
@@ -1017,87 +1343,101 @@ class GraphAlignRecords(object):
                         if _id is not None:
                             read_record[_id].query_name = read_name + "_block" + str(go_b + 1)
                 del_ids.extend([_id for _id in read_record.raw_ids if _id not in keep_raw_ids])
-        del_ids.sort(reverse=True)
-        for del_id in del_ids:
-            del self.raw_records[del_id]
+        self.__remove_raw_records(del_ids)
         self.read_records = OrderedDict()
         gc.collect()
         self.build_read_records()
 
-    def parse_alignment_file(self, num_proc=1, _num_block_lines=10000):
+    def __remove_raw_records(self, del_ids):
+        if isinstance(self.raw_records, GAFRecordColumns):
+            self.raw_records.remove(del_ids)
+        else:
+            for del_id in sorted(del_ids, reverse=True):
+                del self.raw_records[del_id]
+
+    def parse_alignment_file(self, num_proc=1, _block_size=2 ** 24):
         """
         """
         logger.info("Parsing alignment ({})".format(self.alignment_format))
         if num_proc == 1:
             self.parse_alignment_file_single()
         else:
-            self.parse_alignment_file_mul(num_proc=num_proc, num_block_lines=_num_block_lines)
+            self.parse_alignment_file_mul(num_proc=num_proc, block_size=_block_size)
             # # empirically 4 is enough, a greater value will not help
             # self.parse_alignment_file_mul(num_proc=max(num_proc, 4), num_block_lines=_num_block_lines)
 
-    def parse_alignment_file_mul(self, num_proc, num_block_lines=10000):
+    def parse_alignment_file_mul(self, num_proc, block_size=2 ** 24):
         """
-        multiprocess version of parse_alignment_file_single
+        multiprocess version of parse_alignment_file_single.
+        Workers read byte ranges of plain files or block ranges of BGZF files by themselves,
+        while the decompressed data are sent to the workers for other gzip files.
+        Results are merged in the file order.
 
         Parameters
         -----
         num_proc: empirically 4 is enough in my local environment, a greater value will not help
-        num_block_lines:
+        block_size: maximum number of (decompressed) bytes per job
         """
         # if self.alignment_format not in ("GAF", "SPA-TSV", "GFA"):
         if self.alignment_format not in ("GAF", "SPA-TSV"):
             raise Exception("unsupported format!")
-        pool_obj = Pool(processes=num_proc - 1)
+        if self.alignment_format == "GAF" and not self.parse_cigar:
+            self.raw_records = GAFRecordColumns()
+        else:
+            self.raw_records = []
+        if self.alignment_file.endswith("gz") and not _is_bgzf(self.alignment_file):
+            # the parent process is busy with decompressing
+            pool_obj = Pool(processes=max(num_proc - 1, 1))
+        else:
+            pool_obj = Pool(processes=num_proc)
         jobs = []
-        cached_lines = []
-        start_block_size = max(math.ceil(num_block_lines/num_proc), 1)
-        step_block = max(math.ceil(num_block_lines/num_proc), 1)
-        if self.alignment_format == "GAF":
-            # store a list of GAFRecord objects made for each line in GAF file.
-            with open(self.alignment_file) as input_f:
-                # for line_str in csv.reader(input_f, delimiter="\t"):
-                for line_str in input_f:
-                    if len(cached_lines) > start_block_size:
-                        jobs.append(
-                            pool_obj.apply_async(
-                                _gaf_parse_worker,
-                                (cached_lines, self.min_record_identity, self.parse_cigar)))
-                                # (cached_lines, self.min_align_len, self.min_identity, self.parse_cigar)))
-                        cached_lines = []
-                        start_block_size += min(start_block_size + step_block, num_block_lines)
-                    else:
-                        cached_lines.append(line_str)
-                jobs.append(
-                    pool_obj.apply_async(_gaf_parse_worker,
-                                         (cached_lines, self.min_record_identity, self.parse_cigar))
-                                        #  (cached_lines, self.min_align_len, self.min_identity, self.parse_cigar))
-                )
-        # elif self.alignment_format == "GFA":
-        #     with open(self.alignment_file) as input_f:
-        #         for line_str in input_f:
-        #             if len(cached_lines) > num_block_lines:
-        #                 jobs.append(pool_obj.apply_async(_gfa_ali_parse_worker, (cached_lines, self.min_align_len)))
-        #                 cached_lines = []
-        #             else:
-        #                 cached_lines.append(line_str)
-        #         jobs.append(pool_obj.apply_async(_gfa_ali_parse_worker, (cached_lines, self.min_align_len)))
-        elif self.alignment_format == "SPA-TSV":
-            # store a list of SPAligner SPATSVRecord objects made for each line in TSV file.
-            with open(self.alignment_file) as input_f:
-                # for line_split in csv.reader(input_f, delimiter="\t"):
-                for line_str in input_f:
-                    if len(cached_lines) > num_block_lines:
-                        jobs.append(pool_obj.apply_async(_tsv_parse_worker, (cached_lines, )))
-                        cached_lines = []
-                    else:
-                        cached_lines.append(line_str)
-                jobs.append(pool_obj.apply_async(_tsv_parse_worker, (cached_lines, )))
+        for block_source in self.__gen_alignment_blocks(num_proc=num_proc, block_size=block_size):
+            jobs.append(
+                pool_obj.apply_async(
+                    _alignment_block_parse_worker,
+                    (block_source, self.alignment_format, self.min_record_identity, self.parse_cigar)))
+            # collect finished jobs in order to limit the decompressed data waiting in the queue
+            while len(jobs) > 2 * num_proc:
+                self.__merge_parsed_block(jobs.pop(0).get())
         pool_obj.close()
         for job in jobs:
-            batch_records, count_r = job.get()
-            self.raw_records.extend(batch_records)
-            self.n_file_records += count_r
+            self.__merge_parsed_block(job.get())
         pool_obj.join()
+        if isinstance(self.raw_records, GAFRecordColumns):
+            self.raw_records.finalize()
+
+    def __merge_parsed_block(self, parsed_block):
+        batch_records, count_r = parsed_block
+        self.raw_records.extend(batch_records)
+        self.n_file_records += count_r
+
+    def __gen_alignment_blocks(self, num_proc, block_size):
+        """
+        generate the block sources for _alignment_block_parse_worker in the file order
+        """
+        if not self.alignment_file.endswith("gz"):
+            file_size = os.path.getsize(self.alignment_file)
+            # several ranges per process for load balancing
+            range_size = max(min(block_size, math.ceil(file_size / (num_proc * 4))), 1)
+            for go_start in range(0, file_size, range_size):
+                yield "plain", self.alignment_file, go_start, min(go_start + range_size, file_size)
+        elif _is_bgzf(self.alignment_file):
+            block_offsets = _scan_bgzf_block_offsets(self.alignment_file)
+            n_blocks = len(block_offsets) - 1
+            # a BGZF block holds at most 64 KB of decompressed data
+            step = max(min(block_size // 2 ** 16, math.ceil(n_blocks / (num_proc * 4))), 1)
+            for go_start in range(0, n_blocks, step):
+                yield "bgzf", self.alignment_file, block_offsets, go_start, min(go_start + step, n_blocks)
+        else:
+            logger.debug("{} is not BGZF-compressed, decompressing it in the main process".format(self.alignment_file))
+            with gzip.open(self.alignment_file, "rb") as input_f:
+                while True:
+                    data = input_f.read(block_size)
+                    if not data:
+                        break
+                    if not data.endswith(b"\n"):
+                        data += input_f.readline()
+                    yield "bytes", data
 
     def parse_alignment_file_single(self):
         """
@@ -1107,13 +1447,19 @@ class GraphAlignRecords(object):
         else:
             input_f = open(self.alignment_file)
         if self.alignment_format == "GAF":
-            # store a list of GAFRecord objects made for each line in GAF file.
-            self.raw_records, self.n_file_records = _gaf_parse_worker(
-                # csv_lines_gen=csv.reader(input_f, delimiter="\t"),
-                csv_lines_gen=input_f,
-                # _min_align_len=self.min_align_len,
-                _min_record_identity=self.min_record_identity,
-                _parse_cigar=self.parse_cigar)
+            if self.parse_cigar:
+                # store a list of GAFRecord objects made for each line in GAF file.
+                self.raw_records, self.n_file_records = _gaf_parse_worker(
+                    # csv_lines_gen=csv.reader(input_f, delimiter="\t"),
+                    csv_lines_gen=input_f,
+                    # _min_align_len=self.min_align_len,
+                    _min_record_identity=self.min_record_identity,
+                    _parse_cigar=self.parse_cigar)
+            else:
+                # stream the GAF file into columns
+                self.raw_records, self.n_file_records = _gaf_columns_parse_worker(
+                    csv_lines_gen=input_f,
+                    _min_record_identity=self.min_record_identity)
             input_f.close()
         # elif self.alignment_format == "GFA":
         #     self.raw_records = _gfa_ali_parse_worker(
@@ -1122,12 +1468,11 @@ class GraphAlignRecords(object):
         #     input_f.close()
         elif self.alignment_format == "SPA-TSV":
             # store a list of SPAligner SPATSVRecord objects made for each line in TSV file.
-            with open(self.alignment_file) as input_f:
-                self.raw_records, self.n_file_records = _tsv_parse_worker(
-                    # csv_lines_gen=csv.reader(input_f, delimiter="\t"),
-                    csv_lines_gen=input_f,
-                    # _min_align_len=self.min_align_len
-                    )
+            self.raw_records, self.n_file_records = _tsv_parse_worker(
+                # csv_lines_gen=csv.reader(input_f, delimiter="\t"),
+                csv_lines_gen=input_f,
+                # _min_align_len=self.min_align_len
+                )
             input_f.close()
         else:
             input_f.close()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+Frozen array-backed snapshot of the topology of an assembly graph
+"""
+
+from types import MappingProxyType
+import numpy as np
+
+
+class CoreVertex(object):
+    """
+    Read-only view of a vertex in GraphCore, with the Vertex attributes used in graph traversal
+    """
+    __slots__ = ("name", "v_id", "len", "connections")
+
+    def __init__(self, name, v_id, length, connections):
+        self.name = name
+        self.v_id = v_id
+        self.len = length
+        self.connections = connections
+
+
+class GraphCore(object):
+    """
+    Compact CSR (compressed sparse row) adjacency of one Assembly object, frozen after the graph preprocessing.
+
+    Vertices are numbered by integer ids in the order of Assembly.vertex_info,
+    and each vertex end (v_id, v_end) is encoded as 2 * v_id + int(v_end).
+    The connections of the end code c are next_codes[offsets[c]: offsets[c + 1]], with overlaps at the same indices,
+    sorted by the (name, end) of the next vertex, i.e. in the order of sorted(Vertex.connections[v_end]).
+    For the code written against Assembly, vertex_info[v_name] gives a CoreVertex view,
+    whose connections are read-only mappings in the same sorted order,
+    and get_next_ends gives the sorted connections of a vertex end as a prebuilt tuple.
+    The Assembly object drops its GraphCore whenever the graph is modified.
+    """
+    def __init__(self, graph):
+        """
+        :param graph: Assembly object
+        """
+        self.vertex_names = list(graph.vertex_info)
+        self.name_to_id = {v_name: v_id for v_id, v_name in enumerate(self.vertex_names)}
+        num_ends = 2 * len(self.vertex_names)
+        self.lengths = np.array([graph.vertex_info[v_name].len for v_name in self.vertex_names], dtype=np.int64)
+        self.offsets = np.zeros(num_ends + 1, dtype=np.int64)
+        next_codes = []
+        overlaps = []
+        # (v_name, v_end) -> sorted tuple of (next_name, next_end)
+        self.__next_ends = {}
+        vertex_info = {}
+        for v_id, v_name in enumerate(self.vertex_names):
+            v_connections = {}
+            for v_end in (False, True):
+                raw_connections = graph.vertex_info[v_name].connections[v_end]
+                sorted_next = tuple(sorted(raw_connections))
+                for next_n, next_e in sorted_next:
+                    next_codes.append(2 * self.name_to_id[next_n] + int(next_e))
+                    overlaps.append(raw_connections[(next_n, next_e)])
+                self.offsets[2 * v_id + int(v_end) + 1] = len(next_codes)
+                self.__next_ends[(v_name, v_end)] = sorted_next
+                v_connections[v_end] = MappingProxyType({next_v: raw_connections[next_v] for next_v in sorted_next})
+            vertex_info[v_name] = CoreVertex(v_name, v_id, self.lengths[v_id].item(), v_connections)
+        self.vertex_info = MappingProxyType(vertex_info)
+        self.next_codes = np.array(next_codes, dtype=np.int64)
+        self.overlaps = np.array(overlaps, dtype=np.int64)
+        self.degrees = np.diff(self.offsets)
+        self.__freeze_arrays()
+
+    def __freeze_arrays(self):
+        for frozen_array in (self.lengths, self.offsets, self.next_codes, self.overlaps, self.degrees):
+            frozen_array.flags.writeable = False
+
+    def __getstate__(self):
+        # MappingProxyType cannot be pickled, so the vertex views are stored as plain dicts and rebuilt by __setstate__
+        state = dict(self.__dict__)
+        state["vertex_info"] = {
+            v_name: (vertex.v_id, vertex.len, {v_end: dict(v_conn) for v_end, v_conn in vertex.connections.items()})
+            for v_name, vertex in self.vertex_info.items()}
+        return state
+
+    def __setstate__(self, state):
+        vertex_info = state.pop("vertex_info")
+        self.__dict__.update(state)
+        self.vertex_info = MappingProxyType({
+            v_name: CoreVertex(v_name, v_id, length,
+                               {v_end: MappingProxyType(v_conn) for v_end, v_conn in connections.items()})
+            for v_name, (v_id, length, connections) in vertex_info.items()})
+        self.__freeze_arrays()
+
+    def get_next_ends(self, v_name, v_end):
+        """
+        :return: tuple of the (next_name, next_end) connected to the v_end of v_name, sorted
+        """
+        return self.__next_ends[(v_name, v_end)]
+
+    def get_edge_codes(self):
+        """
+        :return: arrays of the end codes of both sides of all connections, each connection recorded from both sides
+        """
+        return np.repeat(np.arange(len(self.degrees), dtype=np.int64), self.degrees), self.next_codes
@@ -2,46 +2,113 @@
 from loguru import logger
 from scipy import optimize
 from collections import OrderedDict
-from traversome.utils import LogLikeFuncInfo, Criterion, aic, bic, run_dill_encoded, setup_logger
+from traversome.utils import LogLikeFuncInfo, Criterion, aic, bic, setup_logger
+from traversome.ModelGenerator import MultinomialNegLogLike
 import numpy as np
 import symengine
-from multiprocessing import Manager, Pool
-import sys
-import traceback
+from multiprocessing import Pool
 # import pickle
-import dill
 from typing import OrderedDict as typingODict
 from typing import Union, Set
 # from math import inf
 np.seterr(divide="ignore", invalid="ignore")
 
 
-def minimize_neg_likelihood(neg_loglike_func, num_variables, verbose, err_queue=None):
+def minimize_neg_likelihood(
+        neg_loglike_func,
+        num_variables,
+        verbose,
+        err_queue=None,
+        solver="slsqp",
+        min_success_runs=6,
+        max_runs=10000,
+        start_props=None,
+        np_random=None):
+    """
+    :param neg_loglike_func: scipy style negative log-likelihood function.
+        If the function provides gradient(x) and hessp(x, p) (e.g. ModelGenerator.MultinomialNegLogLike),
+        the exact derivatives will be used instead of finite differences.
+    :param num_variables: number of variant proportions
+    :param verbose:
+    :param err_queue:
+    :param solver:
+        slsqp: Sequential Least Squares Programming with exact gradient if available
+        trust-constr: trust region method with exact gradient and Hessian-vector product if available
+        em: expectation-maximization (multiplicative updates), requiring neg_loglike_func.em_step
+    :param min_success_runs: number of successful runs from different random initials, the best one is kept
+    :param max_runs: maximum number of runs
+    :param start_props: initial proportions of the first run (warm start), following runs start randomly
+    :param np_random: numpy.random.RandomState object for the random initials, the global numpy one by default
+    :return: scipy.optimize.OptimizeResult of the best run or False if all runs failed
+    """
     try:
         # logger.info("   loading picked function ..")
         # if isinstance(neg_loglike_func, str):
         #     with open(neg_loglike_func, "rb") as input_handler:
         #         neg_loglike_func = pickle.load(input_handler)
         # logger.info("   searching for ml result ..")
-        # all proportions should be in range [0, 1] and sum up to 1.
-        constraints = ({"type": "eq", "fun": lambda x: sum(x) - 1})  # what if we relax this?
-        other_optimization_options = {"disp": verbose, "maxiter": 1000, "ftol": 1.0e-5, "eps": 1.0e-8}
+        gradient = getattr(neg_loglike_func, "gradient", None)
+        hessp = getattr(neg_loglike_func, "hessp", None)
+        if gradient:
+            # optimize the per-observation form, otherwise the large function values and gradients of a big sample
+            # make SLSQP/trust-constr stop at the initial point
+            scale = float(neg_loglike_func.sample_size)
+            fun = lambda x: neg_loglike_func(x) / scale
+            jac = lambda x: gradient(x) / scale
+            hessp = (lambda x, p: neg_loglike_func.hessp(x, p) / scale) if hessp else None
+        else:
+            scale = 1.
+            fun = neg_loglike_func
+            jac = False
+        if solver == "slsqp":
+            # all proportions should be in range [0, 1] and sum up to 1.
+            constraints = ({"type": "eq", "fun": lambda x: sum(x) - 1,
+                            "jac": lambda x: np.ones(num_variables)})  # what if we relax this?
+            other_optimization_options = {"disp": verbose, "maxiter": 1000, "ftol": 1.0e-5 / scale, "eps": 1.0e-8}
+        elif solver == "trust-constr":
+            constraints = optimize.LinearConstraint(np.ones((1, num_variables)), 1., 1.)
+            other_optimization_options = {"disp": verbose, "maxiter": 1000, "gtol": 1.0e-12, "xtol": 1.0e-12}
+        elif solver == "em":
+            if not hasattr(neg_loglike_func, "em_step"):
+                raise ValueError("EM solver requires the numeric likelihood backend!")
+        else:
+            raise ValueError("Invalid solver {}".format(solver))
+        np_random = np.random if np_random is None else np_random
         count_run = 0
         success_runs = []
-        while count_run < 10000:
-            initials = np.random.random(num_variables)
-            initials /= sum(initials)
+        while count_run < max_runs:
+            if count_run == 0 and start_props is not None:
+                initials = np.array(start_props, dtype=np.float64)
+            else:
+                initials = np_random.random(num_variables)
+                initials /= sum(initials)
             # logger.debug("initials", initials)
             # np.full(shape=num_put_variants, fill_value=float(1. / num_put_variants), dtype=np.float)
-            result = optimize.minimize(
-                fun=neg_loglike_func,
-                x0=initials,
-                jac=False, method='SLSQP', bounds=[(0., 1.0)] * num_variables, constraints=constraints,
-                options=other_optimization_options)
-            # bounds=[(-1.0e-9, 1.0)] * num_variants will violate bound constraints and cause ValueError
+            if solver == "slsqp":
+                result = optimize.minimize(
+                    fun=fun,
+                    x0=initials,
+                    jac=jac,
+                    method='SLSQP', bounds=[(0., 1.0)] * num_variables, constraints=constraints,
+                    options=other_optimization_options)
+                # bounds=[(-1.0e-9, 1.0)] * num_variants will violate bound constraints and cause ValueError
+                result.fun = result.fun * scale
+            elif solver == "trust-constr":
+                result = optimize.minimize(
+                    fun=fun,
+                    x0=initials,
+                    jac=jac if gradient else "2-point",
+                    hessp=hessp,
+                    hess=None if hessp else optimize.BFGS(),
+                    method="trust-constr", bounds=optimize.Bounds(0., 1., keep_feasible=True),
+                    constraints=constraints,
+                    options=other_optimization_options)
+                result.fun = result.fun * scale
+            else:
+                result = maximize_likelihood_em(neg_loglike_func, initials, verbose=verbose)
             if result.success:
                 success_runs.append(result)
-                if len(success_runs) > 5:
+                if len(success_runs) >= min_success_runs:
                     break
             count_run += 1
             # sys.stdout.write(str(count_run) + "\b" * len(str(count_run)))
@@ -58,6 +125,68 @@ def minimize_neg_likelihood(neg_loglike_func, num_variables, verbose, err_queue=
             raise e
 
 
+def maximize_likelihood_em(neg_loglike_func, initials, max_iter=100000, ftol=1.0e-12, xtol=1.0e-10, verbose=False):
+    """
+    Expectation-maximization for the variant proportions, which stay on the simplex by construction.
+    Components with zero proportion converge to zero slowly, so this is best suited to well-supported variants.
+    :param neg_loglike_func: function with em_step(x), e.g. ModelGenerator.MultinomialNegLogLike
+    :param initials: initial proportions
+    :return: scipy.optimize.OptimizeResult
+    """
+    this_x = np.asarray(initials, dtype=np.float64)
+    this_fun = neg_loglike_func(this_x)
+    converged = False
+    go_iter = 0
+    for go_iter in range(1, max_iter + 1):
+        next_x = neg_loglike_func.em_step(this_x)
+        next_fun = neg_loglike_func(next_x)
+        delta_x = np.abs(next_x - this_x).max()
+        delta_fun = this_fun - next_fun
+        this_x, this_fun = next_x, next_fun
+        if delta_x < xtol or abs(delta_fun) <= ftol * max(1., abs(this_fun)):
+            converged = True
+            break
+    if verbose:
+        logger.trace("EM stopped after {} iterations, converged: {}".format(go_iter, converged))
+    return optimize.OptimizeResult(
+        x=this_x, fun=this_fun, success=converged and np.isfinite(this_fun), nit=go_iter,
+        message="converged" if converged else "maximum number of iterations reached")
+
+
+# numeric likelihood data of a drop-one test worker, set once per process by _init_drop_test_worker
+_drop_test_data = {}
+
+
+def _init_drop_test_worker(bin_weights, bin_observations, variant_sizes, solver, min_success_runs, verbose):
+    _drop_test_data["bin_weights"] = bin_weights
+    _drop_test_data["bin_observations"] = bin_observations
+    _drop_test_data["variant_sizes"] = variant_sizes
+    _drop_test_data["solver"] = solver
+    _drop_test_data["min_success_runs"] = min_success_runs
+    _drop_test_data["verbose"] = verbose
+
+
+def _test_one_drop_task(task):
+    """
+    :param task: (dropped variant id, remaining variant ids sorted, warm start proportions or None, random seed)
+    :return: (dropped variant id, scipy.optimize.OptimizeResult or False, sample size)
+    """
+    var_id, variant_ids, start_props, random_seed = task
+    neg_loglike_func = MultinomialNegLogLike(
+        bin_weights=_drop_test_data["bin_weights"][:, variant_ids],
+        bin_observations=_drop_test_data["bin_observations"],
+        variant_sizes=_drop_test_data["variant_sizes"][variant_ids])
+    success_run = minimize_neg_likelihood(
+        neg_loglike_func=neg_loglike_func,
+        num_variables=len(variant_ids),
+        verbose=_drop_test_data["verbose"],
+        solver=_drop_test_data["solver"],
+        min_success_runs=1 if start_props is not None else _drop_test_data["min_success_runs"],
+        start_props=start_props,
+        np_random=np.random.RandomState(random_seed))
+    return var_id, success_run, neg_loglike_func.sample_size
+
+
 class ModelFitMaxLike(object):
     """
     Find the parameters (variant proportions) to maximize the likelihood
@@ -71,7 +200,24 @@ class ModelFitMaxLike(object):
                  repr_to_merged_variants,
                  be_unidentifiable_to,
                  loglevel="INFO",
-                 bootstrap_mode=False):
+                 bootstrap_mode=False,
+                 like_backend="numeric",
+                 solver="slsqp",
+                 min_success_runs=6,
+                 warm_start=False,
+                 np_random=None):
+        """
+        :param like_backend:
+            numeric: evaluate the likelihood with sparse matrix products (PathMultinomialModel.get_neg_loglike_func)
+            symengine: compile the symbolic likelihood formula (PathMultinomialModel.get_like_formula)
+        :param solver: slsqp, trust-constr or em (numeric backend only). See minimize_neg_likelihood.
+        :param min_success_runs: number of successful optimization runs from random initials for each fitting
+        :param warm_start: during reverse model selection, refit each reduced model once from the proportions of its
+            parent model instead of from min_success_runs random initials
+        :param np_random: numpy.random.RandomState object for the random initials and the random orders of the tests,
+            the global numpy one by default
+        """
+        assert like_backend in ("numeric", "symengine"), "Invalid likelihood backend {}".format(like_backend)
         self.model = model
         self.variant_paths = variant_paths
         self.num_put_variants = len(variant_paths)
@@ -82,6 +228,11 @@ class ModelFitMaxLike(object):
         self.be_unidentifiable_to = be_unidentifiable_to
         self.loglevel = loglevel
         self.bootstrap_mode = bootstrap_mode
+        self.like_backend = like_backend
+        self.solver = solver
+        self.min_success_runs = min_success_runs
+        self.warm_start = warm_start
+        self.np_random = np.random if np_random is None else np_random
         # self.graph = traversome_obj.graph
         # self.variant_sizes = traversome_obj.variant_sizes
         # self.align_len_at_path_sorted = traversome_obj.align_len_at_path_sorted
@@ -95,6 +246,8 @@ class ModelFitMaxLike(object):
         self.pe_best_proportions = None
 
         self.__warning_sent = False
+        # the worker pool of the drop-one tests, kept from the first use until the end of a reverse model selection
+        self.__drop_test_pool = None
 
     def point_estimate(self,
                        chosen_ids: set = None,
@@ -125,7 +278,10 @@ class ModelFitMaxLike(object):
         success_run = minimize_neg_likelihood(
             neg_loglike_func=self.pe_neg_loglike_obj.loglike_func,
             num_variables=len(chosen_ids),
-            verbose=self.loglevel in ("TRACE", "ALL"))
+            verbose=self.loglevel in ("TRACE", "ALL"),
+            solver=self.solver,
+            min_success_runs=self.min_success_runs,
+            np_random=self.np_random)
         # TODO: we added chosen_ids_set at 2022-11-15, the result may be need to be checked
         if success_run:
             use_prop, echo_prop, this_like, this_criteria = \
@@ -196,119 +352,95 @@ class ModelFitMaxLike(object):
         self.__drop_zero_variants(chosen_ids, previous_prop, previous_echo, diff_tolerance, indispensable_ids)
 
         # stepwise
-        while len(chosen_ids) > 1:
-            logger.debug("Trying dropping {} variant(s) ..".format(self.num_put_variants - len(chosen_ids) + 1))
-            chosen_ids_sorted = sorted(chosen_ids)
-            chosen_rd_list = list(range(len(chosen_ids_sorted)))
-            np.random.shuffle(chosen_rd_list)
-            changed = False
-            # TODO, better enumerate
-            rs = random_size if random_size > 0 else len(chosen_rd_list)
-            for go_rd_sp in range(0, len(chosen_rd_list), rs):
-                this_rd_ids = chosen_rd_list[go_rd_sp: go_rd_sp+rs]
-                test_id_res = OrderedDict()
-                if n_proc == 1:
-                    for rd_id in this_rd_ids:
-                        self.__test_one_drop(
-                            var_id=chosen_ids_sorted[rd_id],
+        try:
+            while len(chosen_ids) > 1:
+                logger.debug("Trying dropping {} variant(s) ..".format(self.num_put_variants - len(chosen_ids) + 1))
+                chosen_ids_sorted = sorted(chosen_ids)
+                chosen_rd_list = list(range(len(chosen_ids_sorted)))
+                self.np_random.shuffle(chosen_rd_list)
+                parent_props = self.__get_representative_props(previous_prop, chosen_ids) if self.warm_start else None
+                changed = False
+                # TODO, better enumerate
+                rs = random_size if random_size > 0 else len(chosen_rd_list)
+                for go_rd_sp in range(0, len(chosen_rd_list), rs):
+                    this_rd_ids = chosen_rd_list[go_rd_sp: go_rd_sp+rs]
+                    test_id_res = OrderedDict()
+                    if n_proc == 1 or self.like_backend != "numeric":
+                        # the compiled symbolic functions cannot be shipped to the pool workers
+                        for rd_id in this_rd_ids:
+                            self.__test_one_drop(
+                                var_id=chosen_ids_sorted[rd_id],
+                                chosen_ids=chosen_ids,
+                                sorted_chosen_ids=chosen_ids_sorted,
+                                criterion=criterion,
+                                test_id_res=test_id_res,
+                                indispensable_ids=indispensable_ids,
+                                parent_props=parent_props)
+                    else:
+                        if self.__drop_test_pool is None:
+                            self.__drop_test_pool = self.__start_drop_test_pool(n_proc)
+                        self.__test_drops_in_pool(
+                            pool_obj=self.__drop_test_pool,
+                            var_ids=[chosen_ids_sorted[rd_id] for rd_id in this_rd_ids],
                             chosen_ids=chosen_ids,
                             sorted_chosen_ids=chosen_ids_sorted,
                             criterion=criterion,
                             test_id_res=test_id_res,
-                            indispensable_ids=indispensable_ids)
-                else:
-                    # TODO
-                    manager = Manager()
-                    error_queue = manager.Queue()
-                    event = manager.Event()
-                    lock = manager.Lock()
-                    global_vars = manager.Namespace()
-                    global_vars.w_id = 0  # worker id
-                    global_vars.recorded_ids = manager.list()
-                    global_vars.prop = manager.list()
-                    global_vars.echo = manager.list()
-                    global_vars.loglike = manager.list()
-                    global_vars.criterion = manager.list()
-                    global_vars.finished_w = 0
-                    global_vars.indispensable_ids = manager.dict()
-                    global_vars.indispensable_ids.update(indispensable_ids)
-                    if self.bootstrap_mode:
-                        logger.debug("Serializing traversome for multiprocessing ..")
-                    else:
-                        logger.info("Serializing traversome for multiprocessing ..")
-                    payload = dill.dumps((self.__test_one_drop_worker,
-                                          (this_rd_ids, chosen_ids, criterion, global_vars, lock, event, error_queue)))
-                    pool_obj = Pool(processes=n_proc)
-                    job_list = []
-                    for go_w in range(len(this_rd_ids)):
-                        # TODO: to fix the issue that the behaviour of the logger in the worker become be different
-                        #       sim.alignment.new.100k.300k.100x.traversome-bic-N1000-user-p
-                        logger.debug("assigning job to worker {}".format(go_w + 1))
-                        job_list.append(pool_obj.apply_async(run_dill_encoded, (payload,)))
-                        logger.debug("assigned job to worker {}".format(go_w + 1))
-                    pool_obj.close()
-                    event.wait()
-                    pool_obj.terminate()
-                    while not error_queue.empty():
-                        e, tb, location = error_queue.get()
-                        logger.error("\n" + "".join(tb))  # + "\n" + str(location) + "\n" + str(e))
-                        sys.exit(0)
-                    # pool.join()
-                    # use the global_vars.recorded_ids to collect the corresponding resultI am
-                    for go_r, var_id in enumerate(list(global_vars.recorded_ids)):
-                        test_id_res[var_id] = \
-                            {"prop": global_vars.prop[go_r], "echo": global_vars.echo[go_r],
-                             "loglike": global_vars.loglike[go_r], criterion: global_vars.criterion[go_r]}
-                    indispensable_ids.update(dict(global_vars.indispensable_ids))
-                if test_id_res:
-                    best_drop_id, best_val = sorted([[_go_var_, test_id_res[_go_var_][criterion]]
-                                                     for _go_var_ in test_id_res],
-                                                    key=lambda x: x[1])[0]
-                    if best_val < previous_criteria:
-                        previous_criteria = best_val
-                        previous_like = test_id_res[best_drop_id]["loglike"]
-                        previous_prop = test_id_res[best_drop_id]["prop"]
-                        previous_echo = test_id_res[best_drop_id]["echo"]
-                        chosen_ids.remove(best_drop_id)
-                        # drop candidate id that minimize criteria
-                        if self.bootstrap_mode:
-                            logger.debug("Drop {}".format(self.__str_rep_id(best_drop_id)))
-                            logger.debug("Proportions: " +
-                                         ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
-                            logger.debug("Log-likelihood: %s" % previous_like)
-                        else:
-                            logger.info("Drop {}".format(self.__str_rep_id(best_drop_id)))
-                            logger.info("Proportions: " +
-                                        ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
-                            logger.info("Log-likelihood: %s" % previous_like)
-                        self.__drop_zero_variants(
-                            chosen_ids, previous_prop, previous_echo, diff_tolerance, indispensable_ids)
-                        changed = True
-                        break
-                    # for var_id in list(chosen_ids_set):
-                    #     if abs(previous_prop[var_id] - 0.) < diff_tolerance:
-                    #         del chosen_ids_set[var_id]
-                    #         for cid_var_id in self.traversome.repr_to_merged_variants[var_id]:
-                    #             del previous_prop[cid_var_id]
-                    #         del previous_echo[self.__str_rep_id(var_id)]
-                    #         logger.info("Drop {}".format(self.__str_rep_id(var_id)))
-                # else:
-                #     logger.info("Proportions: " +
-                #                 ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
-                #     logger.info("Log-likelihood: %s" % previous_like)
-                #     return previous_prop
-
-            if not changed:
-                # if self.bootstrap_str:
-                #     logger.info(f"{self.bootstrap_str} Proportions: " +
-                #                 ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
-                #     logger.debug("Log-likelihood: %s" % previous_like)
-                # else:
-                #     logger.info("Proportions: " +
-                #                 ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
-                #     logger.info("Log-likelihood: %s" % previous_like)
-                self.__echo_res(previous_echo, previous_like)
-                return previous_prop, previous_like, previous_criteria
+                            indispensable_ids=indispensable_ids,
+                            parent_props=parent_props)
+                    if test_id_res:
+                        best_drop_id, best_val = sorted([[_go_var_, test_id_res[_go_var_][criterion]]
+                                                         for _go_var_ in test_id_res],
+                                                        key=lambda x: x[1])[0]
+                        if best_val < previous_criteria:
+                            previous_criteria = best_val
+                            previous_like = test_id_res[best_drop_id]["loglike"]
+                            previous_prop = test_id_res[best_drop_id]["prop"]
+                            previous_echo = test_id_res[best_drop_id]["echo"]
+                            chosen_ids.remove(best_drop_id)
+                            # drop candidate id that minimize criteria
+                            if self.bootstrap_mode:
+                                logger.debug("Drop {}".format(self.__str_rep_id(best_drop_id)))
+                                logger.debug("Proportions: " +
+                                             ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
+                                logger.debug("Log-likelihood: %s" % previous_like)
+                            else:
+                                logger.info("Drop {}".format(self.__str_rep_id(best_drop_id)))
+                                logger.info("Proportions: " +
+                                            ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
+                                logger.info("Log-likelihood: %s" % previous_like)
+                            self.__drop_zero_variants(
+                                chosen_ids, previous_prop, previous_echo, diff_tolerance, indispensable_ids)
+                            changed = True
+                            break
+                        # for var_id in list(chosen_ids_set):
+                        #     if abs(previous_prop[var_id] - 0.) < diff_tolerance:
+                        #         del chosen_ids_set[var_id]
+                        #         for cid_var_id in self.traversome.repr_to_merged_variants[var_id]:
+                        #             del previous_prop[cid_var_id]
+                        #         del previous_echo[self.__str_rep_id(var_id)]
+                        #         logger.info("Drop {}".format(self.__str_rep_id(var_id)))
+                    # else:
+                    #     logger.info("Proportions: " +
+                    #                 ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
+                    #     logger.info("Log-likelihood: %s" % previous_like)
+                    #     return previous_prop
+
+                if not changed:
+                    # if self.bootstrap_str:
+                    #     logger.info(f"{self.bootstrap_str} Proportions: " +
+                    #                 ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
+                    #     logger.debug("Log-likelihood: %s" % previous_like)
+                    # else:
+                    #     logger.info("Proportions: " +
+                    #                 ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
+                    #     logger.info("Log-likelihood: %s" % previous_like)
+                    self.__echo_res(previous_echo, previous_like)
+                    return previous_prop, previous_like, previous_criteria
+        finally:
+            # also release the pool workers when the selection fails or is interrupted
+            self.__close_drop_test_pool()
+
         # use a slightly higher log level
         # logger.log("RES", "Proportions: " + ", ".join(["%s:%.4f" % (_id, _p) for _id, _p, in previous_echo.items()]))
         # if self.bootstrap_str:
@@ -346,7 +478,9 @@ class ModelFitMaxLike(object):
                 else:
                     logger.info("Drop {}".format(self.__str_rep_id(var_id)))
 
-    def __test_one_drop(self, var_id, chosen_ids: set, sorted_chosen_ids, criterion, test_id_res, indispensable_ids):
+    def __test_one_drop(
+            self, var_id, chosen_ids: set, sorted_chosen_ids, criterion, test_id_res, indispensable_ids,
+            parent_props=None):
         if var_id not in indispensable_ids:
             testing_ids = chosen_ids - {var_id}
             if self.cover_all_observed_subpaths(testing_ids):
@@ -354,7 +488,8 @@ class ModelFitMaxLike(object):
                     "Test variants [{}] - {}".
                         format(", ".join([self.__str_rep_id(_c_i)
                                           for _c_i in sorted_chosen_ids]), self.__str_rep_id(var_id)))
-                res_list = self.__compute_like_and_criteria(chosen_id_set=testing_ids, criteria=criterion)
+                res_list = self.__compute_like_and_criteria(
+                    chosen_id_set=testing_ids, criteria=criterion, parent_props=parent_props)
                 test_id_res[var_id] = \
                     {"prop": res_list[0], "echo": res_list[1], "loglike": res_list[2], criterion: res_list[3]}
             else:
@@ -369,93 +504,102 @@ class ModelFitMaxLike(object):
                 .format(", ".join([self.__str_rep_id(_c_i)
                                    for _c_i in sorted_chosen_ids]), self.__str_rep_id(var_id)))
 
-    def __test_one_drop_worker(
-            self,
-            this_rd_ids,
-            chosen_ids_set: set,
-            criterion,
-            g_vars,
-            lock,
-            event,
-            error_queue):
-        try:
-            lock.acquire()
-            w_id = g_vars.w_id
-            g_vars.w_id += 1
-            lock.release()
-            sorted_chosen_ids = sorted(chosen_ids_set)
-            # use the worker id to pick a unique rd_id for each job,
-            # then use the unique rd_id to randomly pick a var_id from the sorted_chosen_ids
-            var_id = sorted_chosen_ids[this_rd_ids[w_id]]
-            if var_id not in g_vars.indispensable_ids:
-                testing_ids = chosen_ids_set - {var_id}
-                if self.cover_all_observed_subpaths(testing_ids):
-                    logger.debug(
-                        "Test variants [{}] - {}".
-                            format(", ".join([self.__str_rep_id(_c_i)
-                                              for _c_i in sorted_chosen_ids]), self.__str_rep_id(var_id)))
-                    res_list = self.__compute_like_and_criteria(chosen_id_set=testing_ids, criteria=criterion)
-                    lock.acquire()
-                    g_vars.recorded_ids.append(var_id)
-                    g_vars.prop.append(res_list[0])
-                    g_vars.echo.append(res_list[1])
-                    g_vars.loglike.append(res_list[2])
-                    g_vars.criterion.append(res_list[3])
-                    lock.release()
-                    # logger.debug("Generating the likelihood function .. ")
-                    # neg_loglike_func_obj = self.get_neg_likelihood_of_var_freq(within_variant_ids=testing_ids)
-                    # logger.info("Maximizing the likelihood function for {} variants".format(len(testing_ids)))
-                    # # with open("/tmp/traversome." + str(var_id), "wb") as output_h:
-                    # #     pickle.dump(neg_loglike_func_obj.loglike_func, output_h)
-                    # minimize_neg_likelihood,
-                    #                                  (neg_loglike_func_obj,
-                    #                                   len(testing_ids),
-                    #                                   self.traversome.loglevel in ("TRACE", "ALL"),
-                    #                                   # error_queue
-                    #                                   )))
-                    # job_var_ids.append((testing_ids, neg_loglike_func_obj, var_id))
-                    # # # TypeError("cannot pickle 'module' object")
-                    # # job_list.append(pool.apply_async(self.__compute_like_and_criteria, (testing_ids, criterion)))
-                    # # job_var_ids.append(var_id)
+    def __start_drop_test_pool(self, n_proc):
+        """
+        Start a pool whose workers receive the numeric likelihood data once, see _init_drop_test_worker
+        """
+        bin_weights, bin_observations = self.model.get_observed_like_arrays()
+        if self.bootstrap_mode:
+            logger.debug("Starting {} processes for the drop-one tests ..".format(n_proc))
+        else:
+            logger.info("Starting {} processes for the drop-one tests ..".format(n_proc))
+        return Pool(
+            processes=n_proc,
+            initializer=_init_drop_test_worker,
+            initargs=(bin_weights,
+                      bin_observations,
+                      np.array(self.model.variant_sizes, dtype=np.float64),
+                      self.solver,
+                      self.min_success_runs,
+                      self.loglevel in ("TRACE", "ALL")))
+
+    def __close_drop_test_pool(self):
+        if self.__drop_test_pool is not None:
+            self.__drop_test_pool.close()
+            self.__drop_test_pool.join()
+            self.__drop_test_pool = None
+
+    def __test_drops_in_pool(
+            self, pool_obj, var_ids, chosen_ids: set, sorted_chosen_ids, criterion, test_id_res, indispensable_ids,
+            parent_props=None):
+        """
+        Parallel version of self.__test_one_drop over var_ids.
+        Coverage checks are done here, only the likelihood maximizations are sent to the workers.
+        Each task carries its own random seed and the results are collected in the order of var_ids,
+        so that the result does not depend on the scheduling of the workers.
+        """
+        tasks = []
+        for var_id in var_ids:
+            if var_id in indispensable_ids:
+                logger.debug(
+                    "Test variants [{}] - {}: skipped for necessary subpath(s) (case **)"
+                    .format(", ".join([self.__str_rep_id(_c_i)
+                                       for _c_i in sorted_chosen_ids]), self.__str_rep_id(var_id)))
+                continue
+            testing_ids = chosen_ids - {var_id}
+            if self.cover_all_observed_subpaths(testing_ids):
+                logger.debug(
+                    "Test variants [{}] - {}".
+                        format(", ".join([self.__str_rep_id(_c_i)
+                                          for _c_i in sorted_chosen_ids]), self.__str_rep_id(var_id)))
+                variant_ids = sorted(testing_ids)
+                if parent_props:
+                    start_props = self.__get_warm_start(parent_props, variant_ids)
                 else:
-                    lock.acquire()
-                    g_vars.indispensable_ids[var_id] = True
-                    lock.release()
-                    logger.debug(
-                        "Test variants [{}] - {}: skipped for necessary subpath(s) (case *)"
-                            .format(", ".join([self.__str_rep_id(_c_i)
-                                               for _c_i in sorted_chosen_ids]), self.__str_rep_id(var_id)))
+                    start_props = None
+                tasks.append((var_id, variant_ids, start_props, self.np_random.randint(0, 2 ** 31 - 1)))
             else:
+                indispensable_ids[var_id] = True
                 logger.debug(
-                    "Test variants [{}] - {}: skipped for necessary subpath(s) (case **)"
+                    "Test variants [{}] - {}: skipped for necessary subpath(s) (case *)"
                     .format(", ".join([self.__str_rep_id(_c_i)
                                        for _c_i in sorted_chosen_ids]), self.__str_rep_id(var_id)))
-        except Exception as e:
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-            location = traceback.extract_tb(exc_traceback)[-1]
-            error_queue.put((e, tb, location))
-            event.set()
-            return
-        lock.acquire()
-        g_vars.finished_w += 1
-        lock.release()
-        # sent terminal signal if the last var_id was finished
-        # logger.debug("chosen_ids_set:g_vars.finished_w={}:{}".format(len(this_rd_ids), g_vars.finished_w))
-        if len(this_rd_ids) == g_vars.finished_w:
-            event.set()
-
-    def __compute_like_and_criteria(self, chosen_id_set, criteria):
+        for var_id, success_run, sample_size in pool_obj.imap(_test_one_drop_task, tasks):
+            testing_ids = chosen_ids - {var_id}
+            res_list = self.__summarize_like_and_criteria(
+                success_run, testing_ids, criterion,
+                LogLikeFuncInfo(variable_size=len(testing_ids), sample_size=sample_size))
+            test_id_res[var_id] = \
+                {"prop": res_list[0], "echo": res_list[1], "loglike": res_list[2], criterion: res_list[3]}
+
+    def __compute_like_and_criteria(self, chosen_id_set, criteria, parent_props=None):
+        """
+        :param parent_props: {representative_id: proportion} of the parent model for a warm start
+        """
         logger.debug("Generating the likelihood function .. ")
         neg_loglike_func_obj = self.get_neg_likelihood_of_var_freq(within_variant_ids=chosen_id_set)
         if self.bootstrap_mode:
             logger.debug("Maximizing the likelihood function for {} variants".format(len(chosen_id_set)))
         else:
             logger.info("Maximizing the likelihood function for {} variants".format(len(chosen_id_set)))
-        success_run = minimize_neg_likelihood(
-            neg_loglike_func=neg_loglike_func_obj.loglike_func,
-            num_variables=len(chosen_id_set),
-            verbose=self.loglevel in ("TRACE", "ALL"))
+        if parent_props:
+            start_props = self.__get_warm_start(parent_props, sorted(chosen_id_set))
+            success_run = minimize_neg_likelihood(
+                neg_loglike_func=neg_loglike_func_obj.loglike_func,
+                num_variables=len(chosen_id_set),
+                verbose=self.loglevel in ("TRACE", "ALL"),
+                solver=self.solver,
+                min_success_runs=1,
+                start_props=start_props,
+                np_random=self.np_random)
+        else:
+            success_run = minimize_neg_likelihood(
+                neg_loglike_func=neg_loglike_func_obj.loglike_func,
+                num_variables=len(chosen_id_set),
+                verbose=self.loglevel in ("TRACE", "ALL"),
+                solver=self.solver,
+                min_success_runs=self.min_success_runs,
+                np_random=self.np_random)
         return self.__summarize_like_and_criteria(success_run, chosen_id_set, criteria, neg_loglike_func_obj)
 
     # def __compute_like_and_criteria_1(self, chosen_id_set):
@@ -509,10 +653,28 @@ class ModelFitMaxLike(object):
         use_prop = OrderedDict([(_id, prop_dict[_id]) for _id in sorted(prop_dict)])
         return use_prop, echo_prop
 
+    @staticmethod
+    def __get_warm_start(parent_props, variant_ids):
+        start_props = np.array([parent_props[var_id] for var_id in variant_ids])
+        # keep the start inside the simplex, because a zero proportion will never grow in EM
+        return 0.999 * start_props / start_props.sum() + 0.001 / len(variant_ids)
+
+    def __get_representative_props(self, variant_props, chosen_ids):
+        """
+        :param variant_props: {variant_id: proportion} as returned by self.__summarize_run_prop
+        :return: {representative_id: proportion}
+        """
+        return {rep_id: sum([variant_props[cid_var_id] for cid_var_id in self.repr_to_merged_variants[rep_id]])
+                for rep_id in chosen_ids}
+
     def __str_rep_id(self, rep_id):
         return "+".join([f"cid_{_cid_var_id}" for _cid_var_id in self.repr_to_merged_variants[rep_id]])
 
     def get_neg_likelihood_of_var_freq(self, within_variant_ids: set = None, scipy_style=True):
+        if self.like_backend == "numeric":
+            # no formula construction and compilation
+            # the function always takes a single array argument, so scipy_style makes no difference here
+            return self.model.get_neg_loglike_func(within_variant_ids=within_variant_ids)
         # log_like_formula = self.traversome.get_likelihood_binomial_formula(
         #     self.variant_percents,
         #     log_func=sympy.log,
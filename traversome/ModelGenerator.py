@@ -2,17 +2,30 @@
 from typing import Set
 from collections import OrderedDict
 from loguru import logger
-from traversome.utils import LogLikeFormulaInfo
+from traversome.utils import LogLikeFormulaInfo, LogLikeFuncInfo
+from scipy import sparse
+import numpy as np
 
 
 class PathMultinomialModel:
-    def __init__(self, variant_sizes, variant_topos, bins_list, all_sub_paths):
+    def __init__(self, variant_sizes, variant_topos, bins_list, all_sub_paths, bin_arrays=None):
+        """
+        :param bins_list: list of Bins objects, generated from bin_arrays on demand if None
+        :param bin_arrays: BinArrays object, from which the numeric likelihood is built without Bins objects
+        """
         self.variant_sizes = variant_sizes
         self.variant_topos = variant_topos
         self.num_put_variants = len(variant_sizes)
         self.bins_list = bins_list
+        self.bin_arrays = bin_arrays
         self.all_sub_paths = all_sub_paths  # only used for assessing read_path coverage
         self.sample_size = None
+        # numeric form of the likelihood, see self.get_like_arrays()
+        self.__bin_weights = None
+        self.__bin_observations = None
+        # rows of the observed bins, shared by the likelihood functions of all variant subsets
+        self.__observed_weights = None
+        self.__observed_counts = None
 
     def get_like_formula_old(self, variant_percents, log_func, within_variant_ids: Set = None):
         """
@@ -136,19 +149,7 @@ class PathMultinomialModel:
                 total_length += variant_percents[go_variant] * float(go_length)
 
         # clean zero expectations to avoid nan formula
-        check_a = 0
-        while check_a < len(self.bins_list):
-            bins = self.bins_list[check_a]
-            check_b = 0
-            while check_b < len(bins.rp_bins):
-                if bins.rp_bins[check_b].num_possible_X < 1:
-                    del bins.rp_bins[check_b]
-                else:
-                    check_b += 1
-            if bins.rp_bins:
-                check_a += 1
-            else:
-                del self.bins_list[check_a]
+        self.__clean_zero_expectations()
 
         # sub path possible matches
         logger.debug("  Formulating the probabilities ..")
@@ -176,3 +177,150 @@ class PathMultinomialModel:
         self.sample_size = sum(bin_observations)
 
         return LogLikeFormulaInfo(loglike_expression, variable_size, self.sample_size)
+
+    def __clean_zero_expectations(self):
+        if self.bins_list is None:
+            self.bins_list = self.bin_arrays.to_bins_list()
+        check_a = 0
+        while check_a < len(self.bins_list):
+            bins = self.bins_list[check_a]
+            check_b = 0
+            while check_b < len(bins.rp_bins):
+                if bins.rp_bins[check_b].num_possible_X < 1:
+                    del bins.rp_bins[check_b]
+                else:
+                    check_b += 1
+            if bins.rp_bins:
+                check_a += 1
+            else:
+                del self.bins_list[check_a]
+
+    def get_like_arrays(self):
+        """numeric form of self.get_like_formula, generated once per model
+        :return: bin_weights, bin_observations
+             bin_weights: scipy.sparse.csc_matrix of shape (num_bins, num_put_variants), num_possible_X * sp_freq
+             bin_observations: numpy.ndarray of shape (num_bins,), num_matched
+        """
+        if self.__bin_weights is None and self.bin_arrays is not None:
+            # clean zero expectations
+            valid = self.bin_arrays.num_possible_X >= 1
+            valid_sp_ids = self.bin_arrays.sp_ids[valid]
+            # sub-path frequencies in each variant, only of the sub-paths in the bins
+            used_sp_ids = np.unique(valid_sp_ids)
+            rows, cols, sp_freqs = [], [], []
+            for go_row, go_sp in enumerate(used_sp_ids.tolist()):
+                for go_variant, sp_freq in self.bin_arrays.sp_from_variants[go_sp].items():
+                    rows.append(go_row)
+                    cols.append(go_variant)
+                    sp_freqs.append(sp_freq)
+            sp_freq_matrix = sparse.csr_matrix(
+                (np.array(sp_freqs, dtype=np.float64), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+                shape=(len(used_sp_ids), self.num_put_variants))
+            self.__bin_weights = sparse.csc_matrix(
+                sp_freq_matrix[np.searchsorted(used_sp_ids, valid_sp_ids)].multiply(
+                    self.bin_arrays.num_possible_X[valid][:, None]))
+            self.__bin_observations = self.bin_arrays.num_matched[valid].astype(np.float64)
+        elif self.__bin_weights is None:
+            self.__clean_zero_expectations()
+            logger.debug("  Formulating the probability matrix ..")
+            rows, cols, weights, bin_observations = [], [], [], []
+            go_bin = 0
+            for bins in self.bins_list:
+                for rp_bin in bins.rp_bins:
+                    for go_variant, sp_freq in rp_bin.from_variants.items():
+                        rows.append(go_bin)
+                        cols.append(go_variant)
+                        weights.append(sp_freq * rp_bin.num_possible_X)
+                    bin_observations.append(rp_bin.num_matched)
+                    go_bin += 1
+            # duplicated (row, col) entries are summed up
+            self.__bin_weights = sparse.csc_matrix(
+                (np.array(weights, dtype=np.float64), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+                shape=(go_bin, self.num_put_variants))
+            self.__bin_observations = np.array(bin_observations, dtype=np.float64)
+        return self.__bin_weights, self.__bin_observations
+
+    def get_observed_like_arrays(self):
+        """self.get_like_arrays restricted to the bins with observations, which are the only bins in the likelihood
+        :return: bin_weights (scipy.sparse.csc_matrix), bin_observations (numpy.ndarray)
+        """
+        if self.__observed_weights is None:
+            bin_weights, bin_observations = self.get_like_arrays()
+            observed = bin_observations > 0
+            self.__observed_weights = sparse.csc_matrix(sparse.csr_matrix(bin_weights)[observed])
+            self.__observed_counts = bin_observations[observed]
+        return self.__observed_weights, self.__observed_counts
+
+    def get_neg_loglike_func(self, within_variant_ids: Set = None):
+        """numeric alternative of compiling -self.get_like_formula, without symbolic computation
+        :param within_variant_ids:
+             constrain the variant testing scope. Test all variants by default.
+                 e.g. set([0, 2])
+        :return: LogLikeFuncInfo object, whose loglike_func takes the proportions of sorted(within_variant_ids)
+        """
+        if not within_variant_ids or within_variant_ids == set(range(self.num_put_variants)):
+            within_variant_ids = None
+        variant_ids = sorted(within_variant_ids) if within_variant_ids else list(range(self.num_put_variants))
+        observed_weights, observed_counts = self.get_observed_like_arrays()
+        self.sample_size = observed_counts.sum()
+        # a reduced model (e.g. a drop-one test) only slices the columns of the cached observed bins
+        neg_loglike_func = MultinomialNegLogLike(
+            bin_weights=observed_weights[:, variant_ids],
+            bin_observations=observed_counts,
+            variant_sizes=np.array([self.variant_sizes[go_v] for go_v in variant_ids], dtype=np.float64))
+        return LogLikeFuncInfo(
+            loglike_func=neg_loglike_func, variable_size=len(variant_ids), sample_size=self.sample_size)
+
+
+class MultinomialNegLogLike(object):
+    """
+    Negative log-likelihood of the variant proportions x (scipy style, single array argument):
+        -sum_b(num_matched_b * log(sum_v(x_v * num_possible_X_b * sp_freq_bv) / sum_v(x_v * variant_size_v)))
+    """
+    def __init__(self, bin_weights, bin_observations, variant_sizes):
+        """
+        :param bin_weights: sparse matrix (bins x chosen variants) of num_possible_X * sp_freq
+        :param bin_observations: array of num_matched per bin
+        :param variant_sizes: array of the sizes of chosen variants
+        """
+        # bins without observation contribute nothing to the likelihood
+        observed = bin_observations > 0
+        if observed.all():
+            self.bin_weights = sparse.csr_matrix(bin_weights)
+            self.bin_observations = bin_observations
+        else:
+            self.bin_weights = sparse.csr_matrix(bin_weights)[observed]
+            self.bin_observations = bin_observations[observed]
+        self.variant_sizes = variant_sizes
+        self.sample_size = self.bin_observations.sum()
+
+        self.bin_weights_t = self.bin_weights.T.tocsr()
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        return self.sample_size * np.log(self.variant_sizes.dot(x)) - \
+            self.bin_observations.dot(np.log(self.bin_weights.dot(x)))
+
+    def gradient(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        return self.sample_size / self.variant_sizes.dot(x) * self.variant_sizes - \
+            self.bin_weights_t.dot(self.bin_observations / self.bin_weights.dot(x))
+
+    def hessp(self, x, p):
+        """Hessian-vector product"""
+        x = np.asarray(x, dtype=np.float64)
+        p = np.asarray(p, dtype=np.float64)
+        total_size = self.variant_sizes.dot(x)
+        bin_x = self.bin_weights.dot(x)
+        return -self.sample_size * self.variant_sizes.dot(p) / total_size ** 2 * self.variant_sizes + \
+            self.bin_weights_t.dot(self.bin_observations * self.bin_weights.dot(p) / bin_x ** 2)
+
+    def em_step(self, x):
+        """
+        One expectation-maximization update of the proportions x.
+        With pi_v = x_v * size_v / sum(x * size), the likelihood is a mixture of multinomial distributions with fixed
+        components (weight_bv / size_v) and mixing weights pi, for which EM is a monotone multiplicative update.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        new_x = x * self.bin_weights_t.dot(self.bin_observations / self.bin_weights.dot(x)) / self.variant_sizes
+        return new_x / new_x.sum()
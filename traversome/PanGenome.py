@@ -354,8 +354,8 @@ class PanGenome:
         for go_b, lb in enumerate(self.colinear_blocks):
             if len(lb) == 1:
                 for pid, vid, v_e in lb[0]:
-                    from_pos = self.old_graph.get_path_length(self.old_variant_paths[pid][:vid]) if vid else 1
-                    to_pos = self.old_graph.get_path_length(self.old_variant_paths[pid][:vid + 1])
+                    from_pos = self.old_graph.get_sub_path_length(self.old_variant_paths[pid], 0, vid) if vid else 1
+                    to_pos = self.old_graph.get_sub_path_length(self.old_variant_paths[pid], 0, vid + 1)
                     if v_e:
                         start_pos = from_pos
                         end_pos = to_pos
@@ -375,13 +375,13 @@ class PanGenome:
                 for go_p, (pid, start_vid, v_e) in enumerate(lb[0]):
                     end_vid = lb[-1][go_p][1]
                     if directions[go_p]:
-                        start_pos = self.old_graph.get_path_length(self.old_variant_paths[pid][:start_vid]) + 1 if start_vid else 1  # 1-based
-                        end_pos = self.old_graph.get_path_length(self.old_variant_paths[pid][:end_vid + 1])
+                        start_pos = self.old_graph.get_sub_path_length(self.old_variant_paths[pid], 0, start_vid) + 1 if start_vid else 1  # 1-based
+                        end_pos = self.old_graph.get_sub_path_length(self.old_variant_paths[pid], 0, end_vid + 1)
                         if end_pos < start_pos:
                             end_pos += paths_n_bases[pid]
                     else:
-                        start_pos = self.old_graph.get_path_length(self.old_variant_paths[pid][:start_vid + 1])
-                        end_pos = self.old_graph.get_path_length(self.old_variant_paths[pid][:end_vid]) + 1 if end_vid else 1  # 1-based
+                        start_pos = self.old_graph.get_sub_path_length(self.old_variant_paths[pid], 0, start_vid + 1)
+                        end_pos = self.old_graph.get_sub_path_length(self.old_variant_paths[pid], 0, end_vid) + 1 if end_vid else 1  # 1-based
                         if start_pos < end_pos:
                             start_pos += paths_n_bases[pid]
                     blocks.append([go_b, pid, start_pos, end_pos, abs(end_pos - start_pos) + 1])
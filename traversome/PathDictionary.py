@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""
+Graph-level interning of oriented vertices and paths
+"""
+
+from array import array
+
+
+class PathDictionary(object):
+    """
+    Shared table of integer-encoded paths for one Assembly object.
+
+    Each oriented vertex (name, strand) is encoded as a signed integer: +(vertex_id + 1) for the forward strand
+    and -(vertex_id + 1) for the reverse strand.
+    Each unique path is encoded as a compact int32 byte string and is assigned a path id.
+    The reverse, standardized and circular-standardized forms of each path are resolved through the graph
+    only once and recorded by path id, after which they are O(1) lookups.
+    """
+    def __init__(self, graph):
+        """
+        :param graph: Assembly object, used to resolve the reverse and standardized forms of new paths
+        """
+        self.graph = graph
+        # vertex table
+        self.vertex_names = []
+        self.__name_to_vid = {}
+        self.__v_e_to_code = {}
+        # path table
+        self.__key_to_pid = {}
+        self.__keys = []
+        self.__reverse_pid = array("q")
+        self.__standard_pid = array("q")
+        self.__standard_circ_pid = array("q")
+        # decoded tuples of the paths that have been handed out, so that the same tuple object is shared by callers
+        self.__decoded = {}
+
+    def encode_vertex(self, v_name, v_end):
+        v_e = (v_name, v_end)
+        if v_e not in self.__v_e_to_code:
+            if v_name not in self.__name_to_vid:
+                self.__name_to_vid[v_name] = len(self.vertex_names)
+                self.vertex_names.append(v_name)
+            v_code = self.__name_to_vid[v_name] + 1
+            self.__v_e_to_code[v_e] = v_code if v_end else -v_code
+        return self.__v_e_to_code[v_e]
+
+    def decode_vertex(self, v_code):
+        if v_code > 0:
+            return self.vertex_names[v_code - 1], True
+        else:
+            return self.vertex_names[-v_code - 1], False
+
+    def encode_path(self, input_path):
+        """
+        :param input_path: path=[(name1:str, direction1:bool), (name2:str, direction2:bool), ..]
+        :return: bytes key of the path
+        """
+        v_e_to_code = self.__v_e_to_code
+        try:
+            return array("i", [v_e_to_code[v_e] for v_e in input_path]).tobytes()
+        except KeyError:
+            return array("i", [self.encode_vertex(*v_e) for v_e in input_path]).tobytes()
+
+    def decode_path(self, path_key):
+        return tuple([self.decode_vertex(v_code) for v_code in array("i", path_key)])
+
+    def get_id(self, input_path):
+        """
+        intern the path
+        :param input_path: path=[(name1:str, direction1:bool), (name2:str, direction2:bool), ..]
+        :return: path id
+        """
+        path_key = self.encode_path(input_path)
+        if path_key not in self.__key_to_pid:
+            self.__key_to_pid[path_key] = len(self.__keys)
+            self.__keys.append(path_key)
+            self.__reverse_pid.append(-1)
+            self.__standard_pid.append(-1)
+            self.__standard_circ_pid.append(-1)
+        return self.__key_to_pid[path_key]
+
+    def get_path(self, path_id):
+        """
+        :return: the tuple form of the path, the same object is returned for the same path id
+        """
+        if path_id not in self.__decoded:
+            self.__decoded[path_id] = self.decode_path(self.__keys[path_id])
+        return self.__decoded[path_id]
+
+    def get_codes(self, path_id):
+        """
+        :return: the integer-encoded vertices of the path as an array
+        """
+        return array("i", self.__keys[path_id])
+
+    def reverse_id(self, path_id):
+        if self.__reverse_pid[path_id] == -1:
+            rev_id = self.get_id(self.graph.reverse_path(self.get_path(path_id)))
+            self.__reverse_pid[path_id] = rev_id
+        return self.__reverse_pid[path_id]
+
+    def standardized_id(self, path_id):
+        """
+        path id of Assembly.get_standardized_path
+        """
+        if self.__standard_pid[path_id] == -1:
+            std_id = self.get_id(self.graph.get_standardized_path(self.get_path(path_id)))
+            self.__standard_pid[path_id] = std_id
+        return self.__standard_pid[path_id]
+
+    def standardized_circ_id(self, path_id):
+        """
+        path id of Assembly.get_standardized_path_circ
+        """
+        if self.__standard_circ_pid[path_id] == -1:
+            std_id = self.get_id(self.graph.get_standardized_path_circ(self.get_path(path_id)))
+            self.__standard_circ_pid[path_id] = std_id
+        return self.__standard_circ_pid[path_id]
+
+    def reverse_path(self, input_path):
+        return self.get_path(self.reverse_id(self.get_id(input_path)))
+
+    def get_standardized_path(self, input_path):
+        return self.get_path(self.standardized_id(self.get_id(input_path)))
+
+    def get_standardized_path_circ(self, input_path):
+        return self.get_path(self.standardized_circ_id(self.get_id(input_path)))
+
+    def __contains__(self, input_path):
+        return self.encode_path(input_path) in self.__key_to_pid
+
+    def __len__(self):
+        return len(self.__keys)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Graph-level cache of cumulative vertex lengths and overlaps along paths
+"""
+
+from array import array
+from itertools import accumulate
+
+
+class PathLengths(object):
+    """
+    Prefix sums of the vertex lengths and the overlaps along each queried path of one Assembly object.
+
+    For a path of n vertices, cum_lens[i] is the total length of the first i vertices and
+    cum_ovls[i] is the total overlap between the first i + 1 vertices.
+    After the prefix sums of a path were built once,
+    the length of any of its sub-ranges with or without terminal overlaps is an O(1) lookup.
+    The Assembly object drops this cache whenever the graph is modified.
+    """
+    def __init__(self, graph, max_num_paths=1 << 16):
+        """
+        :param graph: Assembly object
+        :param max_num_paths: the cache is emptied when it holds more paths than this, to bound the memory usage
+        """
+        self.graph = graph
+        self.max_num_paths = max_num_paths
+        self.__v_e_to_code = {}
+        # path key -> (cum_lens, cum_ovls, circular_overlap)
+        self.__prefix_sums = {}
+
+    def __encode_path(self, input_path):
+        v_e_to_code = self.__v_e_to_code
+        try:
+            return array("i", [v_e_to_code[v_e] for v_e in input_path]).tobytes()
+        except KeyError:
+            for v_e in input_path:
+                if v_e not in v_e_to_code:
+                    v_e_to_code[v_e] = len(v_e_to_code)
+            return array("i", [v_e_to_code[v_e] for v_e in input_path]).tobytes()
+
+    def get_prefix_sums(self, input_path):
+        """
+        :param input_path: path=[(name1:str, direction1:bool), (name2:str, direction2:bool), ..]
+        :return: (cum_lens, cum_ovls, circular_overlap),
+            where circular_overlap is the overlap from the last vertex to the first vertex,
+            or None if the path is not circular
+        """
+        path_key = self.__encode_path(input_path)
+        if path_key not in self.__prefix_sums:
+            if len(self.__prefix_sums) >= self.max_num_paths:
+                self.__prefix_sums = {}
+            vertex_info = self.graph.vertex_info
+            cum_lens = list(accumulate([vertex_info[_n].len for _n, _e in input_path], initial=0))
+            cum_ovls = list(accumulate([vertex_info[_n1].connections[_e1][(_n2, not _e2)]
+                                        for (_n1, _e1), (_n2, _e2) in zip(input_path[:-1], input_path[1:])],
+                                       initial=0))
+            last_n, last_e = input_path[-1]
+            first_n, first_e = input_path[0]
+            circular_overlap = vertex_info[last_n].connections[last_e].get((first_n, not first_e), None)
+            self.__prefix_sums[path_key] = cum_lens, cum_ovls, circular_overlap
+        return self.__prefix_sums[path_key]
+
+    def get_sub_path_length(self, input_path, from_id, to_id):
+        """
+        :return: the length of input_path[from_id: to_id], with 0 <= from_id < to_id <= len(input_path)
+        """
+        cum_lens, cum_ovls, circular_overlap = self.get_prefix_sums(input_path)
+        return cum_lens[to_id] - cum_lens[from_id] - (cum_ovls[to_id - 1] - cum_ovls[from_id])
+
+    def get_path_length(self, input_path, adjust_for_cyclic=False):
+        cum_lens, cum_ovls, circular_overlap = self.get_prefix_sums(input_path)
+        if adjust_for_cyclic and circular_overlap is not None:
+            return cum_lens[-1] - cum_ovls[-1] - circular_overlap
+        else:
+            return cum_lens[-1] - cum_ovls[-1]
+
+    def get_path_internal_length(self, input_path, keep_terminal_overlaps=True):
+        num_v = len(input_path)
+        if num_v < 3:
+            return 0
+        cum_lens, cum_ovls, circular_overlap = self.get_prefix_sums(input_path)
+        if keep_terminal_overlaps:
+            return max(cum_lens[num_v - 1] - cum_lens[1] - (cum_ovls[num_v - 2] - cum_ovls[1]), 0)
+        else:
+            return max(cum_lens[num_v - 1] - cum_lens[1] - cum_ovls[num_v - 1], 0)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+"""
+Compact index of the starting and middle sub-paths of read paths
+"""
+
+from array import array
+from collections import deque
+import numpy as np
+
+
+class ReadPathIndex(object):
+    """
+    Suffix array over the integer-encoded read paths in both directions.
+
+    Each oriented read path (read_id, strand) is a sequence of oriented vertex codes in one concatenated text,
+    separated by 0. A query sub-path is located by binary search on the sorted suffixes,
+    and the read paths are then collected from the slice of matching suffixes,
+    so that no tuple is stored for every prefix and every interior window of every read path.
+    All members are numpy arrays, which are shared rather than copied by forked workers.
+    """
+    def __init__(self, read_paths, reverse_paths):
+        """
+        :param read_paths: list of read paths, read_id being the index in the list
+        :param reverse_paths: list of the reverse read paths, in the same order as read_paths
+        """
+        self.__v_e_to_code = {}
+        codes = []
+        seq_ids = []
+        offsets = []
+        self.seq_lens = np.zeros(2 * len(read_paths), dtype=np.int64)
+        for read_id, (forward_path, reverse_path) in enumerate(zip(read_paths, reverse_paths)):
+            # sequence id 2 * read_id + strand, so that sorted sequence ids are sorted (read_id, strand)
+            for strand, this_path in ((False, reverse_path), (True, forward_path)):
+                seq_id = 2 * read_id + int(strand)
+                self.seq_lens[seq_id] = len(this_path)
+                for go_v, v_e in enumerate(this_path):
+                    if v_e not in self.__v_e_to_code:
+                        self.__v_e_to_code[v_e] = len(self.__v_e_to_code) + 1
+                    codes.append(self.__v_e_to_code[v_e])
+                    seq_ids.append(seq_id)
+                    offsets.append(go_v)
+                codes.append(0)
+                seq_ids.append(seq_id)
+                offsets.append(len(this_path))
+        self.text = np.array(codes, dtype=np.int32)
+        self.seq_ids = np.array(seq_ids, dtype=np.int32)
+        self.offsets = np.array(offsets, dtype=np.int32)
+        self.suffix_array = self.__build_suffix_array(self.text, max_len=int(self.seq_lens.max(initial=0)) + 1)
+
+    @staticmethod
+    def __build_suffix_array(text, max_len):
+        """
+        prefix doubling, until the suffixes are sorted by their first max_len codes,
+        which is enough because no query crosses a separator
+        """
+        num_pos = len(text)
+        rank = text.astype(np.int64)
+        sorted_ids = np.argsort(rank, kind="stable")
+        sorted_len = 1
+        while sorted_len < max_len:
+            next_rank = np.full(num_pos, -1, dtype=np.int64)
+            next_rank[:num_pos - sorted_len] = rank[sorted_len:]
+            sorted_ids = np.lexsort((next_rank, rank))
+            is_new = np.ones(num_pos, dtype=np.int64)
+            is_new[0] = 0
+            is_new[1:] = (rank[sorted_ids][1:] != rank[sorted_ids][:-1]) | \
+                         (next_rank[sorted_ids][1:] != next_rank[sorted_ids][:-1])
+            rank = np.empty(num_pos, dtype=np.int64)
+            rank[sorted_ids] = np.cumsum(is_new)
+            sorted_len *= 2
+            if rank[sorted_ids[-1]] == num_pos - 1:
+                break
+        return sorted_ids.astype(np.int64)
+
+    def __encode(self, sub_path):
+        try:
+            return [self.__v_e_to_code[v_e] for v_e in sub_path]
+        except KeyError:
+            return None
+
+    def __find_suffixes(self, query):
+        """
+        :return: text positions of all occurrences of the query
+        """
+        len_q = len(query)
+        text = self.text
+        suffix_array = self.suffix_array
+        # lower bound
+        lo_id, hi_id = 0, len(suffix_array)
+        while lo_id < hi_id:
+            mid_id = (lo_id + hi_id) // 2
+            if text[suffix_array[mid_id]: suffix_array[mid_id] + len_q].tolist() < query:
+                lo_id = mid_id + 1
+            else:
+                hi_id = mid_id
+        from_id = lo_id
+        # upper bound
+        hi_id = len(suffix_array)
+        while lo_id < hi_id:
+            mid_id = (lo_id + hi_id) // 2
+            if text[suffix_array[mid_id]: suffix_array[mid_id] + len_q].tolist() <= query:
+                lo_id = mid_id + 1
+            else:
+                hi_id = mid_id
+        return suffix_array[from_id: lo_id]
+
+    def __to_read_strands(self, positions):
+        return [(seq_id >> 1, bool(seq_id & 1)) for seq_id in np.unique(self.seq_ids[positions]).tolist()]
+
+    def find_middle(self, sub_path):
+        """
+        :param sub_path: tuple of (name, strand)
+        :return: sorted list of (read_id, strand),
+            where the oriented read path contains the sub_path, excluding its first and last vertices
+        """
+        query = self.__encode(sub_path)
+        if not query:
+            return []
+        positions = self.__find_suffixes(query)
+        these_offsets = self.offsets[positions]
+        positions = positions[(these_offsets >= 1) &
+                              (these_offsets + len(query) <= self.seq_lens[self.seq_ids[positions]] - 1)]
+        return self.__to_read_strands(positions)
+
+
+class ReadPathAutomaton(object):
+    """
+    Aho-Corasick automaton over the read paths in both directions, for the read paths starting with a suffix of a path.
+
+    Each trie node is a prefix of some oriented read path, and the automaton state of a path is the longest suffix
+    of the path that is a trie node. Following the output links from that state visits every suffix of the path
+    that some oriented read path starts with and is longer than. The state of an extended path is updated from the
+    new vertices only, so a growing path is never rescanned.
+    The oriented read paths are sorted lexicographically, so that those sharing a prefix form a contiguous range.
+    """
+    def __init__(self, read_paths, reverse_paths):
+        """
+        :param read_paths: list of read paths, read_id being the index in the list
+        :param reverse_paths: list of the reverse read paths, in the same order as read_paths
+        """
+        self.__v_e_to_code = {}
+        oriented_paths = []
+        for read_id, (forward_path, reverse_path) in enumerate(zip(read_paths, reverse_paths)):
+            # sequence id 2 * read_id + strand, as in ReadPathIndex
+            for strand, this_path in ((False, reverse_path), (True, forward_path)):
+                codes = []
+                for v_e in this_path:
+                    if v_e not in self.__v_e_to_code:
+                        self.__v_e_to_code[v_e] = len(self.__v_e_to_code) + 1
+                    codes.append(self.__v_e_to_code[v_e])
+                oriented_paths.append((codes, 2 * read_id + int(strand)))
+        oriented_paths.sort()
+        self.seq_ids = np.array([seq_id for codes, seq_id in oriented_paths], dtype=np.int64)
+        # trie, with the transition from node by code stored as self.__goto[node * self.__code_base + code]
+        self.__code_base = len(self.__v_e_to_code) + 1
+        self.__goto = {}
+        children = [[]]
+        depths = [0]
+        # range of the oriented read paths [range_from, range_to) having the prefix of each node
+        range_from = [0]
+        range_to = [len(oriented_paths)]
+        num_ended = [0]
+        for go_p, (codes, seq_id) in enumerate(oriented_paths):
+            node = 0
+            for code in codes:
+                trans_key = node * self.__code_base + code
+                if trans_key in self.__goto:
+                    next_node = self.__goto[trans_key]
+                else:
+                    next_node = self.__goto[trans_key] = len(depths)
+                    children[node].append((code, next_node))
+                    children.append([])
+                    depths.append(depths[node] + 1)
+                    range_from.append(go_p)
+                    range_to.append(go_p)
+                    num_ended.append(0)
+                range_to[next_node] = go_p + 1
+                node = next_node
+            num_ended[node] += 1
+        # paths equal to the prefix come first in the range, skip them to keep the longer ones only
+        self.__depths = array("q", depths)
+        self.__longer_from = array("q", [r_f + n_e for r_f, n_e in zip(range_from, num_ended)])
+        self.__range_to = array("q", range_to)
+        self.max_depth = max(depths)
+        # failure links and output links, in breadth-first order
+        self.__fail = array("q", [0] * len(depths))
+        self.__output = array("q", [0] * len(depths))
+        waiting_nodes = deque([next_node for code, next_node in children[0]])
+        while waiting_nodes:
+            node = waiting_nodes.popleft()
+            for code, next_node in children[node]:
+                self.__fail[next_node] = fail_node = self.__next(self.__fail[node], code)
+                self.__output[next_node] = \
+                    fail_node if self.__has_longer(fail_node) else self.__output[fail_node]
+                waiting_nodes.append(next_node)
+
+    def __has_longer(self, node):
+        return node != 0 and self.__longer_from[node] < self.__range_to[node]
+
+    def __next(self, state, code):
+        goto = self.__goto
+        while True:
+            next_node = goto.get(state * self.__code_base + code)
+            if next_node is not None:
+                return next_node
+            elif not state:
+                return 0
+            state = self.__fail[state]
+
+    def next_state(self, state, v_e):
+        """
+        :param state: the automaton state of a path, 0 for an empty path
+        :param v_e: the vertex (name, strand) appended to the path
+        :return: the automaton state of the extended path
+        """
+        code = self.__v_e_to_code.get(v_e)
+        if code is None:
+            return 0
+        return self.__next(state, code)
+
+    def iter_starting_matches(self, state):
+        """
+        :param state: the automaton state of a path
+        :return: generator of (overlap_c_num, node), in decreasing overlap_c_num,
+            where some oriented read path starts with but is longer than the path suffix of length overlap_c_num
+        """
+        node = state if self.__has_longer(state) else self.__output[state]
+        while node:
+            yield self.__depths[node], node
+            node = self.__output[node]
+
+    def get_starting(self, node):
+        """
+        :param node: node from iter_starting_matches
+        :return: sorted list of (read_id, strand),
+            where the oriented read path starts with but is longer than the matched path suffix
+        """
+        seq_ids = np.sort(self.seq_ids[self.__longer_from[node]: self.__range_to[node]])
+        return [(seq_id >> 1, bool(seq_id & 1)) for seq_id in seq_ids.tolist()]
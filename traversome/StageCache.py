@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+Content-addressed on-disk cache of the outputs of the pipeline stages
+"""
+
+import os
+import pickle
+from hashlib import blake2b
+from loguru import logger
+from traversome import __version__
+
+
+class StageCache(object):
+    """
+    A directory of pickled stage outputs, each named by the stage name and a key hashed from the inputs of the stage.
+
+    The key of a stage is chained from the key of its upstream stage and its own options,
+    so that changing an option invalidates the stage where it is used and all the downstream stages,
+    while a re-run with only downstream options changed loads the upstream outputs directly.
+    Every key also includes the version of traversome, so that the outputs of other versions are never loaded.
+    Input files are hashed by their contents rather than their paths or modification times.
+    An output is written to a temporary file first and then renamed,
+    so that a crashed or concurrent run never leaves a partial output under a valid name.
+    """
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: directory of the cached outputs, shared by different runs
+        """
+        self.cache_dir = str(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # (file, size, mtime) -> content digest, to avoid re-hashing the same file for chained keys
+        self.__file_digests = {}
+
+    def hash_file(self, file_name, chunk_size=1 << 20):
+        """
+        :param file_name: path of the input file, or None
+        :return: hex digest of the file content, or None
+        """
+        if not file_name:
+            return None
+        file_stat = os.stat(file_name)
+        file_tag = (os.path.abspath(file_name), file_stat.st_size, file_stat.st_mtime_ns)
+        if file_tag not in self.__file_digests:
+            hash_obj = blake2b(digest_size=16)
+            with open(file_name, "rb") as input_h:
+                for chunk in iter(lambda: input_h.read(chunk_size), b""):
+                    hash_obj.update(chunk)
+            self.__file_digests[file_tag] = hash_obj.hexdigest()
+        return self.__file_digests[file_tag]
+
+    @staticmethod
+    def get_key(stage, upstream_key, options):
+        """
+        :param stage: name of the stage
+        :param upstream_key: key of the upstream stage, or None for the first stage
+        :param options: dict of the options and input file digests used by the stage, with stable repr
+        :return: hex digest
+        """
+        hash_obj = blake2b(repr((__version__, stage, upstream_key)).encode(), digest_size=16)
+        for opt_name, opt_val in sorted(options.items()):
+            hash_obj.update(repr((opt_name, opt_val)).encode())
+        return hash_obj.hexdigest()
+
+    def __stage_file(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage}.{key}.pkl")
+
+    def load(self, stage, key):
+        """
+        :return: the cached output (dict of attribute name -> value) of the stage, or None if not cached
+        """
+        stage_file = self.__stage_file(stage, key)
+        if not os.path.isfile(stage_file):
+            return None
+        try:
+            with open(stage_file, "rb") as input_h:
+                return pickle.load(input_h)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            logger.warning(f"Ignoring the damaged cache {stage_file}: {e}")
+            return None
+
+    def dump(self, stage, key, stage_output):
+        """
+        :param stage_output: dict of attribute name -> value
+        """
+        stage_file = self.__stage_file(stage, key)
+        tmp_file = f"{stage_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as output_h:
+            pickle.dump(stage_output, output_h, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, stage_file)
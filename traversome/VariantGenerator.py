@@ -1,18 +1,17 @@
 #!/usr/bin/env python
-import os
 
 from loguru import logger
-from traversome.utils import harmony_weights, run_dill_encoded   # MaxTraversalReached
+from traversome.utils import harmony_weights, ReadPathCoverageTracker   # MaxTraversalReached
+from traversome.ReadPathIndex import ReadPathIndex, ReadPathAutomaton
+from traversome.CandidateStore import CandidateStore
 # WeightedGMMWithEM find_greatest_common_divisor,
-from copy import deepcopy
 from pathlib import Path as fpath
 from scipy.stats import norm
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import numpy as np
-from numpy import log, exp, inf
-from multiprocessing import Manager, Pool
+from numpy import log, log1p, exp, inf
+from multiprocessing import get_context
 import warnings
-import dill
 import random
 import json
 import traceback
@@ -26,6 +25,121 @@ warnings.filterwarnings('ignore')
 MAX_ADDING_TIMES = 4
 
 
+# the VariantGenerator object shared with the forked traversal workers, see VariantGenerator.__gen_heuristic_paths_mp
+_traversal_generator = None
+
+
+def _heuristic_traversal_batch_worker(task):
+    return _traversal_generator._run_traversal_batch(*task)
+
+
+class PathState(object):
+    """
+    Running summary of a growing traversal path, updated in O(extension length) when the path is extended.
+
+    The approximate multinomial log-likelihood of the vertex multiplicities,
+        sum_v(obs_v * log(bin_v / sum_bin)) = sum_v(obs_v * log(bin_v)) - sum_v(obs_v) * log(sum_bin),
+    is kept as its three sums, where bin_v is the vertex copy number times its bin unit,
+    and obs_v is the bin unit times the vertex coverage.
+    The coverage mean weighted by the lengths of the vertex copies, as well as the prefix sums of the vertex lengths
+    and overlaps, are kept in the same way.
+    The state of the path in the ReadPathAutomaton is also carried forward with each new vertex.
+    """
+    def __init__(self, graph, contig_coverages, cov_unit, path, automaton=None):
+        """
+        :param graph: Assembly or GraphCore object, only vertex_info is used
+        :param contig_coverages: dict of vertex name -> coverage
+        :param cov_unit: unit for coverage, see SingleTraversal.__find_short_read_graph_kmer
+        :param path: starting path
+        :param automaton: ReadPathAutomaton object
+        """
+        self.graph = graph
+        self.contig_coverages = contig_coverages
+        self.cov_unit = cov_unit
+        self.automaton = automaton
+        self.match_state = 0
+        self.path = []
+        self.v_counts = {}
+        self.cum_lens = [0]
+        self.cum_ovls = []
+        self.__sum_obs_log_bin = 0.
+        self.__sum_obs = 0.
+        self.__sum_bin = 0
+        self.__sum_cov_len = 0.
+        self.__sum_len = 0
+        self.extend(path)
+
+    def extend(self, extension):
+        vertex_info = self.graph.vertex_info
+        for v_name, v_end in extension:
+            v_len = vertex_info[v_name].len
+            if self.path:
+                last_n, last_e = self.path[-1]
+                self.cum_ovls.append(self.cum_ovls[-1] + vertex_info[last_n].connections[last_e][(v_name, not v_end)])
+            else:
+                self.cum_ovls.append(0)
+            self.cum_lens.append(self.cum_lens[-1] + v_len)
+            self.path.append((v_name, v_end))
+            if self.automaton is not None:
+                self.match_state = self.automaton.next_state(self.match_state, (v_name, v_end))
+            count = self.v_counts.get(v_name, 0)
+            bin_unit = v_len - self.cov_unit + 1
+            if count:
+                self.__sum_obs_log_bin += bin_unit * self.contig_coverages[v_name] * log1p(1. / count)
+            else:
+                self.__sum_obs_log_bin += bin_unit * self.contig_coverages[v_name] * log(bin_unit)
+                self.__sum_obs += bin_unit * self.contig_coverages[v_name]
+                self.__sum_cov_len += self.contig_coverages[v_name] * v_len
+            self.__sum_bin += bin_unit
+            self.__sum_len += v_len
+            self.v_counts[v_name] = count + 1
+
+    def get_log_like(self):
+        return self.__sum_obs_log_bin - self.__sum_obs * log(self.__sum_bin)
+
+    def get_log_like_ratios(self, extension):
+        """
+        :param extension: proposed extension
+        :return: float64 array of the log-likelihood ratios of accepting each prefix of the extension,
+            being inf for a new vertex, and accumulated since the last new vertex otherwise
+        """
+        sum_obs = self.__sum_obs
+        sum_bin = self.__sum_bin
+        added_counts = {}
+        log_like_ratio = 0.
+        log_like_ratio_list = []
+        for v_name, v_end in extension:
+            count = self.v_counts.get(v_name, 0) + added_counts.get(v_name, 0)
+            bin_unit = self.graph.vertex_info[v_name].len - self.cov_unit + 1
+            if count:
+                # the change of the log-likelihood, without subtracting two large log-likelihoods
+                log_like_ratio += bin_unit * self.contig_coverages[v_name] * log1p(1. / count) - \
+                    sum_obs * log1p(bin_unit / sum_bin)
+                log_like_ratio_list.append(log_like_ratio)
+            else:
+                log_like_ratio_list.append(inf)
+                log_like_ratio = 0.
+                sum_obs += bin_unit * self.contig_coverages[v_name]
+            sum_bin += bin_unit
+            added_counts[v_name] = added_counts.get(v_name, 0) + 1
+        return np.array(log_like_ratio_list, dtype=np.float64)
+
+    def get_cov_mean(self):
+        """
+        mean of coverage per copy (contig_coverage / count), weighted by vertex length * count
+        """
+        return self.__sum_cov_len / self.__sum_len
+
+    def get_sub_path_length(self, from_id, to_id):
+        """
+        :return: the length of path[from_id: to_id], with 0 <= from_id < to_id <= len(path)
+        """
+        return self.cum_lens[to_id] - self.cum_lens[from_id] - (self.cum_ovls[to_id - 1] - self.cum_ovls[from_id])
+
+    def is_fully_covered(self):
+        return len(self.v_counts) == len(self.graph.vertex_info)
+
+
 class SingleTraversal(object):
     """
 
@@ -41,8 +155,9 @@ class SingleTraversal(object):
         self.local_max_alignment_len = path_generator_obj.max_alignment_len
         self.contig_coverages = path_generator_obj.contig_coverages
         self.uni_chromosome = path_generator_obj.uni_chromosome
-        self.__starting_subpath_to_readpaths = path_generator_obj.pass_starting_subpath_to_readpaths()
-        self.__middle_subpath_to_readpaths = path_generator_obj.pass_middle_subpath_to_readpaths()
+        self.__read_path_index = path_generator_obj.pass_read_path_index()
+        self.__read_path_automaton = path_generator_obj.pass_read_path_automaton()
+        self.__graph_core = path_generator_obj.pass_graph_core()
         self.__read_paths_counter = path_generator_obj.pass_read_paths_counter()
         self.__differ_f = path_generator_obj.pass_differ_f()
         self.__cov_inert = path_generator_obj.pass_cov_inert()
@@ -51,13 +166,26 @@ class SingleTraversal(object):
         self.__decay_t = path_generator_obj.pass_decay_t()
         self.__candidate_single_copy_vs = path_generator_obj.pass_candidate_single_copy_vs()
         self.__cov_unit = None  # unit for coverage
+        self.__path_state = None
         self.result_path = None
+        self.result_fully_covered = None
 
     def run(self, start_path=None):
         self.__find_short_read_graph_kmer()
         start_path = [] if start_path is None else start_path
-        self.result_path = \
-            self.graph.get_standardized_path_circ(self.graph.roll_path(self.__heuristic_extend_path(start_path)))
+        result_path = self.__heuristic_extend_path(start_path)
+        # rolling and standardizing the path do not change its vertex set
+        self.result_fully_covered = self.__path_state.is_fully_covered()
+        self.result_path = self.graph.get_standardized_path_circ(self.graph.roll_path(result_path))
+
+    def __new_path_state(self, path):
+        """
+        :return: the path list kept by the new PathState, which is extended in place
+        """
+        self.__path_state = PathState(
+            graph=self.__graph_core, contig_coverages=self.contig_coverages, cov_unit=self.__cov_unit, path=path,
+            automaton=self.__read_path_automaton)
+        return self.__path_state.path
 
     def __find_short_read_graph_kmer(self):
         # TODO: optimize for long-read assembly
@@ -100,8 +228,9 @@ class SingleTraversal(object):
             read_path = random.choices(self.read_paths)[0]
             if random.random() > 0.5:
                 read_path = self.graph.reverse_path(read_path)
-            path = list(read_path)
-        logger.trace("      starting path(" + str(len(path)) + "): " + str(path))
+            path = read_path
+        path = self.__new_path_state(path)
+        logger.trace("      starting path({}): {}", len(path), path)
         #
         not_do_reverse = False
         while True:
@@ -122,30 +251,32 @@ class SingleTraversal(object):
             #     return deepcopy(repeating_unit)
 
             #
-            current_ave_coverage = self.__get_cov_mean(path)
+            current_ave_coverage = self.__path_state.get_cov_mean()
             # generate the extending candidates
             candidate_ls_list = []
             candidates_list_overlap_c_nums = []
-            for overlap_c_num in range(1, len(path) + 1):  # change 2 back to 1 2023-10-11
-                overlap_path = path[-overlap_c_num:]
+            # all path suffixes (overlap_path) that read paths start with, from the longest to the shortest
+            for overlap_c_num, match_node in \
+                    self.__read_path_automaton.iter_starting_matches(self.__path_state.match_state):
                 # stop adding extending candidate when the overlap is longer than our longest read alignment
                 # stay within what data can tell
-                if self.graph.get_path_internal_length(list(overlap_path) + [("", True)]) \
-                        >= self.local_max_alignment_len:
-                    break
-                overlap_path = tuple(overlap_path)
-                if overlap_path in self.__starting_subpath_to_readpaths:
-                    # logger.debug("starting, " + str(self.__start_subpath_to_readpaths[overlap_path]))
-                    candidate_ls_list.append(sorted(self.__starting_subpath_to_readpaths[overlap_path]))
-                    candidates_list_overlap_c_nums.append(overlap_c_num)
+                # i.e. the internal length of overlap_path plus a following vertex,
+                # which does not decrease with overlap_c_num
+                overlap_inner_len = self.__path_state.get_sub_path_length(len(path) - overlap_c_num + 1, len(path)) \
+                    if overlap_c_num > 1 else 0
+                if overlap_inner_len >= self.local_max_alignment_len:
+                    continue
+                candidate_ls_list.append(self.__read_path_automaton.get_starting(match_node))
+                candidates_list_overlap_c_nums.append(overlap_c_num)
+            candidate_ls_list.reverse()
+            candidates_list_overlap_c_nums.reverse()
             # logger.debug(candidate_ls_list)
             # logger.debug(candidates_list_overlap_c_nums)
             if not candidate_ls_list:
                 # if no extending candidate based on starting subpath (from one end),
                 # try to simultaneously extend both ends from middle
-                path_tuple = tuple(path)
-                if path_tuple in self.__middle_subpath_to_readpaths:
-                    candidates = sorted(self.__middle_subpath_to_readpaths[path_tuple])
+                candidates = self.__read_path_index.find_middle(path)
+                if candidates:
                     weights = [self.__read_paths_counter[self.read_paths[read_id]] for read_id, strand in candidates]
                     weights = harmony_weights(weights, diff=self.__differ_f)
                     if self.__cov_inert:
@@ -158,9 +289,9 @@ class SingleTraversal(object):
                     except ValueError:  # sum(weights)==0
                         read_id, strand = random.choices(candidates)[0]
                     if strand:
-                        path = list(self.read_paths[read_id])
+                        path = self.__new_path_state(self.read_paths[read_id])
                     else:
-                        path = list(self.graph.reverse_path(self.read_paths[read_id]))
+                        path = self.__new_path_state(self.graph.reverse_path(self.read_paths[read_id]))
                     continue
                     # 2023-03-23: find a bug in previous recursive code
                     # return self.__heuristic_extend_path(path)
@@ -177,11 +308,11 @@ class SingleTraversal(object):
                 # if no extending candidates based on overlap info, try to extend based on the graph
                 logger.trace("      no extending candidates based on overlap info, try extending based on the graph")
                 last_name, last_end = path[-1]
-                next_connections = self.graph.vertex_info[last_name].connections[last_end]
+                next_connections = self.__graph_core.get_next_ends(last_name, last_end)
                 logger.trace("      {}, {}: next_connections: {}".format(last_name, last_end, next_connections))
                 if next_connections:
                     if len(next_connections) > 1:
-                        candidates_next = sorted(next_connections)
+                        candidates_next = list(next_connections)
                         logger.trace("      candidates_next: {}".format(candidates_next))
                         if self.uni_chromosome:
                             # weighting candidates by the likelihood change of the multiplicity change
@@ -193,21 +324,14 @@ class SingleTraversal(object):
                             for next_v in candidates_next:
                                 # v_name, v_end = next_v
                                 # current_v_counts = {v_name: current_vs.count(v_name)}
-                                like_ls = self.__cal_multiplicity_like(path=path,
-                                                                       proposed_extension=[next_v],
-                                                                       # current_v_counts=current_v_counts,
-                                                                       # single_cov_mean=single_cov_mean,
-                                                                       # single_cov_std=single_cov_std,
-                                                                       # logarithm=True
-                                                                       )
+                                like_ls = self.__path_state.get_log_like_ratios([next_v])
                                 like_ls_cached.append(like_ls)
                                 weights.append(max(like_ls))  # the best scenario
-                            logger.trace("      likes: {}".format(weights))
+                            logger.trace("      log likes: {}".format(weights))
                             #
-                            weights = np.array(weights)
-                            # ratio: likelihood proportion
-                            weights = np.where(weights == np.inf, 1, weights / (1. + weights))
-                            weights = weights / max(weights)
+                            # ratio: likelihood proportion, log(odds / (1 + odds)), being 0 for inf
+                            weights = -np.logaddexp(0., -np.array(weights))
+                            weights = exp(weights - max(weights))
                             # if sum(weights):
                             try:
                                 chosen_cdd_id = random.choices(range(len(candidates_next)), weights=weights)[0]
@@ -235,7 +359,7 @@ class SingleTraversal(object):
                         else:
                             next_name, next_end = random.choice(candidates_next)
                     else:
-                        next_name, next_end = list(next_connections)[0]
+                        next_name, next_end = next_connections[0]
                         logger.trace("      single next: ({}, {})".format(next_name, next_end))
                         like_ls_cached = None
                     # if not self.uni_chromosome or
@@ -256,14 +380,15 @@ class SingleTraversal(object):
                         return path
                     else:
                         logger.trace("      traversal reversed without next vertex.")
-                        path = list(self.graph.reverse_path(path))
+                        path = self.__new_path_state(self.graph.reverse_path(path))
                         not_do_reverse = True
                         continue
                         # return self.__heuristic_extend_path(
                         #     list(self.graph.reverse_path(path)),
                         #     not_do_reverse=True)
             else:
-                logger.debug("    path(" + str(len(path)) + "): " + str(path))
+                # formatted by loguru only when emitted, which keeps the per-step cost independent of the path length
+                logger.debug("    path({}): {}", len(path), path)
                 # if there is only one candidate
                 if len(candidate_ls_list) == 1 and len(candidate_ls_list[0]) == 1:
                     read_id, strand = candidate_ls_list[0][0]
@@ -271,7 +396,7 @@ class SingleTraversal(object):
                 else:
                     candidates = []
                     candidates_ovl_n = []
-                    weights = []
+                    log_weights = []
                     num_reads_used = 0
                     max_ovl = max(candidates_list_overlap_c_nums)
                     parts_len = int((max_ovl - 1) / MAX_ADDING_TIMES)
@@ -293,15 +418,10 @@ class SingleTraversal(object):
                         same_ov_w = harmony_weights(same_ov_w, diff=self.__differ_f)
                         if ovl_c_num > max(1, max_ovl - flatten_nums):
                             # make those with 2 and larger overlaps equal for their both harbor info
-                            same_ov_w = exp(np.array(log(same_ov_w), dtype=np.float128))
+                            log_weights.extend(log(same_ov_w))
                         else:  # 2023-10-12 only apply decay_f to the later overlap ones
-                            # RuntimeWarning: overflow encountered in exp of numpy, or math range error in exp of math
-                            # change to dtype=np.float128
-                            same_ov_w = exp(np.array(log(same_ov_w) -
-                                                     log(self.__decay_f) *
-                                                     max(1, max_ovl - flatten_nums - ovl_c_num),
-                                                     dtype=np.float128))
-                        weights.extend(same_ov_w)
+                            log_weights.extend(log(same_ov_w) -
+                                               log(self.__decay_f) * max(1, max_ovl - flatten_nums - ovl_c_num))
                         # To reduce computational burden, only reads that overlap most with current path
                         # will be considered in the extension. Proportions below 1/decay_t which will be neglected
                         # in the path proposal.
@@ -309,6 +429,10 @@ class SingleTraversal(object):
                             break
                     logger.trace("       Drawing candidates from {} reads, with [{},{}] overlaps".format(
                         num_reads_used, min(candidates_ovl_n), max(candidates_ovl_n)))
+                    # weights are kept in log space and scaled by the largest one,
+                    # so that the float64 weights would neither overflow nor underflow all together
+                    log_weights = np.array(log_weights)
+                    weights = exp(log_weights - max(log_weights))
                     if self.uni_chromosome:
                         ######
                         # randomly chose a certain number of candidates to reduce computational burden
@@ -339,10 +463,9 @@ class SingleTraversal(object):
                                 new_weights.append(pool_ids.count(remaining_id))
                             candidates = new_candidates
                             candidates_ovl_n = new_candidates_ovl_n
-                            weights = new_weights
+                            log_weights = log(new_weights)
                             # re-weighting candidates by the likelihood change of adding the extension
-                            current_vs = [v_n for v_n, v_e in path]
-                            logger.trace("      path({}): {}".format(len(path), path))
+                            logger.trace("      path({}): {}", len(path), path)
                             # single_cov_mean, single_cov_std = self.__get_cov_mean_of_single(path, return_std=True)
                             # logger.trace("      path single mean:" + str(single_cov_mean) + "," + str(single_cov_std))
                             for go_c, (read_id, strand) in enumerate(candidates):
@@ -353,16 +476,12 @@ class SingleTraversal(object):
                                 cdd_extend = read_path[candidates_ovl_n[go_c]:]
                                 logger.trace("      candidate ext {}: {}".format(go_c, cdd_extend))
                                 # current_v_counts = {_v_n: current_vs.count(_v_n) for _v_n, _v_e in cdd_extend}
-                                like_ls = self.__cal_multiplicity_like(path=path,
-                                                                       proposed_extension=cdd_extend,
-                                                                       # current_v_counts=current_v_counts,
-                                                                       # single_cov_mean=single_cov_mean,
-                                                                       # single_cov_std=single_cov_std
-                                                                       )
+                                like_ls = self.__path_state.get_log_like_ratios(cdd_extend)
                                 like_ls_cached.append(like_ls)
                                 max_like = max(like_ls)
                                 # converting the odds to the probability and times it to the weights
-                                weights[go_c] *= 1. if max_like == inf else max_like / (1. + max_like)
+                                log_weights[go_c] -= np.logaddexp(0., -max_like)
+                            weights = exp(log_weights - max(log_weights))
                             logger.trace("      like_ls_cached: {}".format(like_ls_cached))
                     elif self.__cov_inert:
                         # coverage inertia (multi-chromosomes) and uni_chromosome are mutually exclusive
@@ -372,8 +491,8 @@ class SingleTraversal(object):
                         # logger.debug(candidates_ovl_n)
                         cdd_cov = [self.__get_cov_mean(self.read_paths[r_id][candidates_ovl_n[go_c]:])
                                    for go_c, (r_id, r_strand) in enumerate(candidates)]
-                        weights = exp(np.array([log(weights[go_c]) - abs(log(cov / current_ave_coverage))
-                                                for go_c, cov in enumerate(cdd_cov)], dtype=np.float128))
+                        log_weights = log_weights - abs(log(np.array(cdd_cov) / current_ave_coverage))
+                        weights = exp(log_weights - max(log_weights))
                     try:
                         chosen_cdd_id = random.choices(range(len(candidates)), weights=weights)[0]
                     except ValueError:
@@ -421,103 +540,6 @@ class SingleTraversal(object):
                 #         initial_mean=initial_mean,
                 #         initial_std=initial_std)
 
-    def __count_v_bin_size_and_obs(
-            self,
-            path):
-        """
-        for calculating approximate multinomial
-        """
-        # TODO: optimize for long-read assembly
-        #       probably use a gamma distribution to approximate the read lengths and calculate the bin_sizes
-        #       in that case, start + end will be considered, rather than
-        #       currently assuming kmer is the unit for coverage, only valid for de bruijn-derived graph
-        # Anyway, it should not make a big difference to underestimate the unit
-        # the multiplicity will always be proportional to the coverage
-        bin_sizes = {}
-        obs = {}
-        for v_n, v_e in path:
-            # currently assuming kmer is the unit for coverage, only valid for de bruijn-derived graph
-            if v_n not in bin_sizes:
-                count = self.graph.vertex_info[v_n].len - self.__cov_unit + 1
-                bin_sizes[v_n] = count
-                obs[v_n] = count * self.contig_coverages[v_n]  # self.graph.vertex_info[v_n].cov
-            else:
-                bin_sizes[v_n] += self.graph.vertex_info[v_n].len - self.__cov_unit + 1
-        return bin_sizes, obs
-
-    def __update_v_bin_size(
-            self,
-            new_v,
-            bin_sizes,
-            obs):
-        if new_v not in bin_sizes:
-            count = self.graph.vertex_info[new_v].len - self.__cov_unit + 1
-            bin_sizes[new_v] = count
-            obs[new_v] = count * self.contig_coverages[new_v]  # self.graph.vertex_info[new_v].cov
-        else:
-            bin_sizes[new_v] += self.graph.vertex_info[new_v].len - self.__cov_unit + 1
-
-    @staticmethod
-    def __cal_single_multiplicity_loglike(bin_sizes, observations):
-        sum_counts = float(sum(bin_sizes.values()))
-        probs = {v_n_: count_ / sum_counts for v_n_, count_ in bin_sizes.items()}
-        # convert the dictionaries into arrays to use numpy vectorized operations
-        keys = list(observations.keys())
-        obs_values = np.array([observations[key] for key in keys])
-        prop_values = np.array([probs[key] for key in keys])
-        # multinomial distribution
-        return np.sum(np.log(prop_values) * obs_values)
-
-    def __cal_multiplicity_like(
-            self,
-            path,
-            proposed_extension,
-            # current_v_counts=None,
-            # old_cov_mean=None,
-            # old_cov_std=None,
-            # single_cov_mean=None,
-            # single_cov_std=None,
-            logarithm=False,
-    ):
-        """
-        called by __heuristic_extend_path through directly or through self.__heuristic_check_multiplicity.
-        Note: multi-variant graph is not single modal after all, no model can be accurate beforehand.
-        :param path:
-        :param proposed_extension:
-        # :param current_v_counts: passed to avoid repeated calculation
-        # :param single_cov_mean: passed to avoid repeated calculation
-        # :param single_cov_std: passed to avoid repeated calculation
-        :return: log_like_ratio_list
-        """
-        # TODO: for long-read assembly graph
-        #       1) modeling the (start + end) points
-        # path = list(deepcopy(path))
-        bin_sizes, observations = self.__count_v_bin_size_and_obs(path)
-        old_like = self.__cal_single_multiplicity_loglike(bin_sizes=bin_sizes, observations=observations)
-        log_like_ratio_list = []
-        # logger.trace(f"      - path={path}")
-        # logger.trace(f"    bin sizes={bin_sizes}")
-        # logger.trace(f"    observations={observations}")
-        for v_name, v_end in proposed_extension:
-            is_new_vertex = v_name not in observations
-            self.__update_v_bin_size(new_v=v_name, bin_sizes=bin_sizes, obs=observations)
-            # logger.trace(f"      - v_name={v_name}")
-            # logger.trace(f"    bin sizes={bin_sizes}")
-            # logger.trace(f"    observations={observations}")
-            new_like = self.__cal_single_multiplicity_loglike(bin_sizes=bin_sizes, observations=observations)
-            if is_new_vertex:
-                # logger.trace(f"      - old_like={-inf}, new_like={new_like}")
-                log_like_ratio_list.append(inf)
-                old_like = new_like
-            else:
-                # logger.trace(f"      - old_like={old_like}, new_like={new_like}")
-                log_like_ratio_list.append(new_like - old_like)  # now the likes are accumulated since last inf (new v)
-        # logger.trace("    loglike ratio list: {}".format(log_like_ratio_list))
-        if logarithm:
-            return np.array(log_like_ratio_list, dtype=np.float128)
-        else:
-            return exp(np.array(log_like_ratio_list, dtype=np.float128))
-
     # def __cal_multiplicity_like(
     #         self,
     #         path,
@@ -649,11 +671,7 @@ class SingleTraversal(object):
         if cached_like_ls is not None and len(cached_like_ls) > 0:
             like_ratio_list = cached_like_ls
         else:
-            like_ratio_list = self.__cal_multiplicity_like(
-                path=path,
-                proposed_extension=proposed_extension,
-                # current_v_counts=current_v_counts
-            )
+            like_ratio_list = self.__path_state.get_log_like_ratios(proposed_extension)
         # inf (new vertex) change the model comparison, so accept all parts with new vertex,
         # but do drawing for the remaining, whose probs were based on the accumulated product of like ratios
         # -
@@ -670,14 +688,13 @@ class SingleTraversal(object):
         start_draw = longest_ex_len - np.argmax(lr_is_inf[::-1]) if lr_is_inf.any() else 0
         if start_draw == longest_ex_len:  # the last ratio is inf -- the last vertex is a new vertex
             logger.trace("      draw accepted:{}".format(proposed_extension))
-            return list(deepcopy(path)) + list(proposed_extension), True, not_do_reverse
+            self.__path_state.extend(proposed_extension)
+            return path, True, not_do_reverse
         else:
             # create prob_list for drawing random numbers
             cum_like_ratio = like_ratio_list[start_draw:]
-            # # replace nan cause by zero * inf, here the inf is actually a large number
-            # cum_like_ratio[np.isnan(cum_like_ratio)] = 0.0
-            # testing_region_prob = np.where(cum_like_ratio == np.inf, 1, cum_like_ratio / (1. + cum_like_ratio))
-            testing_region_prob = cum_like_ratio / (1. + cum_like_ratio)
+            # odds / (1 + odds) from the log odds, which does not overflow
+            testing_region_prob = exp(-np.logaddexp(0., -cum_like_ratio))
             prob_list = [1 for foo in range(start_draw)] + list(testing_region_prob)
             logger.trace("      prob_list:{}".format(prob_list))
             previous_prob = 0.
@@ -693,16 +710,17 @@ class SingleTraversal(object):
                 # if this_prob == 1 or draw_prob > random.random():
                 if draw_prob == 1 or draw_prob > random.random():
                     logger.trace("      draw accepted:{}".format(proposed_extension[:proposed_end]))
-                    return list(deepcopy(path)) + list(proposed_extension[:proposed_end]), True, not_do_reverse
+                    self.__path_state.extend(proposed_extension[:proposed_end])
+                    return path, True, not_do_reverse
             else:
                 if not_do_reverse:
                     logger.trace("    linear traversal ended to fit {}'s coverage.".format(proposed_extension[0][0]))
                     logger.trace("    checked likes: {}".format(like_ratio_list))
-                    return list(deepcopy(path)), False, None
+                    return path, False, None
                 else:
                     logger.trace("    linear traversal reversed to fit {}'s coverage.".format(proposed_extension[0][0]))
                     logger.trace("    checked likes: {}".format(like_ratio_list))
-                    return list(self.graph.reverse_path(list(deepcopy(path)))), True, True
+                    return self.__new_path_state(self.graph.reverse_path(path)), True, True
 
     def __check_path(self, path):
         assert len(path)
@@ -804,6 +822,7 @@ class VariantGenerator(object):
                  cov_inert=1.,
                  use_alignment_cov=False,
                  min_unit_similarity=0.85,
+                 traversal_batch_size=20,
                  resume=False,
                  temp_dir: fpath = None):
         """
@@ -842,6 +861,8 @@ class VariantGenerator(object):
         :param use_alignment_cov: use the coverage from assembly graph if False.
         :param min_unit_similarity: minimum contig-len-weighted path similarity shared among units [0.5, 1]
             Used to trigger the decomposition of a long path concatenated by multiple units.
+        :param traversal_batch_size: num of traversals run by a worker between two checks of the stopping criteria,
+            only used in multiprocessing
         :param resume: resume a previous run
         :param temp_dir: directory recording the generated paths for resuming and debugging
         """
@@ -851,6 +872,7 @@ class VariantGenerator(object):
         assert 100 <= decay_t
         assert 0 <= cov_inert
         assert 0.5 <= min_unit_similarity
+        assert 1 <= traversal_batch_size
         assert start_strategy in {"random", "numerate"}
         self.start_strategy = start_strategy
         self.graph = traversome_obj.graph
@@ -875,6 +897,7 @@ class VariantGenerator(object):
         self.__random = traversome_obj.random
         self.__use_alignment_cov = use_alignment_cov
         self.__min_unit_similarity = min_unit_similarity
+        self.traversal_batch_size = traversal_batch_size
 
         # to be generated
         self.read_paths = list()
@@ -885,27 +908,28 @@ class VariantGenerator(object):
         self.len_read_p = len(self.read_paths)
         self.total_ali_counts = sum(self.read_paths_counter.values())
         # self.__vertex_to_readpath = {vertex: set() for vertex in self.graph.vertex_info}
-        self.__start_subpath_to_readpaths = {}
-        self.__middle_subpath_to_readpaths = {}
-        self.__read_paths_not_in_variants = {}
+        self.__read_path_index = None
+        self.__read_path_automaton = None
+        self.__graph_core = None
+        self.__read_path_coverage = None
         self.__read_paths_counter_indexed = False
         self.contig_coverages = OrderedDict()
         # self.single_copy_vertices_prob = \
         #     OrderedDict([(_v, 1.) for _v in single_copy_vertices]) if single_copy_vertices \
         #         else OrderedDict()
         self.__candidate_single_copy_vs = set()
-        self.__previous_len_variant = 0
         self.count_valid = 0
         self.count_search = 0
         self.variants = list()
         self.variants_counts = dict()
 
+        self.__candidate_store = None
         if self.temp_dir:
             self.temp_dir.mkdir(exist_ok=self.resume)
+            self.__candidate_store = CandidateStore(self.temp_dir.joinpath("candidates.bin"))
 
     def generate_heuristic_paths(self, num_processes=None):
         # load previous
-        self.__previous_len_variant = 0
         if self.resume and self.temp_dir.exists():
             self.load_temp()
             if sum(self.variants_counts.values()) >= self.max_valid_search:  # hit the hard bound
@@ -928,35 +952,28 @@ class VariantGenerator(object):
         self.estimate_single_copy_vertices()
 
         logger.info("Generating heuristic variants .. ")
-        if num_processes == 1:
-            self.__gen_heuristic_paths_uni()
-        else:
-            self.__gen_heuristic_paths_mp(num_proc=num_processes)
+        try:
+            if num_processes == 1:
+                self.__gen_heuristic_paths_uni()
+            else:
+                self.__gen_heuristic_paths_mp(num_proc=num_processes)
+        finally:
+            if self.__candidate_store is not None:
+                self.__candidate_store.close()
 
     def load_temp(self):
-        len_vars = len(list(self.temp_dir.glob("sid.*.tuple")))
-        if len_vars:
-            logger.info("Loading generated variants ..")
-        for var_id in range(1, len_vars + 1):
-            # although using pickle will be faster, txt is human-readable
-            tuple_f = self.temp_dir.joinpath(f"sid.{var_id}.tuple")
-            count_f = self.temp_dir.joinpath(f"sid.{var_id}.count")
-            try:
-                with open(tuple_f) as input_r, open(count_f) as input_i:
-                    this_variant = eval(input_r.read())
-                    this_count = int(input_i.read())
-                    self.variants.append(this_variant)
-                    self.variants_counts[this_variant] = this_count
-            except FileNotFoundError as e:
-                logger.error(str(e))
-                logger.error("'--previous resume' is not usable when the generated files are illegal!")
-                sys.exit(0)
+        # checkpoints written by previous versions are converted into the log once
+        num_converted = self.__candidate_store.convert_legacy(self.temp_dir)
+        if num_converted:
+            logger.info("Converted {} generated variants from the checkpoint of a previous version".format(
+                num_converted))
+        # one sequential read of the append-only log, which also discards the tail of an interrupted write
+        self.variants, self.variants_counts = self.__candidate_store.load()
+        if self.variants:
+            logger.info("Loaded {} generated variants".format(len(self.variants)))
 
     def __access_read_path_coverage(self,
-                                    growing_variants,
-                                    previous_len_variant,
                                     num_valid_search,
-                                    path_not_traversed,
                                     previous_un_traversed_ratio,
                                     previous_un_traversed_ratio_count,
                                     reset_num_valid_search=True,
@@ -965,44 +982,23 @@ class VariantGenerator(object):
         Return: (expected_num_searches_to_add, un_traversed_path_ratio, counts_of_ratio_unchanged)
         """
         logger.info("Assessing read path coverage ..")
-        logger.debug("  paths not traversed: " + str(path_not_traversed))
-        logger.debug("  paths not traversed: " + str(bool(path_not_traversed)))
+        coverage = self.__read_path_coverage
+        # variants loaded from previous runs were not added during the search
+        coverage.add_variants(self.variants)
+        logger.debug("  paths not traversed: " + str(coverage.num_uncovered))
         """The minimum requirement is that all observed read_paths were covered"""
-        if not path_not_traversed:
+        if not coverage.num_uncovered:
             return 0, 0, None
         else:
-            # must use dict.keys() to iterate a manager-dict in a child process
-            # logger.debug(str([str(_rp) + ";  " for _rp in path_not_traversed.keys()]))
-            for variant_path in growing_variants[previous_len_variant:]:
-                logger.debug("check variant_path " + str(variant_path))
-                # TODO if memory can be shared in a pool without serialization, this can be much faster
-                # TODO, separate this part into each worker, it will be much faster
-                for sub_path in self.subpath_generator.gen_subpaths(variant_path):
-                    # logger.debug("check subpath", sub_path)
-                    if sub_path in path_not_traversed:
-                        del path_not_traversed[sub_path]
-                # # the current get_variant_sub_paths function only consider subpaths with length > 1
-                # # TODO: get subpath adaptive to length=1, more general and less restrictions
-                # # after which the following block can be removed
-                # for single_v, single_e in variant_path:
-                #     single_sbp = ((single_v, False),)
-                #     if single_sbp in path_not_traversed:
-                #         del path_not_traversed[single_sbp]
-                if not path_not_traversed:
-                    return 0, 0, None
-            if not path_not_traversed:
-                return 0, 0, None
             # weighted by read alignment counts
-            current_ratio = sum([self.read_paths_counter[_p]
-                                 for _p in path_not_traversed.keys()]) / self.total_ali_counts
+            current_ratio = coverage.get_uncovered_ratio()
             logger.info("uncovered_paths/all_paths = %i/%i = %.4f" %
-                        (len(path_not_traversed), self.len_read_p, len(path_not_traversed) / self.len_read_p))
+                        (coverage.num_uncovered, self.len_read_p, coverage.num_uncovered / self.len_read_p))
             logger.info("weighted_uncovered_ratio = %.4f" % current_ratio)
             if not reset_num_valid_search or current_ratio <= self._max_uncover_ratio:
-                logger.warning("{} read paths not traversed".format(len(path_not_traversed)))
+                logger.warning("{} read paths not traversed".format(coverage.num_uncovered))
                 if report_detailed_warning:
-                    # must use dict.keys() to iterate a manager-dict in a child process
-                    for go_p, p_n_t in enumerate(sorted(list(path_not_traversed.keys()))):
+                    for go_p, p_n_t in enumerate(sorted(coverage.get_uncovered_read_paths())):
                         logger.warning("  read path %i (len=%i, reads=%i): %s" %
                                        (go_p, len(p_n_t), self.read_paths_counter[p_n_t], p_n_t))
                 logger.warning("This may due to 1) insufficient num of valid variants (-n/-N), or "
@@ -1015,10 +1011,9 @@ class VariantGenerator(object):
             if current_ratio == previous_un_traversed_ratio:
                 # if the same un_traversed ratio occurs more than 2 times, stop searching for variants
                 if previous_un_traversed_ratio_count >= MAX_ADDING_TIMES:
-                    logger.warning("{} read paths not traversed".format(len(path_not_traversed)))
+                    logger.warning("{} read paths not traversed".format(coverage.num_uncovered))
                     if report_detailed_warning:
-                        # must use dict.keys() to iterate a manager-dict in a child process
-                        for go_p, p_n_t in enumerate(sorted(list(path_not_traversed.keys()))):
+                        for go_p, p_n_t in enumerate(sorted(coverage.get_uncovered_read_paths())):
                             logger.warning("  read path %i (len=%i, reads=%i): %s" %
                                            (go_p, len(p_n_t), self.read_paths_counter[p_n_t], p_n_t))
                     logger.warning("This may due to 1) insufficient num of valid variants (-n/-N), or "
@@ -1068,27 +1063,19 @@ class VariantGenerator(object):
         #             self.read_paths.append(this_read_path)
         #         # # record alignment length
         #         # alignment_lengths.append(gaf_record.p_align_len)
-        for read_id, this_read_path in enumerate(self.read_paths):
-            read_contig_num = len(this_read_path)
-            forward_read_path_tuple = tuple(this_read_path)
-            reverse_read_path_tuple = tuple(self.graph.reverse_path(this_read_path))
-            for sub_contig_num in range(1, read_contig_num):
-                # index the starting subpaths
-                self.__index_start_subpath(forward_read_path_tuple[:sub_contig_num], read_id, True)
-                # reverse
-                self.__index_start_subpath(reverse_read_path_tuple[: sub_contig_num], read_id, False)
-                # index the middle subpaths
-                # excluding the start and the end subpaths: range(0 + 1, read_contig_num - sub_contig_num + 1 - 1)
-                for go_sub in range(1, read_contig_num - sub_contig_num):
-                    # forward
-                    self.__index_middle_subpath(
-                        forward_read_path_tuple[go_sub: go_sub + sub_contig_num], read_id, True)
-                    # reverse
-                    self.__index_middle_subpath(
-                        reverse_read_path_tuple[go_sub: go_sub + sub_contig_num], read_id, False)
+        # index the starting and middle subpaths of read paths in both directions
+        path_dict = self.graph.get_path_dictionary()
+        reverse_read_paths = [path_dict.reverse_path(this_read_path) for this_read_path in self.read_paths]
+        self.__read_path_index = ReadPathIndex(read_paths=self.read_paths, reverse_paths=reverse_read_paths)
+        self.__read_path_automaton = ReadPathAutomaton(read_paths=self.read_paths, reverse_paths=reverse_read_paths)
+        # the graph was preprocessed and palindromic repeats were detected with the path dictionary
+        self.__graph_core = self.graph.get_graph_core()
         #
         # self.max_alignment_len = sorted(alignment_lengths)[-1]
-        self.__read_paths_not_in_variants = {_rp: None for _rp in self.read_paths_counter}
+        self.__read_path_coverage = ReadPathCoverageTracker(
+            read_paths=self.read_paths,
+            read_paths_counter=self.read_paths_counter,
+            subpath_generator=self.subpath_generator)
         self.__read_paths_counter_indexed = True
 
     def estimate_contig_coverages_from_read_paths(self):
@@ -1157,14 +1144,10 @@ class VariantGenerator(object):
         self.count_valid = sum(self.variants_counts.values())
         if self.count_valid >= num_valid_search:
             add_search, previous_ratio, previous_ratio_c = self.__access_read_path_coverage(
-                growing_variants=self.variants,
-                previous_len_variant=self.__previous_len_variant,
                 num_valid_search=num_valid_search,
-                path_not_traversed=self.__read_paths_not_in_variants,
                 previous_un_traversed_ratio=previous_ratio,
                 previous_un_traversed_ratio_count=previous_ratio_c)
             if add_search:
-                self.__previous_len_variant = len(self.variants)
                 num_valid_search += add_search
             else:
                 logger.info("\t{}/{}/{}/{} uniq/valid/tvs/set variants".format(
@@ -1185,10 +1168,7 @@ class VariantGenerator(object):
             # access num of traversal in the beginning
             if self.count_search >= self.max_num_traversals:
                 self.__access_read_path_coverage(
-                    growing_variants=self.variants,
-                    previous_len_variant=self.__previous_len_variant,
                     num_valid_search=num_valid_search,
-                    path_not_traversed=self.__read_paths_not_in_variants,
                     previous_un_traversed_ratio=previous_ratio,
                     previous_un_traversed_ratio_count=previous_ratio_c,
                     reset_num_valid_search=False)
@@ -1226,7 +1206,7 @@ class VariantGenerator(object):
             # logger.trace(str(self.uni_chromosome))
             # logger.trace(str(self.graph.is_fully_covered_by(new_path)))
             invalid_search = (self.force_circular and not is_circular_p) or \
-                             (self.uni_chromosome and not self.graph.is_fully_covered_by(new_path))
+                             (self.uni_chromosome and not single_traversal.result_fully_covered)
 
             # forcing the searching to be running until a circular result was found, was tested to be a bad idea
             # switch back to the post searching judge
@@ -1256,10 +1236,10 @@ class VariantGenerator(object):
                     else:
                         self.variants_counts[new_path] = 1
                         self.variants.append(new_path)
+                        self.__read_path_coverage.add_variant(new_path)
                         # variant id is 1-based for easier manual inspection
                         var_id = variant_ids[new_path] = len(self.variants)
-                        self.__save_tmp_counts(var_id, 1)
-                        self.__save_tmp_path(var_id, new_path)
+                        self.__save_tmp_variant(var_id, new_path, 1)
                         logger.info("\t{}/{}/{}/{} uniq/valid/tvs/set variants".format(
                             len(self.variants), self.count_valid, self.count_search, num_valid_search))
                         # logger.info("  {} unique paths in {}/{} valid paths, {} traversals".format(
@@ -1268,10 +1248,7 @@ class VariantGenerator(object):
                     # hard bound
                     if self.count_valid >= self.max_valid_search or len(self.variants) >= self.max_uniq_search:
                         self.__access_read_path_coverage(
-                            growing_variants=self.variants,
-                            previous_len_variant=self.__previous_len_variant,
                             num_valid_search=num_valid_search,
-                            path_not_traversed=self.__read_paths_not_in_variants,
                             previous_un_traversed_ratio=previous_ratio,
                             previous_un_traversed_ratio_count=previous_ratio_c,
                             reset_num_valid_search=False)
@@ -1284,14 +1261,10 @@ class VariantGenerator(object):
 
                     if self.count_valid >= num_valid_search:
                         add_search, previous_ratio, previous_ratio_c = self.__access_read_path_coverage(
-                            growing_variants=self.variants,
-                            previous_len_variant=self.__previous_len_variant,
                             num_valid_search=num_valid_search,
-                            path_not_traversed=self.__read_paths_not_in_variants,
                             previous_un_traversed_ratio=previous_ratio,
                             previous_un_traversed_ratio_count=previous_ratio_c)
                         if add_search:
-                            self.__previous_len_variant = len(self.variants)
                             num_valid_search += add_search
                             # flatten_n_parts = max(flatten_n_parts, previous_ratio_c)
                             flatten_n_parts = min(flatten_n_parts + 1, MAX_ADDING_TIMES)
@@ -1307,309 +1280,175 @@ class VariantGenerator(object):
         #     len(self.variants), self.count_valid, num_valid_search, self.count_search))
 
     def __save_tmp_counts(self, var_id, counts):
-        if self.temp_dir.exists():
-            count_f_tmp = self.temp_dir.joinpath(f"sid.{var_id}.count.TMP")
-            count_f = self.temp_dir.joinpath(f"sid.{var_id}.count")
-            with open(count_f_tmp, "w") as output_i:
-                output_i.write(str(counts))
-            os.rename(count_f_tmp, count_f)
-
-    def __save_tmp_path(self, var_id, new_path):
-        if self.temp_dir.exists():
-            tuple_f_tmp = self.temp_dir.joinpath(f"sid.{var_id}.tuple.TMP")
-            tuple_f = self.temp_dir.joinpath(f"sid.{var_id}.tuple")
-            with open(tuple_f_tmp, "w") as output_t:
-                output_t.write(str(new_path))
-            os.rename(tuple_f_tmp, tuple_f)
-
-    def __heuristic_traversal_worker(
-            self, variants, variant_ids, variants_counts, path_not_traversed, g_vars, lock, event, err_queue):
+        if self.__candidate_store is not None:
+            self.__candidate_store.append_count(var_id, counts)
+
+    def __save_tmp_variant(self, var_id, new_path, counts):
+        if self.__candidate_store is not None:
+            self.__candidate_store.append_variant(var_id, new_path, counts)
+
+    def _run_traversal_batch(self, batch_seed, num_traversals, flatten_n_parts, first_search_id):
         """
-        single worker of traversal, called by self.get_heuristic_paths_multiprocessing
-        starting a new process from dill dumped python object: slow
+        run a batch of traversals locally with its own random seed, called by the workers of
+            self.__gen_heuristic_paths_mp
+        :param batch_seed: random seed of the batch
+        :param num_traversals: num of traversals in the batch
+        :param flatten_n_parts: passed to SingleTraversal
+        :param first_search_id: 0-based traversal id of the first traversal in the batch
+        :return: list of (encoded_path, count) of the valid variants, in the order of their first occurrence
         """
-        # using a unique number as the new seed for a new worker
-        lock.acquire()
-        g_vars.random_seed += 1
-        self.__random.seed(g_vars.random_seed)
-        lock.release()
-        try:
-            # break_traverse = False
-            while g_vars.count_valid < g_vars.num_valid_search:
-                # access num of traversal in the beginning
-                if g_vars.count_search >= self.max_num_traversals:
-                    g_vars.run_status = "tvs_reached"
-                    event.set()
-                    return
-
-                # move the parallelizable code block before the lock
-                # <<<
-                # g_vars.flatten_n_parts is not frequently updating parameter,
-                #   and updating g_vars.flatten_n_parts will always require a lock
-                #   so it should be fine to call it here without lock
-                single_traversal = SingleTraversal(self, flatten_n_parts=g_vars.flatten_n_parts)
-                lock.acquire()
-                g_vars.count_search += 1
-                count_search = int(g_vars.count_search)
-                lock.release()
-                if self.start_strategy == "random":
-                    single_traversal.run()
-                elif self.start_strategy == "numerate":
-                    start_read_path = self.read_paths[count_search % self.len_read_p]
-                    if self.__random.randint.getrandbits(1):  # use getrandbits(1) to generate 0 or 1
-                        single_traversal.run(list(self.graph.reverse_path(start_read_path)))
-                    else:
-                        single_traversal.run(list(start_read_path))
-                new_path = single_traversal.result_path
-                repr_path = self.graph.repr_path(new_path)
-                is_circular_p = self.graph.is_circular_path(new_path)
-                invalid_search = (self.force_circular and not is_circular_p) or \
-                                 (self.uni_chromosome and not self.graph.is_fully_covered_by(new_path))
-                if not invalid_search:
-                    # if len(new_path) >= v_len * 2:  # using path length to guess multiple units is not a good idea
-                    if is_circular_p:
-                        new_path_list = self.__decompose_hetero_units(new_path)
-                    else:
-                        new_path_list = [new_path]
-                else:
-                    new_path_list = []
-                logger.trace("    traversal {}: {}".format(count_search, repr_path))
-                if invalid_search:
-                    continue
+        self.__random.seed(batch_seed)
+        path_dict = self.graph.get_path_dictionary()
+        batch_counts = {}
+        for search_id in range(first_search_id, first_search_id + num_traversals):
+            single_traversal = SingleTraversal(self, flatten_n_parts=flatten_n_parts)
+            if self.start_strategy == "random":
+                single_traversal.run()
+            elif self.start_strategy == "numerate":
+                start_read_path = self.read_paths[search_id % self.len_read_p]
+                if self.__random.getrandbits(1):  # generate 0 or 1
+                    single_traversal.run(list(self.graph.reverse_path(start_read_path)))
                 else:
-                    # >>>
-                    # locking the counts and variants
-                    lock.acquire()
-                    for new_path in new_path_list:
-                        g_vars.count_valid += 1
-                        if new_path in variants_counts:
-                            variants_counts[new_path] += 1
-                            var_id = variant_ids[new_path]
-                            self.__save_tmp_counts(var_id, variants_counts[new_path])
-                            logger.trace("\t{}/{}/{}/{} uniq/valid/tvs/set variants".format(
-                                len(variants), g_vars.count_valid, count_search, g_vars.num_valid_search))
-                            # logger.trace("  {} unique paths in {}/{} valid paths, {} traversals".format(
-                            #     len(variants), g_vars.count_valid, g_vars.num_valid_search, count_search))
-                        else:
-                            variants_counts[new_path] = 1
-                            variants.append(new_path)
-                            var_id = variant_ids[new_path] = len(variants)
-                            self.__save_tmp_counts(var_id, 1)
-                            self.__save_tmp_path(var_id, new_path)
-                            logger.info("\t{}/{}/{}/{} uniq/valid/tvs/set variants".format(
-                                len(variants), g_vars.count_valid, count_search, g_vars.num_valid_search))
-                            # logger.info("  {} unique paths in {}/{} valid paths, {} traversals".format(
-                            #     len(variants), g_vars.count_valid, g_vars.num_valid_search, count_search))
-
-                        if g_vars.count_valid >= g_vars.max_valid_search:
-                            # break_traverse = True
-                            # kill all other workers
-                            g_vars.run_status = "hard_reached"
-                            event.set()
-                            return
-
-                        if len(variants) >= self.max_uniq_search:
-                            g_vars.run_status = "uniq_reached"
-                            event.set()
-                            return
-
-                        if g_vars.count_valid >= g_vars.num_valid_search:
-                            # logger.info("max valid search: " + str(g_vars.max_valid_search))
-                            # logger.info("num valid search: " + str(g_vars.num_valid_search))
-                            add_search, g_vars.previous_ratio, g_vars.previous_ratio_c = \
-                                self.__access_read_path_coverage(
-                                    growing_variants=variants,
-                                    previous_len_variant=g_vars.previous_len_variant,
-                                    num_valid_search=g_vars.num_valid_search,
-                                    path_not_traversed=path_not_traversed,
-                                    previous_un_traversed_ratio=g_vars.previous_ratio,
-                                    previous_un_traversed_ratio_count=g_vars.previous_ratio_c)
-                            logger.info("adding searches by " + str(add_search))
-                            if add_search:
-                                g_vars.previous_len_variant = len(variants)
-                                g_vars.num_valid_search += add_search
-                                g_vars.flatten_n_parts = min(g_vars.flatten_n_parts + 1, MAX_ADDING_TIMES)
-                                logger.info(f"setting flatten parts to be {g_vars.flatten_n_parts}")
-                            else:
-                                # break_traverse = True
-                                # kill all other workers
-                                event.set()
-                                return "done"
-                    lock.release()
-                # if break_traverse:
-                #     break
-        except KeyboardInterrupt:
-            g_vars.run_status = "interrupt"
-            event.set()
-            return
-            # return "keyboard"
-            # raise KeyboardInterrupt
-        except Exception as e:
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-            location = traceback.extract_tb(exc_traceback)[-1]
-            event.set()
-            err_queue.put((e, tb, location))
+                    single_traversal.run(list(start_read_path))
+            new_path = single_traversal.result_path
+            logger.trace("    traversal {}: {}".format(search_id + 1, self.graph.repr_path(new_path)))
+            is_circular_p = self.graph.is_circular_path(new_path)
+            invalid_search = (self.force_circular and not is_circular_p) or \
+                             (self.uni_chromosome and not single_traversal.result_fully_covered)
+            if invalid_search:
+                continue
+            # if len(new_path) >= v_len * 2:  # using path length to guess multiple units is not a good idea
+            if is_circular_p:
+                new_path_list = self.__decompose_hetero_units(new_path)
+            else:
+                new_path_list = [new_path]
+            for new_path in new_path_list:
+                path_key = path_dict.encode_path(new_path)
+                batch_counts[path_key] = batch_counts.get(path_key, 0) + 1
+        return list(batch_counts.items())
 
     def __gen_heuristic_paths_mp(self, num_proc=2):
         """
-        multiprocess version of generating heuristic paths
-        starting a new process from dill dumped python object: slow
+        multiprocess version of generating heuristic paths.
+        Each worker runs batches of traversals with its own random seed and counts the variants locally.
+        The batches are merged in the order of submission by the main process,
+            which checks the stopping criteria between batches.
         """
+        global _traversal_generator
+        previous_ratio = 1.
+        previous_ratio_c = 1
+        flatten_n_parts = 0
+        num_valid_search = self.min_valid_search
+        variant_ids = {}
+        for go_v, variant in enumerate(self.variants):   # variant id is 1-based for easier manual inspection
+            variant_ids[variant] = go_v + 1
         self.count_valid = sum(self.variants_counts.values())
-        if self.count_valid >= self.min_valid_search:
-            # TODO: previous_ratio, etc can be loaded using json
-            add_search, previous_ratio, previous_ratio_c = \
-                self.__access_read_path_coverage(
-                    growing_variants=self.variants,
-                    previous_len_variant=0,
-                    num_valid_search=self.min_valid_search,
-                    path_not_traversed=self.__read_paths_not_in_variants,
-                    previous_un_traversed_ratio=1.,
-                    previous_un_traversed_ratio_count=1)
-            if not add_search:
+        if self.count_valid >= num_valid_search:
+            add_search, previous_ratio, previous_ratio_c = self.__access_read_path_coverage(
+                num_valid_search=num_valid_search,
+                previous_un_traversed_ratio=previous_ratio,
+                previous_un_traversed_ratio_count=previous_ratio_c)
+            if add_search:
+                num_valid_search += add_search
+            else:
                 logger.info("\t{}/{}/{}/{} uniq/valid/tvs/set variants".format(
                     len(self.variants), self.count_valid, "-", self.min_valid_search))
-                # logger.info("  {} unique paths in {}/{} valid paths, {} traversals".format(
-                #     len(self.variants), self.count_valid, self.min_valid_search, "-"))
                 logger.info("Sufficient previous valid paths loaded.")
                 return
-            else:
-                self.min_valid_search += add_search
-        else:
-            previous_ratio, previous_ratio_c = 1., 1
-
-        manager = Manager()
-        variants_counts = manager.dict()
-        variant_ids = manager.dict()
-        variants = manager.list()
-        path_not_traversed = manager.dict()
-        global_vars = manager.Namespace()
-        global_vars.run_status = ""
-        global_vars.count_search = self.count_search
-        global_vars.count_valid = self.count_valid
-        global_vars.num_valid_search = self.min_valid_search
-        global_vars.max_valid_search = self.max_valid_search
-        global_vars.previous_len_variant = self.__previous_len_variant
-        global_vars.previous_ratio = previous_ratio
-        #
-        global_vars.flatten_n_parts = 0
-        # create a start seed
-        global_vars.random_seed = self.__random.randint(1, 1e20)
-        # initialize the shared variable for recording the ratio of un-traversed reads
-        global_vars.previous_ratio_c = previous_ratio_c
-
-        if self.variants_counts:
-            variants_counts.update(self.variants_counts)
-            variants.extend(self.variants)
-            for go_v, variant in enumerate(self.variants):   # variant id is 1-based for easier manual inspection
-                variant_ids[variant] = go_v + 1
-            global_vars.previous_len_variant = self.__previous_len_variant = len(self.variants)
-        for rp_not_in_v in self.__read_paths_not_in_variants:
-            path_not_traversed[rp_not_in_v] = None
-
-        lock = manager.Lock()
-        event = manager.Event()
-        error_queue = manager.Queue()
-        # v_len = len(self.graph.vertex_info)
-        pool_obj = Pool(processes=num_proc)  # the worker processes are daemonic
-        # dump function and args
-        logger.info("Serializing the heuristic searching for multiprocessing ..")
-        payload = dill.dumps((self.__heuristic_traversal_worker,
-                              (variants,
-                               variant_ids,
-                               variants_counts,
-                               path_not_traversed,
-                               global_vars,
-                               lock,
-                               event,
-                               error_queue)))
-        # logger.info("Start generating candidate paths ..")
+
+        # encode all vertices before forking, so that the paths encoded by all workers share the same vertex codes
+        path_dict = self.graph.get_path_dictionary()
+        for v_name in self.graph.vertex_info:
+            path_dict.encode_vertex(v_name, True)
+        _traversal_generator = self
+        pool_obj = get_context("fork").Pool(processes=num_proc)
+        # batches submitted but not merged yet, each being (num_traversals, async_result)
+        pending_batches = deque()
+        num_submitted = self.count_search
+        run_status = ""
         try:
-            jobs = []
-            for g_p in range(num_proc):
-                logger.debug("assigning job to worker {}".format(g_p + 1))
-                jobs.append(pool_obj.apply_async(run_dill_encoded, (payload,)))
-                logger.debug("assigned job to worker {}".format(g_p + 1))
-                if global_vars.count_valid >= global_vars.num_valid_search:
-                    lock.acquire()
-                    add_search, global_vars.previous_ratio, global_vars.previous_ratio_c = \
-                        self.__access_read_path_coverage(
-                            growing_variants=variants,
-                            previous_len_variant=global_vars.previous_len_variant,
-                            num_valid_search=global_vars.num_valid_search,
-                            path_not_traversed=path_not_traversed,
-                            previous_un_traversed_ratio=global_vars.previous_ratio,
-                            previous_un_traversed_ratio_count=global_vars.previous_ratio_c)
-                    if not add_search:
-                        lock.release()
-                        break
+            while True:
+                # access num of traversal in the beginning
+                if self.count_search >= self.max_num_traversals:
+                    run_status = "tvs_reached"
+                    break
+                # keep each worker busy with up to two batches
+                while len(pending_batches) < 2 * num_proc and num_submitted < self.max_num_traversals:
+                    num_traversals = min(self.traversal_batch_size, self.max_num_traversals - num_submitted)
+                    batch_task = (self.__random.getrandbits(64), num_traversals, flatten_n_parts, num_submitted)
+                    pending_batches.append(
+                        (num_traversals, pool_obj.apply_async(_heuristic_traversal_batch_worker, (batch_task,))))
+                    num_submitted += num_traversals
+                num_traversals, batch_job = pending_batches.popleft()
+                batch_counts = batch_job.get()
+                self.count_search += num_traversals
+                # merge the batch
+                for path_key, path_count in batch_counts:
+                    new_path = path_dict.decode_path(path_key)
+                    self.count_valid += path_count
+                    if new_path in self.variants_counts:
+                        self.variants_counts[new_path] += path_count
+                        var_id = variant_ids[new_path]
+                        self.__save_tmp_counts(var_id, self.variants_counts[new_path])
+                        logger.debug("\t{}/{}/{}/{} uniq/valid/tvs/set variants".format(
+                            len(self.variants), self.count_valid, self.count_search, num_valid_search))
                     else:
-                        global_vars.num_valid_search += add_search
-                        global_vars.flatten_n_parts = min(global_vars.flatten_n_parts + 1, MAX_ADDING_TIMES)
-                        logger.info(f"setting flatten parts to be {global_vars.flatten_n_parts}")
-                        lock.release()
-            # for job in jobs:
-            #     job.get()  # tracking errors
-                # if "reached" in job_msg:
-                #     raise MaxTraversalReached("")
-                # elif "keyboard" in job_msg:
-                #     raise KeyboardInterrupt
-            pool_obj.close()
+                        self.variants_counts[new_path] = path_count
+                        self.variants.append(new_path)
+                        self.__read_path_coverage.add_variant(new_path)
+                        # variant id is 1-based for easier manual inspection
+                        var_id = variant_ids[new_path] = len(self.variants)
+                        self.__save_tmp_variant(var_id, new_path, path_count)
+                        logger.info("\t{}/{}/{}/{} uniq/valid/tvs/set variants".format(
+                            len(self.variants), self.count_valid, self.count_search, num_valid_search))
+                # check the stopping criteria between batches
+                if self.count_valid >= self.max_valid_search:
+                    run_status = "hard_reached"
+                    break
+                if len(self.variants) >= self.max_uniq_search:
+                    run_status = "uniq_reached"
+                    break
+                if self.count_valid >= num_valid_search:
+                    add_search, previous_ratio, previous_ratio_c = self.__access_read_path_coverage(
+                        num_valid_search=num_valid_search,
+                        previous_un_traversed_ratio=previous_ratio,
+                        previous_un_traversed_ratio_count=previous_ratio_c)
+                    if add_search:
+                        num_valid_search += add_search
+                        if flatten_n_parts < MAX_ADDING_TIMES:
+                            # the pending batches were submitted with the previous flatten_n_parts,
+                            # discard them (at most 2 * num_proc batches, MAX_ADDING_TIMES times) to be resubmitted
+                            while pending_batches:
+                                num_submitted -= pending_batches.pop()[0]
+                        flatten_n_parts = min(flatten_n_parts + 1, MAX_ADDING_TIMES)
+                        logger.info(f"setting flatten parts to be {flatten_n_parts}")
+                    else:
+                        break
         except KeyboardInterrupt:
-            # event.set()
-            # pool_obj.terminate()
-            # pool_obj.close()
-            logger.info("<Keyboard interrupt>")
-            self.__access_read_path_coverage(
-                growing_variants=variants,
-                previous_len_variant=global_vars.previous_len_variant,
-                num_valid_search=global_vars.num_valid_search,
-                path_not_traversed=path_not_traversed,
-                previous_un_traversed_ratio=global_vars.previous_ratio,
-                previous_un_traversed_ratio_count=global_vars.previous_ratio_c,
-                reset_num_valid_search=False)
-        else:
-            event.wait()
+            run_status = "interrupt"
+        except Exception:
+            logger.error("\n" + traceback.format_exc())
+            sys.exit(0)
+        finally:
             pool_obj.terminate()
-            while not error_queue.empty():
-                e, tb, location = error_queue.get()
-                logger.error("\n" + "".join(tb))
-                sys.exit(0)
-                # raise error_queue.get()
-            if global_vars.run_status in {"hard_reached", "tvs_reached", "uniq_reached", "interrupt"}:
-                # except MaxTraversalReached:
-                # pool_obj.terminate()
-                # pool_obj.join()  # maybe no need to join
-                if global_vars.run_status == "hard_reached":
-                    logger.info("maximum num of valid searches reached.")
-                elif global_vars.run_status == "uniq_reached":
-                    logger.info("maximum num of unique valid searches reached.")
-                elif global_vars.run_status == "tvs_reached":
-                    logger.info(f"Hit the max num of traversals limit {self.max_num_traversals}!")
-                elif global_vars.run_status == "interrupt":
-                    logger.info("<Keyboard interrupt>")
-                self.__access_read_path_coverage(
-                    growing_variants=variants,
-                    previous_len_variant=global_vars.previous_len_variant,
-                    num_valid_search=global_vars.num_valid_search,
-                    path_not_traversed=path_not_traversed,
-                    previous_un_traversed_ratio=global_vars.previous_ratio,
-                    previous_un_traversed_ratio_count=global_vars.previous_ratio_c,
-                    reset_num_valid_search=False)
-            # else:
-            # logger.info("waiting ..")
-            # pool_obj.join()  # maybe no need to join
-
-        self.variants_counts = dict(variants_counts)
-        self.variants = list(variants)
-        self.count_valid += global_vars.count_valid
-        self.count_search += global_vars.count_search
+            _traversal_generator = None
 
+        if run_status:
+            if run_status == "hard_reached":
+                logger.info("Maximum num of valid searches reached.")
+            elif run_status == "uniq_reached":
+                logger.info("Maximum num of unique valid searches reached.")
+            elif run_status == "tvs_reached":
+                logger.info(f"Hit the max num of traversals limit {self.max_num_traversals}!")
+            elif run_status == "interrupt":
+                logger.info("<Keyboard interrupt>")
+            self.__access_read_path_coverage(
+                num_valid_search=num_valid_search,
+                previous_un_traversed_ratio=previous_ratio,
+                previous_un_traversed_ratio_count=previous_ratio_c,
+                reset_num_valid_search=False)
         logger.info("\t{}/{}/{}/{} uniq/valid/tvs/set variants".format(
-            len(self.variants), global_vars.count_valid, global_vars.count_search, global_vars.num_valid_search))
-        # logger.info("  {} unique paths in {}/{} valid paths, {} traversals".format(
-        #     len(self.variants), global_vars.count_valid, global_vars.num_valid_search, global_vars.count_search))
+            len(self.variants), self.count_valid, self.count_search, num_valid_search))
 
     def __decompose_hetero_units(self, circular_path):
         """
@@ -1822,36 +1661,14 @@ class VariantGenerator(object):
     #         else:
     #             return [circular_path]
 
-    def __index_start_subpath(self, subpath, read_id, strand):
-        """
-        :param subpath: tuple
-        :param read_id: int, read id in self.read_paths
-        :param strand: bool
-        :return:
-        """
-        if subpath in self.__start_subpath_to_readpaths:
-            self.__start_subpath_to_readpaths[subpath].add((read_id, strand))
-        else:
-            self.__start_subpath_to_readpaths[subpath] = {(read_id, strand)}
-
-    def __index_middle_subpath(self, subpath, read_id, strand):
-        """
-        :param subpath: tuple
-        :param read_id: int, read id in self.read_paths
-        :param strand: bool
-        :param subpath_loc: int, the location of the subpath in a read
-        :return:
-        """
-        if subpath in self.__middle_subpath_to_readpaths:
-            self.__middle_subpath_to_readpaths[subpath].add((read_id, strand))
-        else:
-            self.__middle_subpath_to_readpaths[subpath] = {(read_id, strand)}
+    def pass_read_path_index(self):
+        return self.__read_path_index
 
-    def pass_starting_subpath_to_readpaths(self):
-        return self.__start_subpath_to_readpaths
+    def pass_read_path_automaton(self):
+        return self.__read_path_automaton
 
-    def pass_middle_subpath_to_readpaths(self):
-        return self.__middle_subpath_to_readpaths
+    def pass_graph_core(self):
+        return self.__graph_core
 
     def pass_read_paths_counter(self):
         return self.read_paths_counter
@@ -130,6 +130,17 @@ class ModelSelectionMode(str, Enum):
     # Single = "single"
 
 
+class MLSolver(str, Enum):
+    slsqp = "slsqp"
+    trust_constr = "trust-constr"
+    em = "em"
+
+
+class BootstrapSampler(str, Enum):
+    counts = "counts"
+    records = "records"
+
+
 class ChTopology(str, Enum):
     circular = "circular"
     unconstrained = "all"
@@ -313,9 +324,26 @@ def thorough(
         ModelSelectionMode.BIC, "-F", "--func",
         help="AIC (reverse model selection using stepwise AIC)\n"
              "BIC (reverse model selection using stepwise BIC, default)"),
+    ml_solver: MLSolver = typer.Option(
+        MLSolver.slsqp, "--ml-solver",
+        help="slsqp (Sequential Least Squares Programming with exact gradient, default)\n"
+             "trust-constr (trust region with exact gradient and Hessian-vector product)\n"
+             "em (expectation-maximization, fast but slow to shrink unsupported variants to zero)"),
+    ml_runs: int = typer.Option(
+        6, "--ml-runs",
+        help="Number of successful maximum likelihood runs from random initials, the best one is kept. ",
+        min=1),
+    ml_warm_start: bool = typer.Option(
+        False, "--ml-warm-start",
+        help="During reverse model selection, refit each reduced model once from the proportions of its parent "
+             "model instead of from '--ml-runs' random initials. "),
     bootstrap: int = typer.Option(
         100, "--bs", "--bootstrap",
         help="The number of repeats used to perform bootstrap analysis. "),
+    bootstrap_sampler: BootstrapSampler = typer.Option(
+        BootstrapSampler.counts, "--bs-sampler",
+        help="counts (draw the resampled times of all records as one multinomial count vector, default)\n"
+             "records (draw and sort the resampled records one by one)"),
     bs_threshold: float = typer.Option(
         0.95, "--bs-threshold",  # "--bootstrap-threshold",
         help="Support below which will be treated as unsupported. "
@@ -448,6 +476,12 @@ def thorough(
     keep_temp: bool = typer.Option(
         False, "--keep-temp",
         help="Keep intermediate graph, alignment, and candidate variant files. Deleted by default. "),
+    stage_cache_dir: Path = typer.Option(
+        None, "--stage-cache",
+        help="A directory to cache the outputs of the data digesting, variant searching and sub-path indexing, "
+             "keyed by the input contents and relevant options. Runs sharing this directory "
+             "(e.g. only changing '--criterion' or '--bootstrap') skip the stages with unchanged inputs. "
+             "Disabled by default. "),
     log_level: LogLevel = typer.Option(
         LogLevel.INFO, "--loglevel", help="Logging level. Use DEBUG for more, ERROR for less."),
     ):
@@ -562,8 +596,12 @@ def thorough(
             var_candidate=str(var_candidate) if var_candidate else var_candidate,
             outdir=str(output_dir),
             model_criterion=criterion,
+            ml_solver=ml_solver.value,
+            ml_runs=ml_runs,
+            ml_warm_start=ml_warm_start,
             bootstrap=bootstrap,
             bs_threshold=bs_threshold,
+            bootstrap_sampler=bootstrap_sampler.value,
             jackknife=jackknife,
             # fast_bootstrap=fast_bootstrap,  # deprecated
             out_prob_threshold=out_seq_threshold,
@@ -602,6 +640,7 @@ def thorough(
             mc_bracket_depth=mc_bracket_depth,
             # use_gfa_alignment=use_gfa_annotation_lines,
             keep_temp=keep_temp,
+            stage_cache_dir=str(stage_cache_dir) if stage_cache_dir else stage_cache_dir,
         )
         traverser.run()
         del traverser
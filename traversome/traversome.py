@@ -9,31 +9,51 @@ import sys
 import random
 
 from loguru import logger
+from hashlib import blake2b
 from copy import deepcopy
 from pathlib import Path as fpath
 from collections import OrderedDict
 from traversome.Assembly import Assembly
 from traversome.PanGenome import PanGenome
-from traversome.GraphAlignRecords import GraphAlignRecords
+from traversome.GraphAlignRecords import GraphAlignRecords, GAFRecordColumns
 from traversome.GraphAlignConflicts import GraphAlignConflicts
 from traversome.utils import \
     SubPathInfo, Criterion, VariantSubPathsGenerator, executable, run_graph_aligner, user_paths_reader, setup_logger, \
-    path_to_gaf_str, Bins, BinInfo, optimize_min_adj
+    path_to_gaf_str, BinArrays, optimize_min_adj
 from traversome.ModelFitMaxLike import ModelFitMaxLike
 from traversome.VariantGenerator import VariantGenerator
+from traversome.StageCache import StageCache
 from traversome.ModelGenerator import PathMultinomialModel
 from typing import OrderedDict as typingODict
 from typing import Set, Union
-from multiprocessing import Manager, Pool
+from multiprocessing import Manager, Pool, get_context
 import gc
 import math
 import numpy as np
 # import time
 
 
+# the Traversome object shared with the forked bootstrap workers, see Traversome.do_subsampling
+_bootstrap_traverser = None
+
+
+def _bootstrap_replicate_worker(task):
+    go_bs, n_replicate, random_seed = task
+    return _bootstrap_traverser._do_one_replicate(go_bs, n_replicate, random_seed, n_proc=1)
+
+
 class Traversome(object):
     """
     """
+    # outputs of the stages that can be loaded from the stage cache, see Traversome.run
+    DIGEST_ATTRIBUTES = (
+        "graph", "user_variant_paths", "user_variant_fixed_ids", "read_paths", "read_paths_masked",
+        "align_len_at_path_map", "num_valid_records", "min_alignment_length", "max_alignment_length",
+        "max_read_path_size")
+    VARIANTS_ATTRIBUTES = ("variant_paths", "variant_sizes", "variant_topos")
+    SUB_PATHS_ATTRIBUTES = (
+        "variant_subpath_counters", "be_unidentifiable_to", "repr_to_merged_variants", "all_sub_paths",
+        "bin_arrays", "_start_point_params", "_start_point_param_rows")
 
     def __init__(
             self,
@@ -48,6 +68,7 @@ class Traversome(object):
             uni_chromosome=False,
             out_prob_threshold=0.001,
             keep_temp=False,
+            stage_cache_dir=None,
             random_seed=12345,
             loglevel="INFO",
             resume=False,
@@ -73,6 +94,7 @@ class Traversome(object):
         self.uni_chromosome = uni_chromosome
         self.out_prob_threshold = out_prob_threshold
         self.keep_temp = keep_temp
+        self.stage_cache = StageCache(stage_cache_dir) if stage_cache_dir else None
         self.resume = resume
         self.min_alignment_len_cutoff = min_alignment_len_cutoff
         self.min_record_identity_cutoff = min_record_identity_cutoff
@@ -109,17 +131,26 @@ class Traversome(object):
         self.all_sub_paths = OrderedDict()
         self.sbp_to_sbp_id = {}
         self.observed_sbp_id_set = set()
-        self.bins_list = []
-        self._cache_num_ali_starts = {}
+        self.bin_arrays = None
+        # memo table of the alignment start point parameters of self.all_sub_paths, see self._get_start_point_params
+        self._start_point_params = None
+        self._start_point_param_rows = {}
 
         # for bootstrapping records
         self.records_pool_in_sbp_ids = []
         self.records_pool_to_sbp_ids = {}
         self.records_pool_sorted = []
+        # numeric form of the records pool for the count-vector bootstrap, see self._prepare_for_sampling
+        self.records_pool_array = None
+        self.records_pool_sbp_array = None
+        self.records_pool_len_order = None
+        self.records_pool_len_sorted = None
         self.be_unidentifiable_to = {}
         # use the merged variants to represent each set of variants.
         # within each set the variants are unidentifiable to each other
         self.repr_to_merged_variants = {}
+        # sub-path profile fingerprint -> representative variant ids, see self.group_unidentifiable_variant
+        self.__profile_fingerprint_to_reprs = {}
         # The result of model fitting using ml/mc, the base to update above model information for a second fitting run
         # {variant_id: percent}
         self.variant_proportions = OrderedDict()
@@ -141,11 +172,202 @@ class Traversome(object):
         self.model = None
         self.random = random
         self.random.seed(random_seed)
+        self.random_seed = random_seed
 
     def run(self):
         """
         """
         logger.info("======== DIGESTING DATA STARTS ========")
+        digest_key = self.__run_stage(
+            stage="digest",
+            upstream_key=None,
+            stage_func=self.digest_data,
+            attributes=self.DIGEST_ATTRIBUTES)
+        self.subpath_generator = VariantSubPathsGenerator(
+            graph=self.graph,
+            # force_circular=self.force_circular,
+            min_alignment_len=self.min_alignment_length,
+            max_alignment_len=self.max_alignment_length,
+            read_paths_hashed=set(self.read_paths))
+        logger.info("======== DIGESTING DATA ENDS ========\n")
+
+        logger.info("======== VARIANTS SEARCHING STARTS ========")
+        # logger.debug("Cleaning graph ...")
+        # self.clean_graph()
+        variants_key = self.__run_stage(
+            stage="variants",
+            upstream_key=digest_key,
+            stage_func=self.search_variants,
+            attributes=self.VARIANTS_ATTRIBUTES,
+            keep_random_state=True,
+            # the resumed search continues from the candidates of the previous run, which are not in the key
+            use_cache=not self.resume)
+
+        self.num_put_variants = len(self.variant_paths)
+        if self.num_put_variants == 0:
+            logger.error("No candidate variants found!")
+            logger.info("======== VARIANTS SEARCHING ENDS ========\n")
+            raise SystemExit(0)
+        elif self.num_put_variants == 1 or len(self.repr_to_merged_variants) == 1:
+            self.variant_proportions_best[0] = self.variant_proportions[0] = 1.
+            logger.info("======== VARIANTS SEARCHING ENDS ========\n")
+        else:
+            logger.info("======== VARIANTS SEARCHING ENDS ========\n")
+            logger.info("======== MODEL SELECTION & FITTING STARTS ========")
+            for go_p, path in enumerate(self.variant_paths):
+                logger.debug("PATH{}: {}".format(go_p, self.graph.repr_path(path)))
+
+            self.__run_stage(
+                stage="sub_paths",
+                upstream_key=variants_key,
+                stage_func=self.index_sub_paths,
+                attributes=self.SUB_PATHS_ATTRIBUTES,
+                keep_random_state=True,
+                use_cache=variants_key is not None)
+            main_sub_paths = self.all_sub_paths
+
+            # build an index, used to access all read paths are covered in later model selection
+            sbp_to_sbp_id = self.update_sp_to_sp_id_dict(main_sub_paths)
+            # difference between this number and total number of sub-paths
+            #            will happen when the current variants cannot cover all read paths
+            #                     or when an alignable path is not informative
+            logger.debug("Estimating candidate variant frequencies using Maximum Likelihood...")
+
+            self.model = PathMultinomialModel(
+                variant_sizes=self.variant_sizes,
+                variant_topos=self.variant_topos,
+                bins_list=None,
+                all_sub_paths=main_sub_paths,
+                bin_arrays=self.bin_arrays)
+            self.variant_proportions, self.res_loglike, self.res_criterion = \
+                self.fit_model_using_reverse_model_selection(
+                    model=self.model,
+                    sbp_to_sbp_id=sbp_to_sbp_id,
+                    criterion=self.kwargs.get("model_criterion", Criterion.BIC))
+            logger.info("======== MODEL SELECTION & FITTING ENDS ========\n")
+
+            if self.kwargs.get("bootstrap", 0) or self.kwargs.get("jackknife", 0):
+                logger.info("======== BOOTSTRAPPING STARTS ========")
+                self.do_subsampling()
+                logger.info("======== BOOTSTRAPPING ENDS ========\n")
+
+            if not self.variant_proportions_best:  # if it is not modified during subsampling
+                self.variant_proportions_best = deepcopy(self.variant_proportions)
+
+            # update candidate info according to the result of reverse model selection
+            # assure self.repr_to_merged_variants was generated
+            if self.kwargs.get("n_generations", 0) > 0 and \
+                    len([repr_v
+                         for repr_v in self.variant_proportions_best
+                         if repr_v in self.repr_to_merged_variants]) > 1:
+                # TODO add mcmc result to the summary table
+                logger.info("======== BAYESIAN ESTIMATION STARTS ========")
+                logger.debug("Estimating candidate variant frequencies using Bayesian MCMC ...")
+                self.variant_proportions_best = \
+                    self.fit_model_using_bayesian_mcmc(chosen_ids=self.variant_proportions_best)
+                logger.info("======== BAYESIAN ESTIMATION ENDS ========\n")
+
+        logger.info("======== OUTPUT FILES STARTS ========")
+        self.output_variant_info()
+        self.output_sampling_info()
+        self.output_result_info()
+        if self.kwargs.get("bootstrap", 0) == 0 or self.bs_eligible or self.num_put_variants == 1:
+            self.output_pangenome_graph()
+            self.output_seqs()
+        # remove temporary files
+        if not self.keep_temp:
+            for f_ in os.listdir(self.outdir):
+                # remove tmp.*.gfa and tmp.*.gaf
+                if f_.startswith("tmp.") and os.path.isfile(os.path.join(self.outdir, f_)):
+                    os.remove(os.path.join(self.outdir, f_))
+                # remove tmp.candidates
+                elif f_.startswith("tmp.") and os.path.isdir(os.path.join(self.outdir, f_)):
+                    for f__ in os.listdir(os.path.join(self.outdir, f_)):
+                        os.remove(os.path.join(self.outdir, f_, f__))
+                    os.rmdir(os.path.join(self.outdir, f_))
+            # # also remove the non empty directory tmp.candidates
+            # if os.path.exists(os.path.join(self.outdir, "tmp.candidates")):
+            #     for f_ in os.listdir(os.path.join(self.outdir, "tmp.candidates")):
+            #         os.remove(os.path.join(self.outdir, "tmp.candidates", f_))
+            #     os.rmdir(os.path.join(self.outdir, "tmp.candidates"))
+        logger.info("======== OUTPUT FILES ENDS ========\n")
+
+    def __get_stage_options(self, stage):
+        """
+        :return: dict of the input file digests and the options that the outputs of the stage depend on
+        """
+        if stage == "digest":
+            stage_options = {
+                "graph": self.stage_cache.hash_file(self.graph_file),
+                "graph_format": self.graph_format,
+                "var_fixed": self.stage_cache.hash_file(self.var_fixed_f),
+                "var_candidate": self.stage_cache.hash_file(self.var_candidate_f),
+                "min_alignment_len_cutoff": self.min_alignment_len_cutoff,
+                "min_record_identity_cutoff": self.min_record_identity_cutoff,
+                "min_read_identity_cutoff": self.min_read_identity_cutoff,
+                "min_alignment_counts": self.min_alignment_counts,
+            }
+            if self.alignment_file:
+                stage_options["alignment"] = self.stage_cache.hash_file(self.alignment_file)
+            else:
+                stage_options["reads"] = self.stage_cache.hash_file(self.reads_file)
+                stage_options["graph_aligner_params"] = self.kwargs.get("graph_aligner_params", "")
+            for opt_name in ("graph_component_selection", "keep_graph_redundancy", "use_alignment_cov",
+                             "purge_shallow_contigs", "prune_terminal_contigs", "keep_unaligned_contigs",
+                             "ignore_conflicts", "add_conflict_edges", "gmm_max_std", "quality_control_alignment_cov"):
+                stage_options[opt_name] = self.kwargs.get(opt_name, None)
+            return stage_options
+        elif stage == "variants":
+            stage_options = {
+                "search_start_scheme": getattr(self.kwargs.get("search_start_scheme", None), "value", "random"),
+                "num_processes": self.num_processes,
+                "uni_chromosome": self.uni_chromosome,
+                "force_circular": self.force_circular,
+                "random_seed": self.random_seed,
+            }
+            for opt_name in ("search_decay_factor", "min_valid_search", "max_valid_search", "max_num_traversals",
+                             "max_uniq_traversal", "max_uncover_ratio", "size_ratio"):
+                stage_options[opt_name] = self.kwargs.get(opt_name, None)
+            return stage_options
+        else:
+            # the sub-paths and the bins are determined by the read paths and the variants
+            return {}
+
+    def __run_stage(self, stage, upstream_key, stage_func, attributes, keep_random_state=False, use_cache=True):
+        """
+        Run a stage of the pipeline, or load its outputs from the stage cache if the same inputs were processed.
+        :param stage: name of the stage
+        :param upstream_key: key of the upstream stage
+        :param stage_func: function to run the stage, which sets the attributes
+        :param attributes: names of the attributes as the outputs of the stage
+        :param keep_random_state: also cache the state of self.random after the stage,
+            so that the downstream stages draw the same random numbers after loading
+        :param use_cache: False to run the stage without the stage cache, e.g. when its inputs cannot be keyed
+        :return: key of the stage, or None if the stage cache is disabled or bypassed
+        """
+        if self.stage_cache is None or not use_cache:
+            stage_func()
+            return None
+        stage_key = self.stage_cache.get_key(stage, upstream_key, self.__get_stage_options(stage))
+        stage_output = self.stage_cache.load(stage, stage_key)
+        if stage_output is None:
+            stage_func()
+            stage_output = {attr: getattr(self, attr) for attr in attributes}
+            if keep_random_state:
+                stage_output["random_state"] = self.random.getstate()
+            self.stage_cache.dump(stage, stage_key, stage_output)
+        else:
+            logger.info(f"Loaded the outputs of stage '{stage}' from the stage cache ({stage_key})")
+            if keep_random_state:
+                self.random.setstate(stage_output.pop("random_state"))
+            for attr in attributes:
+                setattr(self, attr, stage_output[attr])
+        return stage_key
+
+    def digest_data(self):
+        """
+        parse and filter the graph and the alignment, and generate the read paths
+        """
         # TODO use json to store env parameters later
         self.graph = Assembly(self.graph_file)
         self.graph.update_vertex_clusters()
@@ -222,6 +444,7 @@ class Traversome(object):
                     min_record_identity=min_record_identity_cutoff,
                     min_align_len=min_alignment_len_cutoff,
                     min_identity=min_read_identity_cutoff,
+                    num_proc=self.num_processes,
                 )
             else:
                 # initial read
@@ -230,6 +453,7 @@ class Traversome(object):
                     min_record_identity=min_record_identity_cutoff,
                     min_align_len=100 if min_alignment_len_cutoff == "auto" else min_alignment_len_cutoff,
                     min_identity=0.8 if min_read_identity_cutoff == "auto" else min_read_identity_cutoff,
+                    num_proc=self.num_processes,
                     )
                 self.auto_filter_alignment(alignment, min_alignment_len_cutoff, min_read_identity_cutoff)
             if not alignment.raw_records:
@@ -303,17 +527,10 @@ class Traversome(object):
             logger.error("Insufficient alignment records remains after filtering!")
             raise SystemExit(0)
 
-        self.subpath_generator = VariantSubPathsGenerator(
-            graph=self.graph,
-            # force_circular=self.force_circular,
-            min_alignment_len=self.min_alignment_length,
-            max_alignment_len=self.max_alignment_length,
-            read_paths_hashed=set(self.read_paths))
-        logger.info("======== DIGESTING DATA ENDS ========\n")
-
-        logger.info("======== VARIANTS SEARCHING STARTS ========")
-        # logger.debug("Cleaning graph ...")
-        # self.clean_graph()
+    def search_variants(self):
+        """
+        generate the candidate variants, or take the user assigned variants if the heuristic search is disabled
+        """
         if self.kwargs.get("max_valid_search", 100000) == 0:
             self.variant_paths = list(self.user_variant_paths)
             self.variant_sizes = [self.graph.get_path_length(variant_p, check_valid=False, adjust_for_cyclic=True)
@@ -337,106 +554,31 @@ class Traversome(object):
                 size_ratio=self.kwargs.get("size_ratio", 0.0)
             )
 
-        self.num_put_variants = len(self.variant_paths)
-        if self.num_put_variants == 0:
-            logger.error("No candidate variants found!")
-            logger.info("======== VARIANTS SEARCHING ENDS ========\n")
-            raise SystemExit(0)
-        elif self.num_put_variants == 1 or len(self.repr_to_merged_variants) == 1:
-            self.variant_proportions_best[0] = self.variant_proportions[0] = 1.
-            logger.info("======== VARIANTS SEARCHING ENDS ========\n")
-        else:
-            logger.info("======== VARIANTS SEARCHING ENDS ========\n")
-            logger.info("======== MODEL SELECTION & FITTING STARTS ========")
-            for go_p, path in enumerate(self.variant_paths):
-                logger.debug("PATH{}: {}".format(go_p, self.graph.repr_path(path)))
-
-            logger.info("Generating sub-paths ..")
-            self.gen_all_informative_sub_paths()
-            # ONLY apply self.read_paths_masked to model selection and fitting
-            # main_sub_paths, align_len_at_path_sorted = \
-            #     self.sample_sub_paths(masking=self.read_paths_masked)
-            # logger.info("Indexing {} valid informative sub-paths after masking ".format(len(filtered_sub_paths)))
-            # self.all_sub_paths = filtered_sub_paths  # assign the post-filter sub_paths
-            main_sub_paths = self.all_sub_paths
-            logger.info("Indexing {} valid informative sub-paths ".format(len(main_sub_paths)))
-            rec_id_sorted_by_len, align_len_at_path_sorted = \
-                zip(*sorted(self.align_len_at_path_map.items(), key=lambda x: (x[1], x[0])))  # by length then record id
-            # align_len_at_path_sorted = sorted(self.align_len_at_path_map.values())
-            max_len, min_len = max(align_len_at_path_sorted), min(align_len_at_path_sorted)
-            logger.info("Alignment length range at path: [{}, {}]".format(min_len, max_len))
-            logger.info("Alignment max size at path: {}".format(self.get_max_read_path_size(main_sub_paths)))
-            self.bins_list = self.generate_multinomial_bin_stats(
-                main_sub_paths,
-                rec_id_sorted_by_len=rec_id_sorted_by_len,
-                align_len_at_path_sorted=align_len_at_path_sorted,
-                quiet=False)
-            # self.generate_sub_path_stats(main_sub_paths, align_len_at_path_sorted)
-
-            # build an index, used to access all read paths are covered in later model selection
-            sbp_to_sbp_id = self.update_sp_to_sp_id_dict(main_sub_paths)
-            # difference between this number and total number of sub-paths
-            #            will happen when the current variants cannot cover all read paths
-            #                     or when an alignable path is not informative
-            logger.debug("Estimating candidate variant frequencies using Maximum Likelihood...")
-
-            self.model = PathMultinomialModel(
-                variant_sizes=self.variant_sizes,
-                variant_topos=self.variant_topos,
-                bins_list=self.bins_list,
-                all_sub_paths=main_sub_paths)
-            self.variant_proportions, self.res_loglike, self.res_criterion = \
-                self.fit_model_using_reverse_model_selection(
-                    model=self.model,
-                    sbp_to_sbp_id=sbp_to_sbp_id,
-                    criterion=self.kwargs.get("model_criterion", Criterion.BIC))
-            logger.info("======== MODEL SELECTION & FITTING ENDS ========\n")
-
-            if self.kwargs.get("bootstrap", 0) or self.kwargs.get("jackknife", 0):
-                logger.info("======== BOOTSTRAPPING STARTS ========")
-                self.do_subsampling()
-                logger.info("======== BOOTSTRAPPING ENDS ========\n")
-
-            if not self.variant_proportions_best:  # if it is not modified during subsampling
-                self.variant_proportions_best = deepcopy(self.variant_proportions)
-
-            # update candidate info according to the result of reverse model selection
-            # assure self.repr_to_merged_variants was generated
-            if self.kwargs.get("n_generations", 0) > 0 and \
-                    len([repr_v
-                         for repr_v in self.variant_proportions_best
-                         if repr_v in self.repr_to_merged_variants]) > 1:
-                # TODO add mcmc result to the summary table
-                logger.info("======== BAYESIAN ESTIMATION STARTS ========")
-                logger.debug("Estimating candidate variant frequencies using Bayesian MCMC ...")
-                self.variant_proportions_best = \
-                    self.fit_model_using_bayesian_mcmc(chosen_ids=self.variant_proportions_best)
-                logger.info("======== BAYESIAN ESTIMATION ENDS ========\n")
-
-        logger.info("======== OUTPUT FILES STARTS ========")
-        self.output_variant_info()
-        self.output_sampling_info()
-        self.output_result_info()
-        if self.kwargs.get("bootstrap", 0) == 0 or self.bs_eligible or self.num_put_variants == 1:
-            self.output_pangenome_graph()
-            self.output_seqs()
-        # remove temporary files
-        if not self.keep_temp:
-            for f_ in os.listdir(self.outdir):
-                # remove tmp.*.gfa and tmp.*.gaf
-                if f_.startswith("tmp.") and os.path.isfile(os.path.join(self.outdir, f_)):
-                    os.remove(os.path.join(self.outdir, f_))
-                # remove tmp.candidates
-                elif f_.startswith("tmp.") and os.path.isdir(os.path.join(self.outdir, f_)):
-                    for f__ in os.listdir(os.path.join(self.outdir, f_)):
-                        os.remove(os.path.join(self.outdir, f_, f__))
-                    os.rmdir(os.path.join(self.outdir, f_))
-            # # also remove the non empty directory tmp.candidates
-            # if os.path.exists(os.path.join(self.outdir, "tmp.candidates")):
-            #     for f_ in os.listdir(os.path.join(self.outdir, "tmp.candidates")):
-            #         os.remove(os.path.join(self.outdir, "tmp.candidates", f_))
-            #     os.rmdir(os.path.join(self.outdir, "tmp.candidates"))
-        logger.info("======== OUTPUT FILES ENDS ========\n")
+    def index_sub_paths(self):
+        """
+        generate the informative sub-paths of the candidate variants and their multinomial bin arrays
+        """
+        logger.info("Generating sub-paths ..")
+        self.gen_all_informative_sub_paths()
+        # ONLY apply self.read_paths_masked to model selection and fitting
+        # main_sub_paths, align_len_at_path_sorted = \
+        #     self.sample_sub_paths(masking=self.read_paths_masked)
+        # logger.info("Indexing {} valid informative sub-paths after masking ".format(len(filtered_sub_paths)))
+        # self.all_sub_paths = filtered_sub_paths  # assign the post-filter sub_paths
+        main_sub_paths = self.all_sub_paths
+        logger.info("Indexing {} valid informative sub-paths ".format(len(main_sub_paths)))
+        rec_id_sorted_by_len, align_len_at_path_sorted = \
+            zip(*sorted(self.align_len_at_path_map.items(), key=lambda x: (x[1], x[0])))  # by length then record id
+        # align_len_at_path_sorted = sorted(self.align_len_at_path_map.values())
+        max_len, min_len = max(align_len_at_path_sorted), min(align_len_at_path_sorted)
+        logger.info("Alignment length range at path: [{}, {}]".format(min_len, max_len))
+        logger.info("Alignment max size at path: {}".format(self.get_max_read_path_size(main_sub_paths)))
+        self.bin_arrays = self.generate_multinomial_bin_arrays(
+            main_sub_paths,
+            rec_id_sorted_by_len=rec_id_sorted_by_len,
+            align_len_at_path_sorted=align_len_at_path_sorted,
+            quiet=False)
+        # self.generate_sub_path_stats(main_sub_paths, align_len_at_path_sorted)
 
     def auto_filter_alignment(self, alignment, min_alignment_len_cutoff, min_alignment_identity_cutoff):
         # lengths = [r.p_align_len for r in alignment.raw_records]
@@ -502,47 +644,25 @@ class Traversome(object):
         """
         using bootstrap or jackknife
         """
-        # TODO parallelize bootstrap if necessary
         self._prepare_for_sampling()
         n_replicate = self.kwargs.get("bootstrap", 0) \
             if self.kwargs.get("bootstrap", 0) else self.kwargs.get("jackknife", 0)
         threshold = self.kwargs.get("bs_threshold", 0.95)
         count_unique = {}
         self.variant_proportions_reps = []
-        n_digit = len(str(n_replicate))
-        go_bs = 0
         self.bs_eligible = True
-        while go_bs < n_replicate:
-            logger.debug(f"Sampling {go_bs + 1} --------")
-            logger.debug("Generating sub-paths ..")
-            if self.kwargs.get("bootstrap", 0):
-                sampled_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted = \
-                    self.sample_sub_paths(bootstrap_size=self.num_valid_records, masking=self.read_paths_masked)
-            else:
-                sampled_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted = \
-                    self.sample_sub_paths(
-                        jackknife_size=int(self.num_valid_records / float(n_replicate)),
-                        masking=self.read_paths_masked)
-            logger.debug("Indexing {} valid informative sub-paths after masking ".format(len(sampled_sub_paths)))
-            if not sampled_sub_paths:
-                continue
-            # self.generate_sub_path_stats(sampled_sub_paths, align_len_at_path_sorted=align_len_at_path_sorted)
-            bins_list = self.generate_multinomial_bin_stats(
-                all_sub_paths=sampled_sub_paths,
-                rec_id_sorted_by_len=rec_id_sorted_by_len,
-                align_len_at_path_sorted=align_len_at_path_sorted)
-            sbp_to_sbp_id = self.update_sp_to_sp_id_dict(sampled_sub_paths)
-            sampled_model = PathMultinomialModel(
-                variant_sizes=self.variant_sizes,
-                variant_topos=self.variant_topos,
-                bins_list=bins_list,
-                all_sub_paths=sampled_sub_paths)
-            v_prop, *foo = self.fit_model_using_reverse_model_selection(
-                model=sampled_model,
-                sbp_to_sbp_id=sbp_to_sbp_id,
-                criterion=self.kwargs.get("model_criterion", Criterion.BIC),
-                init_self_max_like=False,
-                bootstrap_str=f"BS{go_bs + 1: 0{n_digit}d}")
+        # one independent random stream per replicate derived from the user seed,
+        # so that the replicates depend neither on the num of processes nor on the random draws of previous steps
+        seed_generator = random.Random(self.random_seed)
+        rep_seeds = [seed_generator.randint(0, 2 ** 31 - 1) for foo in range(n_replicate)]
+        n_proc = min(self.num_processes, n_replicate)
+        if n_proc > 1:
+            replicates = self.__iter_replicates_in_pool(n_proc=n_proc, n_replicate=n_replicate, rep_seeds=rep_seeds)
+        else:
+            replicates = (self._do_one_replicate(go_bs, n_replicate, rep_seeds[go_bs])
+                          for go_bs in range(n_replicate))
+        # replicates are yielded in order, so that the early termination is the same as in a sequential run
+        for go_bs, v_prop in enumerate(replicates):
             self.variant_proportions_reps.append(v_prop)
             # self.res_loglike_reps.append(loglike)
             # self.res_criteria_reps.append(criteria)
@@ -552,7 +672,8 @@ class Traversome(object):
                                 "No convincing support can be found given the dataset and parameters. ")
                 self.bs_eligible = False
                 break
-            go_bs += 1
+        # stop the remaining replicates if terminated early
+        replicates.close()
 
         # if loglevel is reset, set it back
         setup_logger(loglevel=self.loglevel, timed=True, log_file=self.logfile)
@@ -616,6 +737,76 @@ class Traversome(object):
                 if go_s == 0 and tuple_v_chosen != raw_res and chosen_dict["support"] > 0.05:
                     self.variant_proportions_best = raw_prop
 
+    def _do_one_replicate(self, go_bs, n_replicate, random_seed, n_proc=None):
+        """
+        Fit one bootstrap/jackknife replicate using its own random stream
+        :param go_bs: replicate id
+        :param random_seed: seed of the sampling and of the model selection of this replicate
+        :param n_proc: num of processes for the model selection, self.num_processes by default
+        :return: variant proportions
+        """
+        random_obj = random.Random(random_seed)
+        np_random = np.random.default_rng(random_seed)
+        n_digit = len(str(n_replicate))
+        logger.debug(f"Sampling {go_bs + 1} --------")
+        sampled_sub_paths = None
+        while not sampled_sub_paths:
+            logger.debug("Generating sub-paths ..")
+            if self.kwargs.get("bootstrap", 0) and self.kwargs.get("bootstrap_sampler", "counts") == "counts":
+                sampled_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted = \
+                    self.sample_sub_path_counts(
+                        bootstrap_size=self.num_valid_records, masking=self.read_paths_masked, np_random=np_random)
+            elif self.kwargs.get("bootstrap", 0):
+                sampled_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted = \
+                    self.sample_sub_paths(
+                        bootstrap_size=self.num_valid_records, masking=self.read_paths_masked, random_obj=random_obj)
+            else:
+                sampled_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted = \
+                    self.sample_sub_paths(
+                        jackknife_size=int(self.num_valid_records / float(n_replicate)),
+                        masking=self.read_paths_masked,
+                        random_obj=random_obj)
+            logger.debug("Indexing {} valid informative sub-paths after masking ".format(len(sampled_sub_paths)))
+        # self.generate_sub_path_stats(sampled_sub_paths, align_len_at_path_sorted=align_len_at_path_sorted)
+        bin_arrays = self.generate_multinomial_bin_arrays(
+            all_sub_paths=sampled_sub_paths,
+            rec_id_sorted_by_len=rec_id_sorted_by_len,
+            align_len_at_path_sorted=align_len_at_path_sorted)
+        sbp_to_sbp_id = self.update_sp_to_sp_id_dict(sampled_sub_paths)
+        sampled_model = PathMultinomialModel(
+            variant_sizes=self.variant_sizes,
+            variant_topos=self.variant_topos,
+            bins_list=None,
+            all_sub_paths=sampled_sub_paths,
+            bin_arrays=bin_arrays)
+        v_prop, *foo = self.fit_model_using_reverse_model_selection(
+            model=sampled_model,
+            sbp_to_sbp_id=sbp_to_sbp_id,
+            criterion=self.kwargs.get("model_criterion", Criterion.BIC),
+            init_self_max_like=False,
+            bootstrap_str=f"BS{go_bs + 1: 0{n_digit}d}",
+            n_proc=n_proc,
+            np_random=np.random.RandomState(random_seed))
+        return v_prop
+
+    def __iter_replicates_in_pool(self, n_proc, n_replicate, rep_seeds):
+        """
+        Run the replicates in forked processes, which share the read-only data of this object
+        (self.all_sub_paths, self.align_len_at_path_map, self.records_pool_*, ...) without copying.
+        The model selection inside each replicate uses a single process.
+        :return: generator of the variant proportions in the order of replicates
+        """
+        global _bootstrap_traverser
+        logger.info("Running {} replicates using {} processes ..".format(n_replicate, n_proc))
+        _bootstrap_traverser = self
+        try:
+            with get_context("fork").Pool(processes=n_proc) as pool_obj:
+                yield from pool_obj.imap(
+                    _bootstrap_replicate_worker,
+                    [(go_bs, n_replicate, rep_seeds[go_bs]) for go_bs in range(n_replicate)])
+        finally:
+            _bootstrap_traverser = None
+
     def __sorting_cid(self):
         self._cid_sorter = {}
         for go_r, v_prop in enumerate(self.variant_proportions_reps):
@@ -872,8 +1063,7 @@ class Traversome(object):
         """
         # filter 1
         if filter_by_graph:
-            for go_record, record in enumerate(graph_alignment.raw_records):
-                this_path = self.graph.get_standardized_path(record.path)
+            for go_record, this_path in enumerate(self.__iter_standardized_record_paths(graph_alignment)):
                 if len(this_path) == 0:
                     logger.warning(f"Record {go_record} is empty")
                     continue
@@ -883,13 +1073,13 @@ class Traversome(object):
                 else:
                     self.read_paths[this_path].append(go_record)
         else:
-            for go_record, record in enumerate(graph_alignment.raw_records):
-                this_path = self.graph.get_standardized_path(record.path)
+            for go_record, this_path in enumerate(self.__iter_standardized_record_paths(graph_alignment)):
                 if this_path not in self.read_paths:
                     self.read_paths[this_path] = []
                 self.read_paths[this_path].append(go_record)
         # filter 2
         if min_alignment_counts > 1:
+            path_dict = self.graph.get_path_dictionary()
             # 2023-12-28 use longer read paths to support shorter ones
             # draft filtering
             shallow_candidates = {}
@@ -913,7 +1103,7 @@ class Traversome(object):
                     longer_path_len = len(longer_path)
                     if longer_path_len > r_size:
                         for go_s in range(longer_path_len - r_size + 1):
-                            sub_path = self.graph.get_standardized_path(longer_path[go_s: go_s + r_size])
+                            sub_path = path_dict.get_standardized_path(longer_path[go_s: go_s + r_size])
                             if sub_path in shallow_candidates:
                                 shallow_candidates[sub_path] += 1
                                 if shallow_candidates[sub_path] >= min_alignment_counts:
@@ -965,6 +1155,21 @@ class Traversome(object):
         self.max_alignment_length = align_len_at_path_sorted[-1]
         self.max_read_path_size = self.get_max_read_path_size(self.read_paths)
 
+    def __iter_standardized_record_paths(self, graph_alignment):
+        """
+        yield the standardized path of each alignment record, standardizing each unique path only once
+        """
+        path_dict = self.graph.get_path_dictionary()
+        if isinstance(graph_alignment.raw_records, GAFRecordColumns):
+            # paths were already interned during parsing
+            std_paths = [path_dict.get_standardized_path(raw_path) if raw_path else ()
+                         for raw_path in graph_alignment.raw_records.paths]
+            for raw_path_id in graph_alignment.raw_records.path_id:
+                yield std_paths[raw_path_id]
+        else:
+            for record in graph_alignment.raw_records:
+                yield path_dict.get_standardized_path(record.path) if record.path else ()
+
     def get_max_read_path_size(self, paths):
         assert bool(self.read_paths), "empty read paths!"
         return max([len(rp) for rp in paths])
@@ -1207,6 +1412,41 @@ class Traversome(object):
     def get_variant_sub_paths(self, variant_path):
         return self.subpath_generator.gen_subpaths(variant_path)
 
+    @staticmethod
+    def get_sub_path_profile_fingerprint(sub_path_counter, variant_size):
+        """
+        stable 128-bit fingerprint of the sub-path multiset of a variant together with its size
+        :param sub_path_counter: dict(sub_path->sub_path_counts)
+        :param variant_size: int
+        :return: bytes of length 16
+        """
+        hash_obj = blake2b(repr(variant_size).encode(), digest_size=16)
+        for sub_path, sub_count in sorted(sub_path_counter.items()):
+            hash_obj.update(repr((sub_path, sub_count)).encode())
+        return hash_obj.digest()
+
+    def group_unidentifiable_variant(self, check_iso_id):
+        """
+        assign a variant to the first variant with the identical sub-path profile and size, or to itself,
+        recorded in self.be_unidentifiable_to.
+        Variants should be grouped in the increasing order of their ids, which can be done online as they arrive.
+        :param check_iso_id: variant id
+        :return: id of the representative variant
+        """
+        check_counter = self.variant_subpath_counters[self.variant_paths[check_iso_id]]
+        check_size = self.variant_sizes[check_iso_id]
+        fingerprint = self.get_sub_path_profile_fingerprint(check_counter, check_size)
+        same_print_reprs = self.__profile_fingerprint_to_reprs.setdefault(fingerprint, [])
+        for represent_iso_id in same_print_reprs:
+            # exact comparison guards against fingerprint collisions
+            if check_counter == self.variant_subpath_counters[self.variant_paths[represent_iso_id]] and \
+                    check_size == self.variant_sizes[represent_iso_id]:
+                self.be_unidentifiable_to[check_iso_id] = represent_iso_id
+                return represent_iso_id
+        same_print_reprs.append(check_iso_id)
+        self.be_unidentifiable_to[check_iso_id] = check_iso_id
+        return check_iso_id
+
     def gen_all_informative_sub_paths(self):
         """
         generate all sub paths and their occurrences for each candidate variant
@@ -1223,16 +1463,9 @@ class Traversome(object):
         # NOTE unidentifiable senario is not common for fine dataset with clear abundant variants
         # so we do not include it into the bootstrap
         self.be_unidentifiable_to = OrderedDict()
-        for represent_iso_id in range(self.num_put_variants):
-            for check_iso_id in range(represent_iso_id, self.num_put_variants):
-                # every id will be checked only once, either unidentifiable to a previous id or represent itself
-                if check_iso_id not in self.be_unidentifiable_to:
-                    if check_iso_id == represent_iso_id:  # represent itself
-                        self.be_unidentifiable_to[check_iso_id] = check_iso_id
-                    elif self.variant_subpath_counters[self.variant_paths[check_iso_id]] == \
-                            self.variant_subpath_counters[self.variant_paths[represent_iso_id]] and \
-                            self.variant_sizes[check_iso_id] == self.variant_sizes[represent_iso_id]:
-                        self.be_unidentifiable_to[check_iso_id] = represent_iso_id
+        self.__profile_fingerprint_to_reprs = {}
+        for check_iso_id in range(self.num_put_variants):
+            self.group_unidentifiable_variant(check_iso_id)
         # logger.info(str(self.be_unidentifiable_to))
         self.repr_to_merged_variants = \
             OrderedDict([(rps_id, []) for rps_id in sorted(set(self.be_unidentifiable_to.values()))])
@@ -1244,6 +1477,8 @@ class Traversome(object):
 
         # transform self.variant_subpath_counters to self.all_sub_paths
         self.all_sub_paths = OrderedDict()
+        self._start_point_params = None
+        self._start_point_param_rows = {}
         for go_variant, variant_path in enumerate(self.variant_paths):
             sub_paths_group = self.variant_subpath_counters[variant_path]
             for this_sub_path, this_sub_count in sub_paths_group.items():
@@ -1303,6 +1538,22 @@ class Traversome(object):
         return sbp_to_sbp_id
 
     def generate_multinomial_bin_stats(self, all_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted, quiet=True):
+        """
+        :return: the list of Bins objects, see self.generate_multinomial_bin_arrays
+        """
+        return self.generate_multinomial_bin_arrays(
+            all_sub_paths=all_sub_paths,
+            rec_id_sorted_by_len=rec_id_sorted_by_len,
+            align_len_at_path_sorted=align_len_at_path_sorted,
+            quiet=quiet).to_bins_list()
+
+    def generate_multinomial_bin_arrays(
+            self, all_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted, quiet=True):
+        """
+        Split the alignment lengths into bins by a sweep line over the length ranges of sub-paths,
+        and collect the sub-paths observed in each bin together with their statistics.
+        :return: BinArrays object
+        """
         if quiet:
             logger.trace("Generating multinomial bin statistics ..")
         else:
@@ -1313,111 +1564,98 @@ class Traversome(object):
                 align_len_at_path_sorted=align_len_at_path_sorted,
                 min_alignment_length=align_len_at_path_sorted[0],
                 max_alignment_length=align_len_at_path_sorted[-1])
-        ranges = self._identify_bins(all_sub_paths=all_sub_paths, align_len_at_path_sorted=align_len_at_path_sorted)
-        bins_list = []
+        range_mins, range_maxs = \
+            self._identify_bins(all_sub_paths=all_sub_paths, align_len_at_path_sorted=align_len_at_path_sorted)
         max_id = len(align_len_at_path_sorted) - 1
-        # logger.debug(f"align_len_at_path_sorted: {align_len_at_path_sorted}")
-        # logger.debug(f"align_len_id_lookup_table: {align_len_id_lookup_table}")
-        for min_len, max_len in ranges:
-            left_id, right_id = self._get_id_range_in_increasing_lengths(
-                min_len=min_len,
-                max_len=max_len,
-                align_len_id_lookup_table=align_len_id_lookup_table,
-                max_id=max_id)
-            #
-            # if min_len == 32636 and max_len == 32673:
-            #     print("check id range ===== ")
-            #     print(left_id, right_id)
-            #     print(align_len_at_path_sorted[left_id], align_len_at_path_sorted[right_id])
-
-            if left_id > right_id:
-                # no read found within this scope: shouldn't happen because self._identify_bins has already handled this
+        left_ids = np.searchsorted(align_len_id_lookup_table, range_mins, side="left")
+        right_ids = np.minimum(np.searchsorted(align_len_id_lookup_table, range_maxs, side="right") - 1, max_id)
+        valid = left_ids <= right_ids
+        if not valid.all():
+            # no read found within this scope: shouldn't happen because self._identify_bins has already handled this
+            for min_len, max_len in zip(range_mins[~valid].tolist(), range_maxs[~valid].tolist()):
                 logger.warning(f"Remove range {min_len} {max_len}")
-            else:
-                # TODO: min_len and max_len seems to be of no use and can be deleted after debugging
-                bins_list.append(Bins(min_len=min_len, max_len=max_len, min_id=left_id, max_id=right_id))
+            range_mins, range_maxs = range_mins[valid], range_maxs[valid]
+            left_ids, right_ids = left_ids[valid], right_ids[valid]
+        num_bins = len(range_mins)
         if quiet:
-            logger.trace(f"Total # Multinomial Ranges: {len(bins_list)}")
+            logger.trace(f"Total # Multinomial Ranges: {num_bins}")
         else:
-            logger.info(f"Total # Multinomial Ranges: {len(bins_list)}")
+            logger.info(f"Total # Multinomial Ranges: {num_bins}")
         # index len id to read_path
-        r_id_to_sp = {}
-        for this_sub_path, this_sub_path_info in list(all_sub_paths.items()):
+        sub_path_list = list(all_sub_paths)
+        r_id_to_sp_id = {}
+        for go_sp, this_sub_path_info in enumerate(all_sub_paths.values()):
             for r_id in this_sub_path_info.mapped_records:
-                r_id_to_sp[r_id] = this_sub_path
+                r_id_to_sp_id[r_id] = go_sp
         if quiet:
-            logger.trace(f"from id_{min(r_id_to_sp)} to id_{max(r_id_to_sp)}: {len(r_id_to_sp)} records")
+            logger.trace(f"from id_{min(r_id_to_sp_id)} to id_{max(r_id_to_sp_id)}: {len(r_id_to_sp_id)} records")
         else:
-            logger.debug(f"from id_{min(r_id_to_sp)} to id_{max(r_id_to_sp)}: {len(r_id_to_sp)} records")
-        # each rp_bins contain read_path & alignment information to be modeled as multinomial distribution
-        count_rp_bins = 0
-        for bins in bins_list:
-            rp_bins = {}
-            # logger.debug(f"from id_{bins.min_id} to id_{bins.max_id}")
-            for sort_l_id in range(bins.min_id, bins.max_id + 1):
-                r_id = rec_id_sorted_by_len[sort_l_id]
-                if r_id in r_id_to_sp:
-                    this_sub_path = r_id_to_sp[r_id]
-                    rp_bins.setdefault(this_sub_path, BinInfo()).num_matched += 1
-            # logger.debug(f"num_matched: {[bininfo.num_matched for bininfo in rp_bins.values()]}")
-            for this_sub_path, bininfo in rp_bins.items():
-                bininfo.from_variants = self.all_sub_paths[this_sub_path].from_variants
-                bininfo.num_possible_X = self.get_averaged_possible_alignment_start_points(
-                    align_len_at_path_sorted=align_len_at_path_sorted,
-                    min_id=bins.min_id,
-                    max_id=bins.max_id,
-                    this_sub_path=this_sub_path)
-                count_rp_bins += 1
-            bins.rp_bins = list(rp_bins.values())  # no sorting should be fine
-
-            # for go_rp, rp in enumerate(tests):
-            #     if rp in rp_bins:
-            #         print(go_rp,
-            #               rp_bins[rp].num_matched,
-            #               rp_bins[rp].num_possible_X,
-            #               rp_bins[rp].from_variants)
-
+            logger.debug(f"from id_{min(r_id_to_sp_id)} to id_{max(r_id_to_sp_id)}: {len(r_id_to_sp_id)} records")
+        # sub-path id of each sorted alignment length, -1 if the record is not in all_sub_paths
+        sp_id_sorted_by_len = np.array([r_id_to_sp_id.get(r_id, -1) for r_id in rec_id_sorted_by_len], dtype=np.int64)
+        # the bins are disjoint ranges of alignment ids, assign each alignment to its bin
+        bin_id_sorted_by_len = np.searchsorted(left_ids, np.arange(max_id + 1), side="right") - 1
+        in_bin = (bin_id_sorted_by_len >= 0) & (sp_id_sorted_by_len >= 0)
+        in_bin[in_bin] &= np.arange(max_id + 1)[in_bin] <= right_ids[bin_id_sorted_by_len[in_bin]]
+        # each (bin, sub-path) component is to be modeled in a multinomial distribution, sorted by bin then sub-path
+        num_sp = max(len(sub_path_list), 1)
+        component_keys, num_matched = np.unique(
+            bin_id_sorted_by_len[in_bin] * num_sp + sp_id_sorted_by_len[in_bin], return_counts=True)
+        component_bins = component_keys // num_sp
+        sp_ids = component_keys % num_sp
+        bin_ptr = np.searchsorted(component_bins, np.arange(num_bins + 1), side="left")
+        # closed-form start points of all components at once
+        align_len_cumsum = np.zeros(len(align_len_id_lookup_table) + 1, dtype=np.int64)
+        np.cumsum(align_len_id_lookup_table, out=align_len_cumsum[1:])
+        num_possible_X = self._get_averaged_start_points_array(
+            align_len_sorted=align_len_id_lookup_table,
+            align_len_cumsum=align_len_cumsum,
+            min_id=left_ids[component_bins],
+            max_id=right_ids[component_bins],
+            sp_params=self._get_start_point_params(sub_path_list)[sp_ids])
         if quiet:
-            logger.trace(f"Total # Bins: {count_rp_bins}")
+            logger.trace(f"Total # Bins: {len(sp_ids)}")
         else:
-            logger.info(f"Total # Bins: {count_rp_bins}")
-        return bins_list
+            logger.info(f"Total # Bins: {len(sp_ids)}")
+        return BinArrays(
+            min_lens=range_mins,
+            max_lens=range_maxs,
+            min_ids=left_ids,
+            max_ids=right_ids,
+            bin_ptr=bin_ptr,
+            sp_ids=sp_ids,
+            num_matched=num_matched,
+            num_possible_X=num_possible_X,
+            sp_from_variants=[self.all_sub_paths[this_sub_path].from_variants for this_sub_path in sub_path_list])
 
     @staticmethod
     def _identify_bins(all_sub_paths, align_len_at_path_sorted):
-        # 1. identify the points and point types (0: min&max, 1:min, 2:max)
-        points_to_sb = {}
+        """
+        :return: arrays of the min and max alignment lengths of the bins with observations
+        """
+        # 1. identify the points and point types (min and/or max of the length range of any sub-path)
+        min_lens = []
+        max_lens = []
         for this_sub_path, this_sub_path_info in list(all_sub_paths.items()):
             min_len = this_sub_path_info.inner_len + 2 if len(this_sub_path) > 1 else 1
             max_len = this_sub_path_info.full_len
-
-            # count_print += 1
-            # if this_sub_path in tests:
-            #     print(tests.index(this_sub_path), min_len, max_len,
-            #           [self.align_len_at_path_map[_id] for _id in this_sub_path_info.mapped_records])
-            # else:
-            #     if count_print < 30:
-            #         print("-", min_len, max_len,
-            #               [self.align_len_at_path_map[_id] for _id in this_sub_path_info.mapped_records])
-
             if min_len > max_len:
                 del all_sub_paths[this_sub_path]  # will be weird
                 logger.warning(f"deleting illegal path: {path_to_gaf_str(this_sub_path)}")
-            elif min_len == max_len:
-                points_to_sb.setdefault(min_len, {})[this_sub_path] = 1  # 1 means both min and max
             else:
-                points_to_sb.setdefault(min_len, {})[this_sub_path] = 0  # 0 means min
-                points_to_sb.setdefault(max_len, {})[this_sub_path] = 2  # 2 means max
+                min_lens.append(min_len)
+                max_lens.append(max_len)
+        sorted_points = np.unique(np.array(min_lens + max_lens, dtype=np.int64))
+        start_flags = np.isin(sorted_points, min_lens)
+        end_flags = np.isin(sorted_points, max_lens)
 
-        # 2. identify the ranges split by overlaps among read path length ranges,
+        # 2. sweep the sorted points to identify the ranges split by overlaps among read path length ranges,
         #    each range has the potential to be modeled as multinomial distribution
         ranges = []
         last_type = False  # indicating the last action was a start (True) or end (False) of a range
-        sorted_points = sorted(points_to_sb)
-        for go_p, point in enumerate(sorted_points):
-            margin_info = points_to_sb[point]
-            is_start_point = any(point_type < 2 for point_type in margin_info.values())
-            is_end_point = any(point_type > 0 for point_type in margin_info.values())
+        sorted_points = sorted_points.tolist()
+        for go_p, (point, is_start_point, is_end_point) in \
+                enumerate(zip(sorted_points, start_flags.tolist(), end_flags.tolist())):
             if is_start_point:
                 if ranges and last_type:
                     ranges[-1][1] = point - 1
@@ -1436,30 +1674,12 @@ class Traversome(object):
                         ranges.append([point + 1, None])
                         last_type = True
 
-        # print(f"len ranges= {len(ranges)}")
-        # with open(os.path.join(self.outdir, "old.ranges.txt"), "w") as output_h:
-        #     for from_p, to_p in ranges:
-        #         output_h.write(f"{from_p}\t{to_p}\n")
-
         # 3. filter ranges to only keep those with observations
-        new_ranges = []
-        i, j = 0, 0
-        while i < len(ranges) and j < len(align_len_at_path_sorted):
-            # Check if the current range in ranges and the current len in align_len_at_path_sorted overlap
-            if ranges[i][1] >= align_len_at_path_sorted[j] >= ranges[i][0]:
-                new_ranges.append(ranges[i])
-                i += 1  # Move to the next range since ranges is gapless
-            elif align_len_at_path_sorted[j] > ranges[i][1]:
-                i += 1  # Current len in align_len_at_path_sorted is beyond the current range, move to the next range
-            else:
-                j += 1  # Current len in align_len_at_path_sorted is before the current range, move to the next integer
-
-        # print(f"len new_ranges= {len(new_ranges)}")
-        # with open(os.path.join(self.outdir, "new.ranges.txt"), "w") as output_h:
-        #     for from_p, to_p in new_ranges:
-        #         output_h.write(f"{from_p}\t{to_p}\n")
-
-        return new_ranges
+        ranges = np.array(ranges, dtype=np.int64).reshape(-1, 2)
+        align_lens = np.asarray(align_len_at_path_sorted, dtype=np.int64)
+        with_obs = np.searchsorted(align_lens, ranges[:, 0], side="left") < \
+            np.searchsorted(align_lens, ranges[:, 1], side="right")
+        return ranges[with_obs, 0], ranges[with_obs, 1]
         # bins_list = []
         # active_read_paths = set()
         # last_type = False  # True: start, False: end
@@ -1489,36 +1709,88 @@ class Traversome(object):
         #                     bins_list.append(Bins(min_len=point + 1, rp_bins=list(active_read_paths)))
         #                     last_type = True
 
+    def _get_start_point_params(self, sub_paths):
+        """
+        The number of possible alignment start points of a sub-path is piecewise-linear in the alignment length,
+            see self.get_num_of_possible_alignment_start_points.
+        The parameters of each sub-path in self.all_sub_paths are computed once and memorized in an array,
+            whose size is bounded by the number of sub-paths.
+        :param sub_paths: iterable of sub-paths in self.all_sub_paths
+        :return: int64 array of shape (len(sub_paths), 4), each row being
+            (is_multi_vertex, offset, left_allowance, right_allowance) for sub-paths of size >= 2, and
+            (0, full_len + 1, 0, 0) for sub-paths of size 1
+        """
+        if self._start_point_params is None:
+            params = []
+            for go_sp, (this_sub_path, this_sub_path_info) in enumerate(self.all_sub_paths.items()):
+                self._start_point_param_rows[this_sub_path] = go_sp
+                if len(this_sub_path) > 1:
+                    left_n1, left_e1 = this_sub_path[0]
+                    left_n2, left_e2 = this_sub_path[1]
+                    left_info = self.graph.vertex_info[left_n1]
+                    left_12_overlap = left_info.connections[left_e1][(left_n2, not left_e2)]
+                    right_n1, right_e1 = this_sub_path[-1]
+                    right_n2, right_e2 = this_sub_path[-2]
+                    right_info = self.graph.vertex_info[right_n1]
+                    right_12_overlap = right_info.connections[not right_e1][(right_n2, right_e2)]
+                    params.append((1,
+                                   this_sub_path_info.inner_len + 1,
+                                   left_info.len - left_12_overlap,
+                                   right_info.len - right_12_overlap))
+                else:
+                    params.append((0, this_sub_path_info.full_len + 1, 0, 0))
+            self._start_point_params = np.array(params, dtype=np.int64).reshape(-1, 4)
+        return self._start_point_params[[self._start_point_param_rows[sp_] for sp_ in sub_paths]]
+
+    @staticmethod
+    def _get_averaged_start_points_array(align_len_sorted, align_len_cumsum, min_id, max_id, sp_params):
+        """
+        Closed-form sums of the possible alignment start points over the alignments of ids [min_id, max_id],
+            for all sub-paths at once, using the prefix sums of the sorted alignment lengths.
+        :param align_len_sorted: int64 array of sorted alignment lengths
+        :param align_len_cumsum: prefix sums of align_len_sorted, starting from 0
+        :param min_id: int, or array of the same size as sp_params
+        :param max_id: int, or array of the same size as sp_params
+        :param sp_params: rows from self._get_start_point_params
+        :return: float array of the averaged number of possible start points
+        """
+        lo_id, hi_id = min_id, max_id + 1
+        n_records = hi_id - lo_id
+        sum_lens = align_len_cumsum[hi_id] - align_len_cumsum[lo_id]
+        is_multi, offsets, left_allow, right_allow = sp_params.T
+
+        def sum_of_excess(thresholds):
+            # sum of (length - threshold) over the alignments longer than threshold
+            from_ids = np.clip(np.searchsorted(align_len_sorted, thresholds, side="right"), lo_id, hi_id)
+            return align_len_cumsum[hi_id] - align_len_cumsum[from_ids] - (hi_id - from_ids) * thresholds
+
+        # size>=2: (L - offset) - max(L - offset - left_allow, 0) - max(L - offset - right_allow, 0)
+        multi_sums = sum_lens - n_records * offsets \
+            - sum_of_excess(offsets + left_allow) - sum_of_excess(offsets + right_allow)
+        # size==1: full_len - L + 1
+        single_sums = n_records * offsets - sum_lens
+        # sum_Xs is the numerator for generating the distribution rate,
+        # with the denominator approximating the genome size
+        return np.where(is_multi == 1, multi_sums, single_sums) / np.asarray(n_records, dtype=np.float64)
+
     def get_averaged_possible_alignment_start_points(
             self, align_len_at_path_sorted, min_id, max_id, this_sub_path):
         """
-        Combining start points from multiple alignments
-            by calling self.get_num_of_possible_alignment_start_points
+        Combining start points from multiple alignments,
+            as the closed-form sum of self.get_num_of_possible_alignment_start_points
         """
         n_records = max_id - min_id + 1
         if not n_records:
             return 0
-        # print_it = this_sub_path in tests
-        # if print_it:
-        #     print(tests.index(this_sub_path), "id range", min_id, max_id,
-        #           self.all_sub_paths[this_sub_path].inner_len, self.all_sub_paths[this_sub_path].full_len)
-        num_possible_Xs = {}
-        align_len_id = min_id
-        while align_len_id <= max_id:
-            this_len = align_len_at_path_sorted[align_len_id]
-            this_x = self.get_num_of_possible_alignment_start_points(
-                read_len_aligned=this_len, this_sub_path=this_sub_path)
-            if this_len not in num_possible_Xs:
-                num_possible_Xs[this_len] = 0
-            num_possible_Xs[this_len] += this_x
-            align_len_id += 1
-            # each alignment record will be counted once, if the next align_len_id has the same length
-            while align_len_id <= max_id and align_len_at_path_sorted[align_len_id] == this_len:
-                num_possible_Xs[this_len] += this_x
-                align_len_id += 1
-        # sum_Xs is the numerator for generating the distribution rate,
-        # with the denominator approximating the genome size
-        return sum(num_possible_Xs.values()) / float(n_records)
+        align_len_sorted = np.asarray(align_len_at_path_sorted, dtype=np.int64)
+        align_len_cumsum = np.zeros(len(align_len_sorted) + 1, dtype=np.int64)
+        np.cumsum(align_len_sorted, out=align_len_cumsum[1:])
+        return self._get_averaged_start_points_array(
+            align_len_sorted=align_len_sorted,
+            align_len_cumsum=align_len_cumsum,
+            min_id=min_id,
+            max_id=max_id,
+            sp_params=self._get_start_point_params([this_sub_path])).item()
 
     def get_num_of_possible_alignment_start_points(self, read_len_aligned, this_sub_path):
         r"""
@@ -1546,37 +1818,20 @@ class Traversome(object):
         :param this_sub_path:
         :return:
         """
-        input_tuple = (read_len_aligned, this_sub_path)
-        if input_tuple in self._cache_num_ali_starts:
-            return self._cache_num_ali_starts[input_tuple]
-        #
-        if len(this_sub_path) > 1:
-            # TODO cache two ends to speed up calculation
-            # prepare the end stats for the path
-            left_n1, left_e1 = this_sub_path[0]
-            left_n2, left_e2 = this_sub_path[1]
-            left_info = self.graph.vertex_info[left_n1]
-            left_1_len = left_info.len
-            left_12_overlap = left_info.connections[left_e1][(left_n2, not left_e2)]
-            right_n1, right_e1 = this_sub_path[-1]
-            right_n2, right_e2 = this_sub_path[-2]
-            right_info = self.graph.vertex_info[right_n1]
-            right_1_len = right_info.len
-            right_12_overlap = right_info.connections[not right_e1][(right_n2, right_e2)]
+        is_multi, offset, left_allow, right_allow = self._get_start_point_params([this_sub_path])[0].tolist()
+        if is_multi:
             # when a, b, c, d is longer than the read_len_aligned,
             # the result is the maximum_num_cat without trimming
-            maximum_num_cat = read_len_aligned - (self.all_sub_paths[this_sub_path].inner_len + 2) + 1
+            maximum_num_cat = read_len_aligned - offset
             # the number of starts cannot be longer than either end
             # trim left
-            left_trim = max(maximum_num_cat - (left_1_len - left_12_overlap), 0)
+            left_trim = max(maximum_num_cat - left_allow, 0)
             # trim right
-            right_trim = max(maximum_num_cat - (right_1_len - right_12_overlap), 0)
+            right_trim = max(maximum_num_cat - right_allow, 0)
             # result
-            self._cache_num_ali_starts[input_tuple] = maximum_num_cat - left_trim - right_trim
-            return self._cache_num_ali_starts[input_tuple]
+            return maximum_num_cat - left_trim - right_trim
         else:
-            self._cache_num_ali_starts[input_tuple] = self.all_sub_paths[this_sub_path].full_len - read_len_aligned + 1
-            return self._cache_num_ali_starts[input_tuple]
+            return offset - read_len_aligned
 
     def generate_sub_path_stats(self, all_sub_paths, align_len_at_path_sorted):
         """
@@ -1632,27 +1887,38 @@ class Traversome(object):
                 else:
                     raise ValueError(f"{record_id} in self.records_pool_to_sbp_ids!")
         self.records_pool_sorted = sorted(self.records_pool_to_sbp_ids)
+        self.records_pool_array = np.array(self.records_pool_sorted, dtype=np.int64)
+        self.records_pool_sbp_array = np.array(
+            [self.records_pool_to_sbp_ids[rec_id] for rec_id in self.records_pool_sorted], dtype=np.int64)
+        records_pool_lens = \
+            np.array([self.align_len_at_path_map[rec_id] for rec_id in self.records_pool_sorted], dtype=np.int64)
+        # the pool is sorted by record id, so that a stable sort by length gives the order of (length, record id)
+        self.records_pool_len_order = np.argsort(records_pool_lens, kind="stable")
+        self.records_pool_len_sorted = records_pool_lens[self.records_pool_len_order]
 
     def sample_sub_paths(
             self,
             bootstrap_size=None,
             jackknife_size=None,
-            masking=None):
+            masking=None,
+            random_obj=None):
         """
         According to sampling strategies and masking set, sample aligned records to generate
         1) a new set of sub_paths;
         2) sorted alignment length distribution
+        :param random_obj: random.Random object of the replicate, self.random by default
         """
         masking = set() if masking is None else masking
+        random_obj = self.random if random_obj is None else random_obj
         if not self.records_pool_to_sbp_ids:
             self._prepare_for_sampling()
         if bootstrap_size:
             # TODO move the info to the run() function
             logger.debug("Using bootstrap.")
-            new_records_pool = self.random.choices(self.records_pool_sorted, k=bootstrap_size)
+            new_records_pool = random_obj.choices(self.records_pool_sorted, k=bootstrap_size)
         elif jackknife_size:
             logger.debug(f"Using Jackknife: leave-{jackknife_size}-out.")
-            keep_ids = self.random.sample(range(self.num_valid_records), k=self.num_valid_records - jackknife_size)
+            keep_ids = random_obj.sample(range(self.num_valid_records), k=self.num_valid_records - jackknife_size)
             new_records_pool = [self.records_pool_sorted[s_id_] for s_id_ in keep_ids]
         else:
             # only do filtering using self.read_paths_masked
@@ -1698,6 +1964,47 @@ class Traversome(object):
                         key=lambda x: (x[1], x[0])))  # sort by length then by rec id
         return new_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted
 
+    def sample_sub_path_counts(self, bootstrap_size, masking=None, np_random=None):
+        """
+        Bootstrap by drawing the number of times that each record is resampled as one multinomial count vector,
+        which is equivalent to self.sample_sub_paths(bootstrap_size=bootstrap_size, ...) but avoids building,
+        regrouping and sorting a list of resampled records.
+        :param np_random: numpy.random.Generator object of the replicate
+        :return: same as self.sample_sub_paths
+        """
+        masking = set() if masking is None else masking
+        np_random = np.random.default_rng() if np_random is None else np_random
+        if self.records_pool_array is None:
+            self._prepare_for_sampling()
+        n_pool = len(self.records_pool_array)
+        rec_counts = np_random.multinomial(bootstrap_size, np.full(n_pool, 1. / n_pool))
+        sbp_counts = np.bincount(self.records_pool_sbp_array, weights=rec_counts, minlength=len(self.all_sub_paths))
+        # create new all_sub_paths
+        new_sub_paths = OrderedDict()
+        keep_sbp = np.zeros(len(self.all_sub_paths), dtype=bool)
+        for go_sbp, (read_path, sbp_info) in enumerate(self.all_sub_paths.items()):
+            if sbp_counts[go_sbp] and read_path not in masking:
+                keep_sbp[go_sbp] = True
+                new_sbp_info = SubPathInfo()
+                new_sbp_info.from_variants = sbp_info.from_variants
+                new_sbp_info.inner_len = sbp_info.inner_len
+                new_sbp_info.full_len = sbp_info.full_len
+                new_sub_paths[read_path] = new_sbp_info
+        # resampled records of the kept sub-paths, repeated by their counts
+        rec_counts[~keep_sbp[self.records_pool_sbp_array]] = 0
+        sampled = rec_counts > 0
+        read_paths = list(self.all_sub_paths)
+        for go_sbp, rec_id, rec_count in zip(self.records_pool_sbp_array[sampled].tolist(),
+                                             self.records_pool_array[sampled].tolist(),
+                                             rec_counts[sampled].tolist()):
+            new_sub_paths[read_paths[go_sbp]].mapped_records.extend([rec_id] * rec_count)
+        # generate new align_len_at_path_sorted
+        counts_by_len = rec_counts[self.records_pool_len_order]
+        rec_id_sorted_by_len = \
+            np.repeat(self.records_pool_array[self.records_pool_len_order], counts_by_len).tolist()
+        align_len_at_path_sorted = np.repeat(self.records_pool_len_sorted, counts_by_len).tolist()
+        return new_sub_paths, rec_id_sorted_by_len, align_len_at_path_sorted
+
     def __subpath_info_filler(
             self, this_sub_path, align_len_at_path_sorted, align_len_id_lookup_table, all_sub_paths):
         # internal_len = self.graph.get_path_internal_length(this_sub_path)
@@ -1797,32 +2104,14 @@ class Traversome(object):
     @staticmethod
     def _generate_align_len_id_lookup_table(
             align_len_at_path_sorted,
-            min_alignment_length,
-            max_alignment_length):
+            min_alignment_length=None,
+            max_alignment_length=None):
         """
         called by generate_sub_path_stats
         to speed up self.__get_id_range_in_increasing_lengths
+        :return: int64 array of the sorted alignment lengths, to be searched by np.searchsorted
         """
-        its_left_id = 0
-        its_right_id = 0
-        max_id = len(align_len_at_path_sorted) - 1
-        align_len_id_lookup_table = \
-            {potential_len: {"as_left_lim_id": None, "as_right_lim_id": None}
-             for potential_len in range(min_alignment_length, max_alignment_length + 1)}
-        for potential_len in range(min_alignment_length, max_alignment_length + 1):
-            if potential_len == align_len_at_path_sorted[its_right_id]:
-                align_len_id_lookup_table[potential_len]["as_left_lim_id"] = its_left_id = its_right_id
-                while potential_len == align_len_at_path_sorted[its_right_id]:
-                    align_len_id_lookup_table[potential_len]["as_right_lim_id"] = its_right_id
-                    if its_right_id == max_id:
-                        break
-                    else:
-                        its_left_id = its_right_id
-                        its_right_id += 1
-            else:
-                align_len_id_lookup_table[potential_len]["as_left_lim_id"] = its_right_id
-                align_len_id_lookup_table[potential_len]["as_right_lim_id"] = its_left_id
-        return align_len_id_lookup_table
+        return np.asarray(align_len_at_path_sorted, dtype=np.int64)
 
     @staticmethod
     def _get_id_range_in_increasing_lengths(min_len, max_len, align_len_id_lookup_table, max_id):
@@ -1832,10 +2121,8 @@ class Traversome(object):
         called by self.__subpath_info_filler.
         replace get_id_range_in_increasing_values func in utils.py
         """
-        left_id = align_len_id_lookup_table.get(min_len, {}).\
-            get("as_left_lim_id", 0)
-        right_id = align_len_id_lookup_table.get(max_len, {}).\
-            get("as_right_lim_id", max_id)
+        left_id = int(np.searchsorted(align_len_id_lookup_table, min_len, side="left"))
+        right_id = min(int(np.searchsorted(align_len_id_lookup_table, max_len, side="right")) - 1, max_id)
         return left_id, right_id
 
     def get_multinomial_like_formula(self, variant_percents, log_func, within_variant_ids: Set = None):
@@ -1854,7 +2141,10 @@ class Traversome(object):
             sbp_to_sbp_id=sbp_to_sbp_id,
             repr_to_merged_variants=self.repr_to_merged_variants,
             be_unidentifiable_to=self.be_unidentifiable_to,
-            loglevel=self.loglevel)
+            loglevel=self.loglevel,
+            solver=self.kwargs.get("ml_solver", "slsqp"),
+            min_success_runs=self.kwargs.get("ml_runs", 6),
+            warm_start=self.kwargs.get("ml_warm_start", False))
         if init_self_max_like:
             self.max_like_fit = max_like_fit
         use_prop, this_like, this_criterion =\
@@ -1867,10 +2157,14 @@ class Traversome(object):
                                                 criterion=Criterion.BIC,
                                                 chosen_ids: Union[typingODict[int, bool], Set] = None,
                                                 init_self_max_like: bool = True,
-                                                bootstrap_str: str = ""):
+                                                bootstrap_str: str = "",
+                                                n_proc: int = None,
+                                                np_random=None):
         """
         :param sbp_to_sbp_id: used to access all read paths are covered
         :param bootstrap_str: turn on to only print simple information and mark the bootstrap id
+        :param n_proc: num of processes for the drop-one tests, self.num_processes by default
+        :param np_random: numpy.random.RandomState object of the fitting, the global numpy one by default
         """
         # intermediate level of RES is not working properly in different environments
         # if bootstrap_str and logger.level(self.loglevel).no >= 20:  # not in {"TRACE", "DEBUG"}:
@@ -1887,12 +2181,16 @@ class Traversome(object):
             repr_to_merged_variants=self.repr_to_merged_variants,
             be_unidentifiable_to=self.be_unidentifiable_to,
             loglevel=self.loglevel,
-            bootstrap_mode=bootstrap_str)
+            bootstrap_mode=bootstrap_str,
+            solver=self.kwargs.get("ml_solver", "slsqp"),
+            min_success_runs=self.kwargs.get("ml_runs", 6),
+            warm_start=self.kwargs.get("ml_warm_start", False),
+            np_random=np_random)
         if init_self_max_like:
             self.max_like_fit = max_like_fit
         # TODO n_proc > 1 will cause a freeze at some clusters, something wrong with python multiprocessing
         return max_like_fit.reverse_model_selection(
-            n_proc=self.num_processes, criterion=criterion, chosen_ids=chosen_ids,
+            n_proc=self.num_processes if n_proc is None else n_proc, criterion=criterion, chosen_ids=chosen_ids,
             user_fixed_ids=self.user_variant_fixed_ids)
 
     # def update_candidate_info(self, ext_component_proportions: typingODict[int, float] = None):
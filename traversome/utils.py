@@ -226,6 +226,63 @@ class BinInfo(object):
         self.num_matched = 0  # The x in multinomial: observed num of matched reads
 
 
+class BinArrays(object):
+    """
+    CSR-style array form of the multinomial bins, see Traversome.generate_multinomial_bin_arrays.
+    Each alignment length range (bin) b is a multinomial distribution,
+        whose sub-path components are sp_ids[bin_ptr[b]: bin_ptr[b + 1]].
+    """
+    def __init__(self,
+                 min_lens,
+                 max_lens,
+                 min_ids,
+                 max_ids,
+                 bin_ptr,
+                 sp_ids,
+                 num_matched,
+                 num_possible_X,
+                 sp_from_variants):
+        """
+        :param min_lens, max_lens, min_ids, max_ids: arrays of the alignment length and alignment id range of each bin
+        :param bin_ptr: array of size num_bins + 1
+        :param sp_ids: sub-path id of each component
+        :param num_matched: the x in multinomial of each component
+        :param num_possible_X: the X in multinomial of each component
+        :param sp_from_variants: from_variants dict of each sub-path id
+        """
+        self.min_lens = min_lens
+        self.max_lens = max_lens
+        self.min_ids = min_ids
+        self.max_ids = max_ids
+        self.bin_ptr = bin_ptr
+        self.sp_ids = sp_ids
+        self.num_matched = num_matched
+        self.num_possible_X = num_possible_X
+        self.sp_from_variants = sp_from_variants
+
+    def __len__(self):
+        return len(self.min_lens)
+
+    def to_bins_list(self):
+        """
+        :return: the list of Bins objects, as used by the symbolic likelihood formula
+        """
+        bins_list = []
+        for go_b, (min_len, max_len, min_id, max_id) in enumerate(zip(
+                self.min_lens.tolist(), self.max_lens.tolist(), self.min_ids.tolist(), self.max_ids.tolist())):
+            bins = Bins(min_len=min_len, max_len=max_len, min_id=min_id, max_id=max_id)
+            from_c, to_c = self.bin_ptr[go_b], self.bin_ptr[go_b + 1]
+            for go_sp, num_matched, num_possible_X in zip(self.sp_ids[from_c: to_c].tolist(),
+                                                          self.num_matched[from_c: to_c].tolist(),
+                                                          self.num_possible_X[from_c: to_c].tolist()):
+                bins.rp_bins.append(BinInfo())
+                bins.rp_bins[-1].from_variants = self.sp_from_variants[go_sp]
+                bins.rp_bins[-1].num_matched = num_matched
+                bins.rp_bins[-1].num_possible_X = num_possible_X
+            bins_list.append(bins)
+        return bins_list
+
+
 class LogLikeFormulaInfo(object):
     def __init__(self, loglike_expression=0, variable_size=0, sample_size=0):
         self.loglike_expression = loglike_expression
@@ -414,6 +471,17 @@ class GaussianMixtureModel:
 
 
 class VariantSubPathsGenerator:
+    """
+    Enumerate the sub-paths of each variant path that could be covered by an alignment and were observed in the data.
+
+    Windows are enumerated with two pointers over the prefix sums of vertex length increments,
+    and each window is fingerprinted with a rolling strand-canonical hash,
+    so that only windows whose hash matches an observed read path are materialized and standardized.
+    """
+    # odd base of the polynomial hash, which is invertible modulo 2^64
+    HASH_BASE = 0x9E3779B97F4A7C15
+    HASH_BASE_INV = pow(HASH_BASE, -1, 1 << 64)
+
     def __init__(
             self,
             graph,
@@ -427,6 +495,66 @@ class VariantSubPathsGenerator:
         self.max_alignment_len = max_alignment_len
         self.read_paths_hashed = read_paths_hashed
         self.variant_subpath_counters = {}
+        # canonical hashes of read_paths_hashed and the connected vertex pairs, both built on the first call
+        self.__read_path_fingerprints = None
+        self.__linked_vertex_pairs = None
+        self.__palindromic_repeats = set()
+
+    def __vertex_hash_code(self, v_name, v_end, path_dict):
+        """
+        hash code of an oriented vertex, strand-independent for palindromic repeats as in reverse_path
+        """
+        v_id = abs(path_dict.encode_vertex(v_name, True)) - 1
+        return 2 * v_id + 1 + int(not v_end and v_name not in self.__palindromic_repeats)
+
+    def __hash_path_canonical(self, input_path, path_dict):
+        """
+        canonical hash of a path in pure python, matching the window hashes from __get_window_hashes
+        """
+        mask = (1 << 64) - 1
+        forward_h = reverse_h = 0
+        for v_name, v_end in input_path:
+            forward_h = (forward_h * self.HASH_BASE + self.__vertex_hash_code(v_name, v_end, path_dict)) & mask
+        for v_name, v_end in input_path[::-1]:
+            reverse_h = (reverse_h * self.HASH_BASE + self.__vertex_hash_code(v_name, not v_end, path_dict)) & mask
+        return min(forward_h, reverse_h)
+
+    def __prepare_fingerprints(self, path_dict):
+        if self.__read_path_fingerprints is None:
+            # palindromic repeats were detected when the path dictionary was built
+            self.__palindromic_repeats = self.graph.palindromic_repeats or set()
+            self.__read_path_fingerprints = np.unique(np.array(
+                [self.__hash_path_canonical(read_path, path_dict) for read_path in self.read_paths_hashed],
+                dtype=np.uint64))
+            # superset of the (last vertex, first vertex) pairs of circular windows
+            graph_core = self.graph.get_graph_core()
+            core_to_v_id = np.array(
+                [abs(path_dict.encode_vertex(v_name, True)) - 1 for v_name in graph_core.vertex_names], dtype=np.int64)
+            from_codes, to_codes = graph_core.get_edge_codes()
+            self.__linked_vertex_pairs = np.unique((core_to_v_id[from_codes // 2] << 32) | core_to_v_id[to_codes // 2])
+
+    def __get_window_hashes(self, codes, rev_codes, starts, ends):
+        """
+        canonical polynomial hashes of windows codes[starts[i]: ends[i] + 1], using uint64 wrap-around arithmetic
+        :param codes: vertex hash codes of the (extended) path
+        :param rev_codes: vertex hash codes of the (extended) path with strands flipped
+        """
+        num_codes = len(codes)
+        with np.errstate(over="ignore"):
+            base_pows = np.ones(num_codes, dtype=np.uint64)
+            base_pows[1:] = np.uint64(self.HASH_BASE)
+            base_pows = np.cumprod(base_pows, dtype=np.uint64)
+            inv_pows = np.ones(num_codes, dtype=np.uint64)
+            inv_pows[1:] = np.uint64(self.HASH_BASE_INV)
+            inv_pows = np.cumprod(inv_pows, dtype=np.uint64)
+            # forward: sum codes[t] * B^(end - t); reverse: sum rev_codes[t] * B^(t - start)
+            forward_cum = np.zeros(num_codes + 1, dtype=np.uint64)
+            np.cumsum(codes * inv_pows, dtype=np.uint64, out=forward_cum[1:])
+            reverse_cum = np.zeros(num_codes + 1, dtype=np.uint64)
+            np.cumsum(rev_codes * base_pows, dtype=np.uint64, out=reverse_cum[1:])
+            forward_h = (forward_cum[ends + 1] - forward_cum[starts]) * base_pows[ends]
+            reverse_h = (reverse_cum[ends + 1] - reverse_cum[starts]) * inv_pows[starts]
+        return np.minimum(forward_h, reverse_h)
 
     # @cache
     def gen_subpaths(self, variant_path):
@@ -437,70 +565,127 @@ class VariantSubPathsGenerator:
             #     this_overlap = self.graph.uni_overlap()
             these_sub_paths = dict()
             num_seg = len(variant_path)
+            path_dict = self.graph.get_path_dictionary()
+            self.__prepare_fingerprints(path_dict)
             # print("run get")
             # if self.force_circular:
-            if self.graph.is_circular_path(variant_path):
-                for go_start_v, start_segment in enumerate(variant_path):
-                    # find the longest sub_path,
-                    # that begins with start_segment and be in the range of alignment length
-                    this_longest_sub_path = [start_segment]
-                    this_internal_path_len = 0
-                    go_next = (go_start_v + 1) % num_seg
-                    # keep adding vertex until this_internal_path_len is larger than self.max_alignment_len - 2,
-                    # so that the_longest_sub_path can potentially be covered by observed data
-                    while this_internal_path_len <= self.max_alignment_len - 2:
-                        next_n, next_e = variant_path[go_next]
-                        next_v_info = self.graph.vertex_info[next_n]
-                        pre_n, pre_e = this_longest_sub_path[-1]
-                        this_overlap = next_v_info.connections[not next_e][(pre_n, pre_e)]
-                        this_longest_sub_path.append((next_n, next_e))
-                        this_internal_path_len += next_v_info.len - this_overlap
-                        go_next = (go_next + 1) % num_seg
-                    # record shorter sub_paths starting from start_segment
-                    len_this_sub_p = len(this_longest_sub_path)
-                    # for skip_tail in range(len_this_sub_p - 1):
-                    for skip_tail in range(len_this_sub_p):  # 2023-10-18, paths with size of 1 should be included
-                        this_sub_path = \
-                            self.graph.get_standardized_path(this_longest_sub_path[:len_this_sub_p - skip_tail])
-                        # print("checking subpath existence", this_sub_path)
-                        if this_sub_path not in self.read_paths_hashed:
-                            continue
-                        if this_sub_path not in these_sub_paths:
-                            these_sub_paths[this_sub_path] = 0
-                        these_sub_paths[this_sub_path] += 1
+            is_circular = self.graph.is_circular_path(variant_path)
+            # length increment of adding each vertex to its previous one
+            cum_lens, cum_ovls, circular_overlap = self.graph.get_path_lengths().get_prefix_sums(variant_path)
+            increments = np.diff(np.array(cum_lens, dtype=np.int64)) - \
+                np.diff(np.array(cum_ovls, dtype=np.int64), prepend=0)
+            if is_circular:
+                increments[0] -= circular_overlap
+            else:
+                increments[0] = 0
+            if is_circular:
+                # tile the circular path so that every window starting from the first copy is a contiguous slice
+                num_tiles = self.max_alignment_len // max(int(increments.sum()), 1) + 2
+                ext_path = list(variant_path) * num_tiles
+                increments = np.tile(increments, num_tiles)
+                increments[0] = 0
+            else:
+                ext_path = list(variant_path)
+            # keep adding vertex until the internal length is larger than self.max_alignment_len - 2,
+            # so that the longest sub_path can potentially be covered by observed data
+            accumulated = np.cumsum(increments)
+            starts = np.arange(num_seg)
+            if self.max_alignment_len - 2 >= 0:
+                last_ends = np.searchsorted(
+                    accumulated, accumulated[:num_seg] + (self.max_alignment_len - 2), side="right")
+                if not is_circular:
+                    last_ends = np.minimum(last_ends, num_seg - 1)
             else:
-                for go_start_v, start_segment in enumerate(variant_path):
-                    # find the longest sub_path,
-                    # that begins with start_segment and be in the range of alignment length
-                    this_longest_sub_path = [start_segment]
-                    this_internal_path_len = 0
-                    go_next = go_start_v + 1
-                    # keep adding vertex until this_internal_path_len is larger than self.max_alignment_len - 2,
-                    # so that the_longest_sub_path can potentially be covered by observed data
-                    while go_next < num_seg and this_internal_path_len <= self.max_alignment_len - 2:
-                        next_n, next_e = variant_path[go_next]
-                        next_v_info = self.graph.vertex_info[next_n]
-                        pre_n, pre_e = this_longest_sub_path[-1]
-                        this_overlap = next_v_info.connections[not next_e][(pre_n, pre_e)]
-                        this_longest_sub_path.append((next_n, next_e))
-                        this_internal_path_len += next_v_info.len - this_overlap
-                        go_next += 1
-                    # record shorter sub_paths starting from start_segment
-                    len_this_sub_p = len(this_longest_sub_path)
-                    for skip_tail in range(len_this_sub_p):  # 2023-10-18, paths with size of 1 should be included
-                        this_sub_path = \
-                            self.graph.get_standardized_path_circ(this_longest_sub_path[:len_this_sub_p - skip_tail])
-                        if this_sub_path not in self.read_paths_hashed:
-                            continue
-                        # if self.graph.get_path_internal_length(this_sub_path) < self.min_alignment_len:
-                        #     break
-                        if this_sub_path not in these_sub_paths:
-                            these_sub_paths[this_sub_path] = 0
-                        these_sub_paths[this_sub_path] += 1
+                last_ends = starts.copy()
+            # enumerate all windows, each start followed by the longest window first
+            window_lens = last_ends - starts + 1
+            win_starts = np.repeat(starts, window_lens)
+            win_offsets = np.arange(len(win_starts)) - np.repeat(np.cumsum(window_lens) - window_lens, window_lens)
+            win_ends = np.repeat(last_ends, window_lens) - win_offsets
+            # strand-canonical rolling hashes
+            codes = np.array([self.__vertex_hash_code(v_n, v_e, path_dict) for v_n, v_e in ext_path], dtype=np.uint64)
+            rev_codes = np.array(
+                [self.__vertex_hash_code(v_n, not v_e, path_dict) for v_n, v_e in ext_path], dtype=np.uint64)
+            candidates = np.isin(
+                self.__get_window_hashes(codes, rev_codes, win_starts, win_ends), self.__read_path_fingerprints)
+            if not is_circular:
+                # get_standardized_path_circ rotates circular windows, which the hashes do not capture
+                vertex_ids = (codes - np.uint64(1)).astype(np.int64) // 2
+                candidates |= np.isin(
+                    (vertex_ids[win_ends] << 32) | vertex_ids[win_starts], self.__linked_vertex_pairs)
+                get_standardized = path_dict.get_standardized_path_circ
+            else:
+                get_standardized = path_dict.get_standardized_path
+            for go_w in np.flatnonzero(candidates):
+                this_sub_path = get_standardized(ext_path[win_starts[go_w]: win_ends[go_w] + 1])
+                if this_sub_path not in self.read_paths_hashed:
+                    continue
+                if this_sub_path not in these_sub_paths:
+                    these_sub_paths[this_sub_path] = 0
+                these_sub_paths[this_sub_path] += 1
             self.variant_subpath_counters[variant_path] = these_sub_paths
             return these_sub_paths
 
 
+class ReadPathCoverageTracker:
+    """
+    Incrementally track which read paths are covered by the accepted variants.
+
+    Coverage is kept as a boolean array over the read paths, together with running totals,
+    so that each accepted variant only contributes the windows of its own sub-paths,
+    and the coverage and the uncovered weight are available in constant time.
+    """
+    def __init__(self, read_paths, read_paths_counter, subpath_generator):
+        """
+        :param read_paths: list of standardized read paths
+        :param read_paths_counter: dict of read path -> num of alignments, used as weight
+        :param subpath_generator: VariantSubPathsGenerator object
+        """
+        self.subpath_generator = subpath_generator
+        self.read_paths = list(read_paths)
+        self.__read_path_ids = {read_path: go_p for go_p, read_path in enumerate(self.read_paths)}
+        self.weights = np.array([read_paths_counter[read_path] for read_path in self.read_paths], dtype=np.int64)
+        self.covered = np.zeros(len(self.read_paths), dtype=bool)
+        self.total_weight = int(self.weights.sum())
+        self.num_uncovered = len(self.read_paths)
+        self.uncovered_weight = self.total_weight
+        # variants added, recorded by path rather than by count,
+        # because variants loaded from a previous run may be added after those found by the search
+        self.__added_variants = set()
+
+    def add_variant(self, variant_path):
+        """
+        mark the read paths covered by the sub-paths of a newly accepted variant, skipping an added one
+        """
+        if variant_path in self.__added_variants:
+            return
+        self.__added_variants.add(variant_path)
+        if not self.num_uncovered:
+            return
+        for sub_path in self.subpath_generator.gen_subpaths(variant_path):
+            read_path_id = self.__read_path_ids.get(sub_path)
+            if read_path_id is not None and not self.covered[read_path_id]:
+                self.covered[read_path_id] = True
+                self.num_uncovered -= 1
+                self.uncovered_weight -= int(self.weights[read_path_id])
+
+    def add_variants(self, variants):
+        """
+        :param variants: the growing list of variants, of which only those not added yet are processed
+        """
+        for variant_path in variants:
+            self.add_variant(variant_path)
+
+    def get_uncovered_ratio(self):
+        """
+        :return: uncovered read paths weighted by alignment counts
+        """
+        return self.uncovered_weight / self.total_weight if self.total_weight else 0.
+
+    def get_uncovered_read_paths(self):
+        return [self.read_paths[go_p] for go_p in np.flatnonzero(~self.covered)]
+
+
 class ProcessingGraphFailed(Exception):
     def __init__(self, value=""):
         self.value = value
@@ -1062,6 +1247,49 @@ def find_id_using_binary_search(
 # find_id_using_binary_search(s_points=e_points, seek_value=21, ceiling=False, return_gap=True)
 
 
+def find_least_rotation(sequence):
+    """
+    Booth's algorithm to find the start of the lexicographically least rotation of a circular sequence in O(n).
+    Among multiple identical least rotations (periodic sequence), the smallest start is returned.
+
+    :param sequence: list/tuple of mutually comparable elements, e.g. a path [(name1, strand1), (name2, strand2), ..]
+    :return: start index of the least rotation
+    """
+    len_seq = len(sequence)
+    if len_seq < 2:
+        return 0
+    doubled = list(sequence) + list(sequence)
+    failure = [-1] * len(doubled)
+    least_start = 0
+    for go_j in range(1, len(doubled)):
+        s_j = doubled[go_j]
+        go_i = failure[go_j - least_start - 1]
+        while go_i != -1 and s_j != doubled[least_start + go_i + 1]:
+            if s_j < doubled[least_start + go_i + 1]:
+                least_start = go_j - go_i - 1
+            go_i = failure[go_i]
+        if s_j != doubled[least_start + go_i + 1]:  # go_i == -1
+            if s_j < doubled[least_start]:  # least_start + go_i + 1 == least_start
+                least_start = go_j
+            failure[go_j - least_start] = -1
+        else:
+            failure[go_j - least_start] = go_i + 1
+    # identical rotations repeat with the primitive period of the sequence,
+    # which is found by the prefix function (KMP)
+    prefix_lens = [0] * len_seq
+    for go_j in range(1, len_seq):
+        go_k = prefix_lens[go_j - 1]
+        while go_k and sequence[go_j] != sequence[go_k]:
+            go_k = prefix_lens[go_k - 1]
+        if sequence[go_j] == sequence[go_k]:
+            go_k += 1
+        prefix_lens[go_j] = go_k
+    period = len_seq - prefix_lens[-1]
+    if len_seq % period:
+        period = len_seq
+    return least_start % period
+
+
 def gaf_str_to_path(
         path_str: str
     ):